@@ -1,28 +1,450 @@
+import time
+# Referência para medir o tempo até o primeiro quadro (inclui os imports)
+INICIO_PROCESSO = time.perf_counter()
+
+from array import array
+from bisect import bisect_left
 from datetime import datetime
-import json
+from itertools import compress
 import os
-import time
-from collections import defaultdict
-from calendar import month_name
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.label import Label
 from kivy.uix.textinput import TextInput
 from kivy.uix.button import Button
-from kivy.uix.scrollview import ScrollView
-from kivy.uix.popup import Popup
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 from kivy.uix.tabbedpanel import TabbedPanel, TabbedPanelItem
 from kivy.clock import Clock
-from kivy.metrics import dp
+from kivy.uix.widget import Widget
+from kivy.core.text import Label as CoreLabel
+from kivy.metrics import dp, sp
 from kivy.utils import get_color_from_hex
-from kivy.graphics import Color, Rectangle
+from kivy.graphics import (Color, InstructionGroup, Mesh, PopMatrix, PushMatrix, Rectangle,
+                           Translate)
+
+from desempenho import instrumentos
+from livro_caixa import (ImportadorExtrato, LivroCaixa, RelatorioEstatistico, centavos_de_texto,
+                         data_de_extrato, data_de_minutos, descrever_alerta_orcamento,
+                         formatar_centavos, intervalo_do_mes, minutos_de_data,
+                         secoes_estatisticas)
+
+
+class ItemHistorico(RecycleDataViewBehavior, BoxLayout):
+    """Linha reciclável do histórico: os widgets são criados uma vez e reaproveitados"""
+
+    COR_RECEITA = get_color_from_hex('#4CAF50')
+    COR_GASTO = get_color_from_hex('#F44336')
+
+    def __init__(self, **kwargs):
+        super().__init__(orientation='horizontal', spacing=dp(5), **kwargs)
+        self.transacao_id = None
+        self.indice = None
+
+        # Canvas com fundo
+        with self.canvas.before:
+            Color(0.1, 0.1, 0.1, 1)  # Cinza muito escuro
+            self.rect = Rectangle(size=self.size, pos=self.pos)
+        self.bind(pos=self.atualizar_rect, size=self.atualizar_rect)
+
+        # Informações da transação
+        info_layout = BoxLayout(orientation='vertical', size_hint_x=0.7)
+
+        self.label_desc = Label(
+            font_size='14sp',
+            bold=True,
+            text_size=(None, None),
+            halign='left'
+        )
+        info_layout.add_widget(self.label_desc)
+
+        detalhes_layout = BoxLayout(orientation='horizontal')
+
+        self.label_valor = Label(
+            font_size='12sp',
+            bold=True,
+            size_hint_x=0.6
+        )
+        detalhes_layout.add_widget(self.label_valor)
+
+        self.label_data = Label(
+            font_size='10sp',
+            color=get_color_from_hex('#666666'),
+            size_hint_x=0.4
+        )
+        detalhes_layout.add_widget(self.label_data)
+
+        info_layout.add_widget(detalhes_layout)
+        self.add_widget(info_layout)
+
+        # Botões de ação
+        botoes_layout = BoxLayout(orientation='horizontal', size_hint_x=0.3)
+
+        btn_editar = Button(
+            text='EDIT',
+            size_hint_x=0.5,
+            font_size='16sp',
+            color=get_color_from_hex('#64B5F6')
+        )
+        btn_editar.bind(on_press=lambda x: App.get_running_app().editar_transacao(self.transacao_id))
+        botoes_layout.add_widget(btn_editar)
+
+        btn_excluir = Button(
+            text='X',
+            size_hint_x=0.5,
+            font_size='23sp',
+            color=get_color_from_hex('#F44336')
+        )
+        btn_excluir.bind(on_press=lambda x: App.get_running_app().confirmar_exclusao(self.transacao_id))
+        botoes_layout.add_widget(btn_excluir)
+
+        self.add_widget(botoes_layout)
+
+    def atualizar_rect(self, instance, value):
+        self.rect.pos = instance.pos
+        self.rect.size = instance.size
+
+    @instrumentos.cronometrado("linha_historico")
+    def refresh_view_attrs(self, rv, index, data):
+        """Preenche a linha reaproveitada com a transação exibida na posição `index`"""
+        # As entradas de rv.data são um marcador compartilhado; o conteúdo
+        # da linha é lido da loja de transações sob demanda
+        self.indice = index
+        data = App.get_running_app().linha_historico(index)
+        self.transacao_id = data["transacao_id"]
+        self.label_desc.text = data["descricao"]
+        self.label_valor.text = data["valor_texto"]
+        self.label_valor.color = self.COR_RECEITA if data["receita"] else self.COR_GASTO
+        self.label_data.text = data["data_texto"]
+
+
+# Texturas de texto já renderizadas, compartilhadas pelos gráficos da aba Análise
+TEXTURAS_TEXTO = {}
+LIMITE_TEXTURAS = 5000
+
+
+def textura_texto(texto, tamanho=12, negrito=False):
+    """Textura (branca) do texto, renderizada uma vez e guardada em cache"""
+    chave = (texto, tamanho, negrito)
+    textura = TEXTURAS_TEXTO.get(chave)
+    if textura is None:
+        if len(TEXTURAS_TEXTO) >= LIMITE_TEXTURAS:
+            TEXTURAS_TEXTO.clear()
+        rotulo = CoreLabel(text=texto, font_size=sp(tamanho), bold=negrito)
+        rotulo.refresh()
+        textura = TEXTURAS_TEXTO[chave] = rotulo.texture
+    return textura
+
+
+def preencher_mesh(mesh, retangulos):
+    """Desenha todos os retângulos (x, y, largura, altura) num único Mesh"""
+    vertices = []
+    indices = []
+    for i, (x, y, largura, altura) in enumerate(retangulos):
+        vertices += (x, y, 0, 0, x + largura, y, 0, 0,
+                     x + largura, y + altura, 0, 0, x, y + altura, 0, 0)
+        k = 4 * i
+        indices += (k, k + 1, k + 2, k, k + 2, k + 3)
+    mesh.vertices = vertices
+    mesh.indices = indices
+
+
+def desenhar_texto(grupo, textura, x, y):
+    """Adiciona ao grupo um retângulo com a textura do texto em (x, y)"""
+    grupo.add(Rectangle(texture=textura, size=textura.size, pos=(x, y)))
+
+
+class GraficoMeses(Widget):
+    """Gráfico de barras com o total gasto em cada mês (um Mesh para todas as barras)"""
+
+    MARGEM_INFERIOR = dp(18)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.meses = ()
+        with self.canvas:
+            Color(0.1, 0.1, 0, 1)
+            self.fundo = Rectangle()
+            Color(*get_color_from_hex('#F44336'))
+            self.barras = Mesh(mode='triangles')
+            Color(0.7, 0.7, 0.7, 1)
+            self.textos = InstructionGroup()
+        self.canvas.add(self.textos)
+        self.bind(pos=self.desenhar, size=self.desenhar)
+
+    def definir(self, meses):
+        """Recebe [(mes_key, total)] em ordem cronológica; só redesenha se mudou"""
+        meses = tuple(meses)
+        if meses != self.meses:
+            self.meses = meses
+            self.desenhar()
+
+    def desenhar(self, *args):
+        self.fundo.pos = self.pos
+        self.fundo.size = self.size
+        self.textos.clear()
+        if not self.meses:
+            preencher_mesh(self.barras, ())
+            return
+        maior = max(total for mes, total in self.meses) or 1
+        largura = self.width / len(self.meses)
+        base = self.y + self.MARGEM_INFERIOR
+        altura_util = self.height - self.MARGEM_INFERIOR - dp(18)
+        preencher_mesh(self.barras, [
+            (self.x + i * largura + largura * 0.1, base, largura * 0.8, altura_util * total / maior)
+            for i, (mes, total) in enumerate(self.meses)
+        ])
+
+        # Rótulos: o maior total no topo e o ano abaixo do primeiro mês de cada ano
+        textura = textura_texto(f"máx. R$ {formatar_centavos(maior)}", 10)
+        desenhar_texto(self.textos, textura, self.x + dp(4), self.top - textura.height)
+        proximo_x = self.x
+        for i, (mes, total) in enumerate(self.meses):
+            if i and not mes.endswith("-01"):
+                continue
+            x = self.x + i * largura
+            if x < proximo_x:
+                continue
+            textura = textura_texto(mes[:4] if mes.endswith("-01") else mes, 10)
+            desenhar_texto(self.textos, textura, x, self.y)
+            proximo_x = x + textura.width + dp(6)
+
+
+class CartaoMes(Widget):
+    """Cartão de um mês na aba Análise: título e gastos por categoria em barras,
+    com texturas de texto em cache e um único Mesh para as barras.
+
+    Os cartões são reaproveitados entre meses; ao receber novos totais só os
+    textos que mudaram trocam de textura.
+    """
+
+    # Categorias desenhadas por mês; as demais são somadas numa linha "Outras"
+    LIMITE_CATEGORIAS = 12
+    ALTURA_TITULO = dp(50)
+    ALTURA_LINHA = dp(24)
+    COR_QUANTIDADE = get_color_from_hex('#2196F3')  # Azul
+    COR_VALOR = get_color_from_hex('#F44336')  # Vermelho
+
+    def __init__(self, **kwargs):
+        super().__init__(size_hint_y=None, **kwargs)
+        self.mes_key = None
+        self.topicos = None
+        self.total = 0
+        # Linhas exibidas: [retângulos (nome, quantidade, valor), textos, fração da barra]
+        self.linhas = []
+        # Desenho em coordenadas locais: mover o cartão só atualiza o Translate.
+        # Cada cartão tem o seu próprio fundo (antes todos compartilhavam self.rect_mes)
+        with self.canvas:
+            PushMatrix()
+            self.deslocamento = Translate()
+            Color(0.1, 0.1, 0, 1)
+            self.fundo = Rectangle()
+            Color(0.96, 0.26, 0.21, 0.25)
+            self.barras = Mesh(mode='triangles')
+        self.textos = InstructionGroup()
+        self.quantidades = InstructionGroup()
+        self.valores = InstructionGroup()
+        for cor, grupo in (((1, 1, 1, 1), self.textos), (self.COR_QUANTIDADE, self.quantidades),
+                           (self.COR_VALOR, self.valores)):
+            self.canvas.add(Color(*cor))
+            self.canvas.add(grupo)
+        self.canvas.add(PopMatrix())
+        self.titulo = [Rectangle(), Rectangle()]
+        self.textos_titulo = [None, None]
+        for retangulo in self.titulo:
+            self.textos.add(retangulo)
+        self.bind(pos=self.mover, size=self.desenhar)
+
+    def definir(self, mes_key, topicos):
+        """Mostra os totais {tópico: [quantidade, total]} do mês.
+
+        Retorna False sem tocar no canvas se os totais são os já exibidos.
+        """
+        if mes_key == self.mes_key and topicos == self.topicos:
+            return False
+        self.mes_key = mes_key
+        self.topicos = {topico: list(info) for topico, info in topicos.items()}
+
+        from calendar import month_name
+
+        ano, mes = mes_key.split("-")
+        nome_mes = month_name[int(mes)] if int(mes) <= 12 else "Mês inválido"
+        self.total = sum(total for quantidade, total in topicos.values())
+        total_transacoes = sum(quantidade for quantidade, total in topicos.values())
+        titulo = (
+            (f"{nome_mes} {ano}", 14, True),
+            (f"{len(topicos)} categorias | {total_transacoes} transações | "
+             f"R$ {formatar_centavos(self.total)}", 12, False),
+        )
+        for i, texto in enumerate(titulo):
+            if texto != self.textos_titulo[i]:
+                self.textos_titulo[i] = texto
+                self.escrever(self.titulo[i], *texto)
+
+        # Tópicos com maior gasto primeiro
+        ordenados = sorted(topicos.items(), key=lambda item: item[1][1], reverse=True)
+        exibidos = ordenados[:self.LIMITE_CATEGORIAS]
+        resto = ordenados[self.LIMITE_CATEGORIAS:]
+        if resto:
+            exibidos.append((f"Outras ({len(resto)})",
+                             (sum(quantidade for topico, (quantidade, total) in resto),
+                              sum(total for topico, (quantidade, total) in resto))))
+        maior = max((total for topico, (quantidade, total) in exibidos), default=0) or 1
+
+        # Linhas que sobram voltam ao pool; as que faltam são criadas uma vez
+        for retangulos, textos, fracao in self.linhas[len(exibidos):]:
+            for grupo, retangulo in zip((self.textos, self.quantidades, self.valores), retangulos):
+                grupo.remove(retangulo)
+        del self.linhas[len(exibidos):]
+        while len(self.linhas) < len(exibidos):
+            retangulos = (Rectangle(), Rectangle(), Rectangle())
+            for grupo, retangulo in zip((self.textos, self.quantidades, self.valores), retangulos):
+                grupo.add(retangulo)
+            self.linhas.append([retangulos, [None, None, None], 0])
+
+        for linha, (topico, (quantidade, total)) in zip(self.linhas, exibidos):
+            retangulos, textos_atuais, fracao = linha
+            textos = ((topico.title()[:30], 12, False), (f"{quantidade}x", 11, False),
+                      (f"R$ {formatar_centavos(total)}", 11, True))
+            for i, texto in enumerate(textos):
+                if texto != textos_atuais[i]:
+                    textos_atuais[i] = texto
+                    self.escrever(retangulos[i], *texto)
+            linha[2] = total / maior
+
+        altura = self.ALTURA_TITULO + len(self.linhas) * self.ALTURA_LINHA + dp(10)
+        if altura != self.height:
+            self.height = altura
+        else:
+            self.desenhar()
+        return True
+
+    @staticmethod
+    def escrever(retangulo, texto, tamanho, negrito):
+        """Troca o texto exibido pelo retângulo (textura vinda do cache)"""
+        textura = textura_texto(texto, tamanho, negrito)
+        retangulo.texture = textura
+        retangulo.size = textura.size
+
+    def mover(self, *args):
+        self.deslocamento.xy = self.pos
+
+    def desenhar(self, *args):
+        """Posiciona barras e textos para a largura/altura atuais"""
+        self.fundo.size = self.size
+
+        topo = self.height - dp(5)
+        for retangulo in self.titulo:
+            largura, altura = retangulo.size
+            topo -= altura
+            retangulo.pos = (self.width / 2 - largura / 2, topo)
+
+        x = dp(10)
+        largura = self.width - dp(20)
+        barras = []
+        y = self.height - self.ALTURA_TITULO
+        for (nome, quantidade, valor), textos, fracao in self.linhas:
+            y -= self.ALTURA_LINHA
+            barras.append((x, y + dp(2), largura * fracao, self.ALTURA_LINHA - dp(4)))
+            meio = y + self.ALTURA_LINHA / 2
+            nome.pos = (x + dp(4), meio - nome.size[1] / 2)
+            quantidade.pos = (x + largura * 0.6 - quantidade.size[0] / 2,
+                              meio - quantidade.size[1] / 2)
+            valor.pos = (x + largura - valor.size[0] - dp(4), meio - valor.size[1] / 2)
+        preencher_mesh(self.barras, barras)
+
+
+class PainelDesempenho(BoxLayout):
+    """Painel sobreposto (F12 ou três toques no título) com os histogramas
+    da instrumentação, atualizado duas vezes por segundo"""
+
+    INTERVALO = 0.5
+
+    def __init__(self, ao_exportar, **kwargs):
+        super().__init__(orientation='vertical', size_hint=(None, None),
+                         size=(dp(420), dp(320)), padding=dp(6), spacing=dp(4), **kwargs)
+        with self.canvas.before:
+            Color(0, 0, 0, 0.8)
+            self.fundo = Rectangle(pos=self.pos, size=self.size)
+        self.bind(pos=self.atualizar_fundo, size=self.atualizar_fundo)
+
+        self.label = Label(font_name='RobotoMono-Regular', font_size='11sp',
+                           halign='left', valign='top')
+        self.label.bind(size=self.label.setter('text_size'))
+        self.add_widget(self.label)
+
+        botoes = BoxLayout(orientation='horizontal', size_hint_y=None, height=dp(36),
+                           spacing=dp(4))
+        btn_exportar = Button(text='Exportar trace')
+        btn_exportar.bind(on_press=lambda x: ao_exportar())
+        botoes.add_widget(btn_exportar)
+        btn_limpar = Button(text='Limpar')
+        btn_limpar.bind(on_press=lambda x: (instrumentos.limpar(), self.atualizar()))
+        botoes.add_widget(btn_limpar)
+        self.add_widget(botoes)
+
+    def atualizar_fundo(self, instance, value):
+        self.fundo.pos = self.pos
+        self.fundo.size = self.size
+
+    def iniciar(self):
+        self.atualizar()
+        Clock.schedule_interval(self.atualizar, self.INTERVALO)
+
+    def parar(self):
+        Clock.unschedule(self.atualizar)
+
+    def atualizar(self, *args):
+        linhas = [f"{'ms':<16}{'n':>7}{'p50':>8}{'p95':>8}{'máx':>9}"]
+        for nome, resumo in instrumentos.resumo().items():
+            if "p50_ms" not in resumo:
+                continue
+            linhas.append(f"{nome[:16]:<16}{resumo['quantidade']:>7}{resumo['p50_ms']:>8.1f}"
+                          f"{resumo['p95_ms']:>8.1f}{resumo['max_janela_ms']:>9.1f}")
+            if nome == "quadro" and resumo["p50_ms"] > 0:
+                linhas[-1] += f"  {1000 / resumo['p50_ms']:.0f} fps"
+        self.label.text = "\n".join(linhas)
 
 
 class DucFinancasApp(App):
+    # Entrada compartilhada por todas as linhas de rv_historico (ver linha_historico)
+    LINHA_HISTORICO = {}
+    # Linhas da primeira página de uma busca; a rolagem até o fim busca mais
+    PAGINA_HISTORICO = 500
+    # Transações importadas gravadas por quadro (mantém cada quadro abaixo de ~16ms)
+    LOTE_IMPORTACAO = 1000
+    # Linhas do relatório de estatísticas desenhadas por quadro
+    LINHAS_POR_BLOCO = 6
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.historico = []
-        self.saldo_total = 0.0
+        # Regras de negócio e dados; o app é só uma visão sobre o livro
+        self.livro = LivroCaixa()
+        # IDs na ordem de exibição (mais antigos primeiro), espelhando rv_historico.data
+        self.ordem_historico = array('q')
+        # Sem filtro, a linha da loja de cada posição (crescente), para achar
+        # uma exclusão por bisect; vale enquanto a loja não for renumerada
+        self.linhas_historico = array('i')
+        self.ids_historico = None
+        # Busca/filtros ativos no histórico (argumentos de LivroCaixa.buscar)
+        self.filtro = None
+        # Quantas linhas a busca traz (cresce ao rolar) e se ficaram linhas de fora
+        self.limite_historico = self.PAGINA_HISTORICO
+        self.historico_truncado = False
+        # A aba Análise só é construída na primeira vez que é aberta
+        self.analise_layout = None
+        # Relatório de estatísticas: popup aberto e cálculo em andamento (thread)
+        self.popup_estatisticas = None
+        self.relatorio_estatistico = None
+        # Exportação em andamento (thread), cancelada se o app fechar
+        self.exportacao = None
+        # Painel de desempenho (criado na primeira vez que é aberto)
+        self.painel_desempenho = None
+        # Visões a atualizar no próximo quadro e alterações pendentes no histórico
+        self.visoes_sujas = set()
+        self.alteracoes_historico = []
+        self._gatilho_visoes = Clock.create_trigger(self.atualizar_visoes, -1)
         self.arquivo_dados = "duc_financas_dados.json"
         self.arquivo_config = "duc_financas_config.json"
 
@@ -30,7 +452,9 @@ class DucFinancasApp(App):
         self.title = "DuC Finanças"
 
         # Carrega dados salvos
+        inicio = time.perf_counter()
         self.carregar_dados()
+        self.tempo_carga = time.perf_counter() - inicio
 
         # Layout principal
         main_layout = BoxLayout(orientation='vertical', spacing=dp(5), padding=dp(10))
@@ -48,20 +472,100 @@ class DucFinancasApp(App):
         tab_transacoes.content = self.criar_aba_transacoes()
         self.tab_panel.add_widget(tab_transacoes)
 
-        # Aba Análise
-        tab_analise = TabbedPanelItem(text='Análise')
-        tab_analise.content = self.criar_aba_analise()
-        self.tab_panel.add_widget(tab_analise)
+        # Aba Análise: só um contêiner vazio até a primeira ativação
+        self.tab_analise = TabbedPanelItem(text='Análise')
+        self.tab_analise.content = BoxLayout()
+        self.tab_panel.add_widget(self.tab_analise)
+        self.tab_panel.bind(current_tab=self.ao_trocar_aba)
 
         main_layout.add_widget(self.tab_panel)
 
-        # Atualiza exibições iniciais
+        # Atualiza exibições iniciais (a lista só cria as linhas visíveis)
         self.atualizar_saldo()
         self.atualizar_historico()
-        Clock.schedule_once(lambda dt: self.gerar_analise(), 0.1)
 
         return main_layout
 
+    def on_start(self):
+        """Mede o tempo até o primeiro quadro desenhado"""
+        from kivy.core.window import Window
+
+        def primeiro_quadro(*args):
+            Window.unbind(on_flip=primeiro_quadro)
+            self.tempo_primeiro_quadro = time.perf_counter() - INICIO_PROCESSO
+            print(f"Primeiro quadro em {self.tempo_primeiro_quadro * 1000:.0f} ms "
+                  f"(carga dos dados: {self.tempo_carga * 1000:.0f} ms, "
+                  f"{len(self.livro.historico)} transações)")
+
+        Window.bind(on_flip=primeiro_quadro)
+        Window.bind(on_keyboard=self.ao_teclado)
+        if instrumentos.ativo:
+            Clock.schedule_interval(self.amostrar_quadro, 0)
+
+    def ao_teclado(self, window, tecla, *args):
+        """F12 liga/desliga o painel de desempenho"""
+        if tecla == 293:  # F12
+            self.alternar_painel_desempenho()
+            return True
+        return False
+
+    def ao_tocar_titulo(self, titulo, toque):
+        """Três toques no título: painel de desempenho (sem teclado no celular)"""
+        if titulo.collide_point(*toque.pos) and toque.is_triple_tap:
+            self.alternar_painel_desempenho()
+            return True
+        return False
+
+    def amostrar_quadro(self, dt):
+        """Intervalo entre quadros, medido pelo Clock"""
+        instrumentos.registrar("quadro", time.perf_counter() - dt, dt, "quadros")
+
+    def alternar_painel_desempenho(self):
+        """Mostra/esconde o painel; a instrumentação fica ligada enquanto ele
+        estiver aberto (ou sempre, com DUC_INSTRUMENTACAO=1)"""
+        from kivy.core.window import Window
+
+        painel = self.painel_desempenho
+        if painel is None:
+            painel = self.painel_desempenho = PainelDesempenho(self.exportar_trace)
+            Window.bind(size=lambda window, tamanho: self.posicionar_painel_desempenho())
+        if painel.parent is None:
+            self.instrumentacao_anterior = instrumentos.ativo
+            if not instrumentos.ativo:
+                instrumentos.ativar()
+                Clock.schedule_interval(self.amostrar_quadro, 0)
+            Window.add_widget(painel)
+            self.posicionar_painel_desempenho()
+            painel.iniciar()
+        else:
+            painel.parar()
+            Window.remove_widget(painel)
+            if not self.instrumentacao_anterior:
+                Clock.unschedule(self.amostrar_quadro)
+                instrumentos.ativar(False)
+
+    def posicionar_painel_desempenho(self):
+        from kivy.core.window import Window
+
+        painel = self.painel_desempenho
+        painel.pos = (Window.width - painel.width - dp(5), Window.height - painel.height - dp(5))
+
+    def exportar_trace(self):
+        """Grava o trace JSON ao lado do arquivo de dados"""
+        arquivo = os.path.splitext(self.arquivo_dados)[0] + ".trace.json"
+        try:
+            eventos = instrumentos.exportar(arquivo)
+        except Exception as e:
+            self.mostrar_toast(f"Erro ao exportar trace: {e}")
+            return
+        self.mostrar_toast(f"{eventos} eventos exportados\npara {arquivo}")
+
+    def ao_trocar_aba(self, painel, aba):
+        """Constrói a aba Análise na primeira ativação"""
+        if aba is self.tab_analise and self.analise_layout is None:
+            self.tab_analise.content.add_widget(self.criar_aba_analise())
+            self.gerar_analise()
+
     def criar_cabecalho(self):
         """Cria o cabeçalho com título e saldo"""
         header = BoxLayout(orientation='vertical', size_hint_y=None, height=dp(80))
@@ -74,11 +578,12 @@ class DucFinancasApp(App):
             size_hint_y=None,
             height=dp(40)
         )
+        titulo.bind(on_touch_down=self.ao_tocar_titulo)
         header.add_widget(titulo)
 
         # Saldo
         self.label_saldo = Label(
-            text=f'Saldo Total: R$ {self.saldo_total:.2f}',
+            text=f'Saldo Total: R$ {formatar_centavos(self.livro.saldo)}',
             font_size='16sp',
             bold=True,
             size_hint_y=None,
@@ -120,11 +625,19 @@ class DucFinancasApp(App):
         # Botões
         btn_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=dp(40))
 
-        btn_adicionar = Button(text='Adicionar', size_hint_x=0.7)
+        btn_adicionar = Button(text='Adicionar', size_hint_x=0.4)
         btn_adicionar.bind(on_press=self.adicionar_transacao)
         btn_layout.add_widget(btn_adicionar)
 
-        btn_limpar = Button(text='Limpar', size_hint_x=0.3)
+        btn_importar = Button(text='Importar', size_hint_x=0.2)
+        btn_importar.bind(on_press=self.escolher_extrato)
+        btn_layout.add_widget(btn_importar)
+
+        btn_sincronizar = Button(text='Sincronizar', size_hint_x=0.2)
+        btn_sincronizar.bind(on_press=self.escolher_pasta_sincronizacao)
+        btn_layout.add_widget(btn_sincronizar)
+
+        btn_limpar = Button(text='Limpar', size_hint_x=0.2)
         btn_limpar.bind(on_press=self.confirmar_limpeza)
         btn_layout.add_widget(btn_limpar)
 
@@ -139,29 +652,52 @@ class DucFinancasApp(App):
             padding=0
         )
 
-        # Título "Histórico"
-        historico_container.add_widget(Label(
+        # Título "Histórico" (mostra a contagem quando há filtro)
+        self.label_historico = Label(
             text='Histórico',
             font_size='16sp',
             bold=True,
             size_hint_y=None,
             height=dp(30)
-        ))
-
-        # ScrollView SEM barra de rolagem e SEM padding
-        scroll = ScrollView(bar_width=0)
+        )
+        historico_container.add_widget(self.label_historico)
+
+        # Busca e filtros: a lista é refeita a cada tecla, uma vez por quadro
+        filtros_layout = BoxLayout(orientation='horizontal', size_hint_y=None,
+                                   height=dp(40), spacing=dp(2))
+        self.input_busca = TextInput(hint_text='Buscar...', multiline=False, size_hint_x=0.36)
+        self.input_data_inicio = TextInput(hint_text='De dd/mm/aa', multiline=False,
+                                           size_hint_x=0.16)
+        self.input_data_fim = TextInput(hint_text='Até dd/mm/aa', multiline=False,
+                                        size_hint_x=0.16)
+        self.input_valor_min = TextInput(hint_text='Mín R$', multiline=False,
+                                         input_filter='float', size_hint_x=0.16)
+        self.input_valor_max = TextInput(hint_text='Máx R$', multiline=False,
+                                         input_filter='float', size_hint_x=0.16)
+        for campo in (self.input_busca, self.input_data_inicio, self.input_data_fim,
+                      self.input_valor_min, self.input_valor_max):
+            campo.bind(text=self.ao_mudar_filtro)
+            filtros_layout.add_widget(campo)
+        historico_container.add_widget(filtros_layout)
+
+        # Lista virtualizada: só as linhas visíveis existem como widgets
+        self.rv_historico = RecycleView(bar_width=0)
 
         # Layout da lista SEM spacing e SEM padding
-        self.historico_layout = BoxLayout(
+        lista_layout = RecycleBoxLayout(
             orientation='vertical',
             size_hint_y=None,
-            spacing=0,  # SOLUÇÃO 1: Remove espaço entre itens
-            padding=0  # SOLUÇÃO 2: Remove padding interno
+            default_size=(None, dp(60)),
+            default_size_hint=(1, None),
+            spacing=0,
+            padding=0
         )
-
-        self.historico_layout.bind(minimum_height=self.historico_layout.setter('height'))
-        scroll.add_widget(self.historico_layout)
-        historico_container.add_widget(scroll)
+        lista_layout.bind(minimum_height=lista_layout.setter('height'))
+        self.rv_historico.add_widget(lista_layout)
+        # viewclass só vale depois que o layout existe (fica nele, não na RecycleView)
+        self.rv_historico.viewclass = ItemHistorico
+        self.rv_historico.bind(scroll_y=self.ao_rolar_historico)
+        historico_container.add_widget(self.rv_historico)
 
         layout.add_widget(historico_container)
 
@@ -171,13 +707,32 @@ class DucFinancasApp(App):
         """Cria a aba de análise"""
         layout = BoxLayout(orientation='vertical', spacing=dp(10))
 
-        # Título
-        layout.add_widget(Label(text='Análise de Gastos', font_size='16sp', bold=True,
-                                size_hint_y=None, height=dp(40)))
-
-        # ScrollView para análise
+        # Título e relatório de estatísticas (calculado em segundo plano)
+        titulo = BoxLayout(orientation='horizontal', size_hint_y=None, height=dp(40))
+        titulo.add_widget(Label(text='Análise de Gastos', font_size='16sp', bold=True))
+        btn_estatisticas = Button(text='Estatísticas', size_hint_x=0.35,
+                                  background_color=get_color_from_hex('#2196F3'))
+        btn_estatisticas.bind(on_press=lambda x: self.abrir_estatisticas())
+        titulo.add_widget(btn_estatisticas)
+        btn_exportar = Button(text='Exportar', size_hint_x=0.3,
+                              background_color=get_color_from_hex('#4CAF50'))
+        btn_exportar.bind(on_press=lambda x: self.escolher_exportacao())
+        titulo.add_widget(btn_exportar)
+        layout.add_widget(titulo)
+
+        from kivy.uix.scrollview import ScrollView
+
+        # Total gasto por mês
+        self.grafico_meses = GraficoMeses(size_hint_y=None, height=dp(160))
+        layout.add_widget(self.grafico_meses)
+
+        # ScrollView com um cartão por mês (reaproveitados em gerar_analise)
+        self.cartoes_mes = {}
+        self.cartoes_livres = []
+        self.label_sem_gastos = Label(text="Nenhum gasto encontrado para análise.",
+                                      halign='center')
         scroll = ScrollView()
-        self.analise_layout = BoxLayout(orientation='vertical', size_hint_y=None)
+        self.analise_layout = BoxLayout(orientation='vertical', size_hint_y=None, spacing=dp(10))
         self.analise_layout.bind(minimum_height=self.analise_layout.setter('height'))
         scroll.add_widget(self.analise_layout)
         layout.add_widget(scroll)
@@ -186,6 +741,8 @@ class DucFinancasApp(App):
 
     def mostrar_toast(self, mensagem):
         """Mostra uma mensagem toast"""
+        from kivy.uix.popup import Popup
+
         popup = Popup(
             title='',
             content=Label(text=mensagem),
@@ -195,40 +752,137 @@ class DucFinancasApp(App):
         popup.open()
         Clock.schedule_once(lambda dt: popup.dismiss(), 2)
 
+    @instrumentos.cronometrado("carregar_dados")
     def carregar_dados(self):
-        """Carrega os dados salvos do arquivo"""
-        if os.path.exists(self.arquivo_dados):
+        """Carrega o livro-caixa; a compactação pedida pelo escritor volta para a thread da UI"""
+        self.livro = LivroCaixa(
+            self.arquivo_dados, self.arquivo_config,
+            agendar=lambda funcao: Clock.schedule_once(lambda dt: funcao())
+        )
+        self.livro.ao_alertar_orcamento = self.alertar_orcamento
+        self.livro.carregar()
+        # Ocorrências recorrentes vencidas entram num único lote; as futuras só são previstas
+        lancadas = self.livro.lancar_recorrencias()
+        if lancadas:
+            print(f"{lancadas} transações recorrentes lançadas")
+        if self.livro.erro_carga is not None:
+            Clock.schedule_once(lambda dt: self.avisar_somente_leitura())
+
+    def avisar_somente_leitura(self):
+        """Aviso de que a carga falhou e nada será gravado"""
+        self.mostrar_toast(f"Dados não carregados: {self.livro.erro_carga}\n"
+                           f"Alterações desativadas")
+
+    def alertar_orcamento(self, mes, categoria, fracao, total, limite):
+        """Aviso de orçamento cruzado; no quadro seguinte, para ficar por cima
+        da confirmação da inclusão ou edição"""
+        mensagem = descrever_alerta_orcamento(mes, categoria, fracao, total, limite)
+        Clock.schedule_once(lambda dt: self.mostrar_toast(mensagem))
+
+    @instrumentos.cronometrado("salvar_dados")
+    def salvar_dados(self):
+        """Grava um snapshot completo dos dados (compactação do diário)"""
+        self.livro.salvar()
+
+    def registrar_operacao(self, operacao, atualizar=True):
+        """Registra uma operação no livro e marca as visões afetadas; False
+        (com aviso) se o livro estiver somente leitura"""
+        if self.livro.erro_carga is not None:
+            self.avisar_somente_leitura()
+            return False
+        cargas = self.livro.cargas
+        # A linha de uma transação excluída só é conhecida antes da exclusão
+        excluida = (self.livro.historico.linhas.get(operacao["id"])
+                    if operacao["op"] == "del" else None)
+        operacao = self.livro.registrar_operacao(operacao)
+        if self.livro.cargas != cargas:
+            # A operação trouxe um mês arquivado para a memória: a lista é refeita
+            self.visoes_sujas.add("historico")
+        if atualizar:
+            self.marcar_alteracao(operacao, excluida)
+        return True
+
+    def marcar_alteracao(self, operacao, excluida=None):
+        """Registra o efeito de uma operação nas visões, para o próximo quadro,
+        com a linha da loja da transação (`excluida`: a linha antes da exclusão)"""
+        tipo = operacao["op"]
+        if tipo == "add":
+            transacao_id = operacao["transacao"]["id"]
+            self.alteracoes_historico.append(
+                (tipo, transacao_id, self.livro.historico.linhas.get(transacao_id)))
+        elif tipo == "edit":
+            self.alteracoes_historico.append((tipo, operacao["id"], None))
+        elif tipo == "del":
+            self.alteracoes_historico.append((tipo, operacao["id"], excluida))
+        else:
+            self.visoes_sujas.add("historico")
+        self.marcar_sujo("saldo", "analise")
+
+    def marcar_sujo(self, *visoes):
+        """Marca visões para atualizar; várias marcações viram uma só passada"""
+        self.visoes_sujas.update(visoes)
+        self._gatilho_visoes()
+
+    @instrumentos.cronometrado("visoes")
+    def atualizar_visoes(self, *args):
+        """Atualiza, uma única vez por quadro, as visões marcadas como sujas"""
+        sujas, self.visoes_sujas = self.visoes_sujas, set()
+        alteracoes, self.alteracoes_historico = self.alteracoes_historico, []
+
+        # Muitas alterações de uma vez, um filtro ativo (que decide quais
+        # linhas entram) ou a loja renumerada: reconstruir a lista sai mais barato
+        if ("historico" in sujas or len(alteracoes) > 200 or (self.filtro and alteracoes)
+                or (alteracoes and self.livro.historico.ids is not self.ids_historico)):
+            self.atualizar_historico()
+        else:
+            for tipo, transacao_id, linha in alteracoes:
+                if tipo == "add":
+                    self.inserir_item_historico(transacao_id, linha)
+                elif tipo == "edit":
+                    self.atualizar_item_historico(transacao_id)
+                else:
+                    self.remover_item_historico(linha)
+
+        if "saldo" in sujas:
+            self.atualizar_saldo()
+        if "analise" in sujas:
+            self.gerar_analise()
+            if self.popup_estatisticas is not None:
+                # Dados mudaram: o cálculo em andamento é descartado e refeito
+                self.calcular_estatisticas()
+
+    def on_pause(self):
+        """Grava as operações pendentes antes de o sistema suspender o app"""
+        self.livro.descarregar()
+        return True
+
+    def on_stop(self):
+        """Grava o que estiver pendente e aguarda uma compactação em andamento"""
+        if self.relatorio_estatistico is not None:
+            self.relatorio_estatistico.cancelar()
+        if self.exportacao is not None:
+            self.exportacao.cancelar()
+        self.livro.encerrar()
+        if instrumentos.ativo:
+            # Com a instrumentação ligada, o trace da sessão fica gravado
             try:
-                with open(self.arquivo_dados, 'r', encoding='utf-8') as f:
-                    self.historico = json.load(f)
-                # Garante que todas as transações tenham ID único
-                for i, transacao in enumerate(self.historico):
-                    if "id" not in transacao:
-                        transacao["id"] = int(time.time() * 1000000) + i
-                self.salvar_dados()
-                print(f"Dados carregados: {len(self.historico)} transações")
+                instrumentos.exportar(os.path.splitext(self.arquivo_dados)[0] + ".trace.json")
             except Exception as e:
-                print(f"Erro ao carregar dados: {e}")
-                self.historico = []
-        else:
-            self.historico = []
-
-    def salvar_dados(self):
-        """Salva os dados no arquivo"""
-        try:
-            with open(self.arquivo_dados, 'w', encoding='utf-8') as f:
-                json.dump(self.historico, f, ensure_ascii=False, indent=2)
-            print("Dados salvos com sucesso!")
-        except Exception as e:
-            print(f"Erro ao salvar dados: {e}")
+                print(f"Erro ao exportar trace: {e}")
 
+    @instrumentos.cronometrado("saldo")
     def atualizar_saldo(self):
         """Atualiza o saldo total"""
-        self.saldo_total = sum(item["valor"] for item in self.historico)
-        self.label_saldo.text = f'Saldo Total: R$ {self.saldo_total:.2f}'
+        saldo = self.livro.saldo  # mantido por deltas (e totais dos meses arquivados), O(1)
+        self.label_saldo.text = f'Saldo Total: R$ {formatar_centavos(saldo)}'
+        if self.livro.recorrencias:
+            # Recorrentes ainda não lançadas, contadas por regra (sem gerar transações)
+            _, fim_mes = intervalo_do_mes(datetime.now().strftime("%Y-%m"))
+            previsto = self.livro.saldo_previsto(fim_mes - 1)
+            self.label_saldo.text += f'  (fim do mês: R$ {formatar_centavos(previsto)})'
 
         # Muda cor baseado no saldo
-        if self.saldo_total >= 0:
+        if saldo >= 0:
             self.label_saldo.color = get_color_from_hex('#4CAF50')  # Verde
         else:
             self.label_saldo.color = get_color_from_hex('#F44336')  # Vermelho
@@ -243,26 +897,17 @@ class DucFinancasApp(App):
                 self.mostrar_toast("Preencha todos os campos!")
                 return
 
-            valor = float(valor_texto)
+            centavos = centavos_de_texto(valor_texto)
 
-            transacao = {
-                "id": int(time.time() * 1000000) + len(self.historico),
-                "valor": valor,
-                "descricao": descricao,
-                "data": datetime.now().strftime("%d/%m/%Y %H:%M")
-            }
-
-            self.historico.append(transacao)
-            self.salvar_dados()
-            self.atualizar_historico()
-            self.atualizar_saldo()
-            self.gerar_analise()
+            transacao = self.livro.nova_transacao(centavos, descricao)
+            if not self.registrar_operacao({"op": "add", "transacao": transacao}):
+                return
 
             # Limpa campos
             self.input_valor.text = ""
             self.input_descricao.text = ""
 
-            tipo = "Receita" if valor > 0 else "Gasto"
+            tipo = "Receita" if centavos > 0 else "Gasto"
             self.mostrar_toast(f"{tipo} adicionado!")
 
         except ValueError:
@@ -270,110 +915,395 @@ class DucFinancasApp(App):
         except Exception as e:
             self.mostrar_toast(f"Erro: {e}")
 
-    def atualizar_historico(self):
-        """Atualiza a exibição do histórico"""
-        self.historico_layout.clear_widgets()
+    def escolher_extrato(self, instance):
+        """Abre o seletor de arquivos para importar um extrato CSV/OFX"""
+        from kivy.uix.filechooser import FileChooserListView
+        from kivy.uix.popup import Popup
 
-        for transacao in reversed(self.historico):
-            self.criar_item_historico(transacao)
+        content = BoxLayout(orientation='vertical', spacing=dp(10))
 
-    def criar_item_historico(self, transacao):
-        """Cria um item do histórico"""
-        # Layout do item
-        item_layout = BoxLayout(
-            orientation='horizontal',
-            size_hint_y=None,
-            height=dp(60),
-            spacing=dp(5)
+        seletor = FileChooserListView(
+            path=os.path.expanduser("~"),
+            filters=['*.csv', '*.CSV', '*.ofx', '*.OFX']
         )
+        content.add_widget(seletor)
 
-        # Canvas com fundo - VERSÃO CORRIGIDA
-        with item_layout.canvas.before:
-            Color(0.1, 0.1, 0.1, 1)  # Cinza muito escuro
-            item_rect = Rectangle(size=item_layout.size, pos=item_layout.pos)
+        btn_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=dp(40))
 
-        # Função update específica para este item
-        def update_item_rect(instance, value):
-            item_rect.pos = instance.pos
-            item_rect.size = instance.size
+        def importar(instance):
+            if not seletor.selection:
+                self.mostrar_toast("Selecione um arquivo!")
+                return
+            popup.dismiss()
+            self.importar_extrato(seletor.selection[0])
 
-        item_layout.bind(pos=update_item_rect, size=update_item_rect)
+        btn_importar = Button(text='Importar')
+        btn_importar.bind(on_press=importar)
+        btn_layout.add_widget(btn_importar)
 
-        # Informações da transação
-        info_layout = BoxLayout(orientation='vertical', size_hint_x=0.7)
+        btn_cancelar = Button(text='Cancelar')
+        btn_cancelar.bind(on_press=lambda x: popup.dismiss())
+        btn_layout.add_widget(btn_cancelar)
 
-        # Descrição
-        label_desc = Label(
-            text=transacao["descricao"],
-            font_size='14sp',
-            bold=True,
-            text_size=(None, None),
-            halign='left'
+        content.add_widget(btn_layout)
+
+        popup = Popup(
+            title='Importar Extrato',
+            content=content,
+            size_hint=(0.95, 0.9)
         )
-        info_layout.add_widget(label_desc)
+        popup.open()
 
-        # Valor e data
-        valor = transacao["valor"]
-        simbolo = "+" if valor > 0 else ""
-        cor_valor = get_color_from_hex('#4CAF50') if valor > 0 else get_color_from_hex('#F44336')
+    def importar_extrato(self, arquivo):
+        """Importa um extrato em segundo plano, mostrando o progresso"""
+        from kivy.uix.popup import Popup
+        from kivy.uix.progressbar import ProgressBar
 
-        detalhes_layout = BoxLayout(orientation='horizontal')
+        content = BoxLayout(orientation='vertical', spacing=dp(10))
+        label_progresso = Label(text='Lendo extrato...')
+        content.add_widget(label_progresso)
+        barra = ProgressBar(max=1.0, size_hint_y=None, height=dp(20))
+        content.add_widget(barra)
 
-        label_valor = Label(
-            text=f'R$ {simbolo}{valor:.2f}',
-            font_size='12sp',
-            bold=True,
-            color=cor_valor,
-            size_hint_x=0.6
+        popup = Popup(
+            title='Importando',
+            content=content,
+            size_hint=(0.8, 0.3),
+            auto_dismiss=False
         )
-        detalhes_layout.add_widget(label_valor)
+        popup.open()
+        self.progresso_importacao = (popup, label_progresso, barra)
 
-        label_data = Label(
-            text=transacao["data"].split(' ')[0],  # Só a data
-            font_size='10sp',
-            color=get_color_from_hex('#666666'),
-            size_hint_x=0.4
+        def ao_progresso(fracao):
+            Clock.schedule_once(lambda dt: setattr(barra, 'value', fracao * 0.5))
+
+        def ao_concluir(novas, resumo):
+            Clock.schedule_once(lambda dt: self.gravar_importacao(novas, resumo))
+
+        ImportadorExtrato(arquivo, self.livro.historico.copia(), ao_progresso, ao_concluir,
+                          self.livro.leitor_arquivadas()).iniciar()
+
+    def gravar_importacao(self, novas, resumo, inicio=0):
+        """Grava as transações importadas em fatias (uma por quadro) e
+        atualiza as visões uma única vez no final"""
+        popup, label_progresso, barra = self.progresso_importacao
+        if novas is None:
+            popup.dismiss()
+            self.mostrar_toast(f"Erro ao importar: {resumo['erro']}")
+            return
+
+        fatia = novas[inicio:inicio + self.LOTE_IMPORTACAO]
+        if fatia:
+            if not self.registrar_operacao({
+                "op": "lote",
+                "transacoes": [self.livro.nova_transacao(centavos, descricao, minutos)
+                               for centavos, minutos, descricao in fatia]
+            }, atualizar=False):
+                popup.dismiss()
+                return
+
+        gravadas = inicio + len(fatia)
+        if gravadas < len(novas):
+            label_progresso.text = f'Gravando {gravadas}/{len(novas)}...'
+            barra.value = 0.5 + 0.5 * gravadas / len(novas)
+            Clock.schedule_once(lambda dt: self.gravar_importacao(novas, resumo, gravadas))
+            return
+
+        popup.dismiss()
+        self.marcar_sujo("historico", "saldo", "analise")
+        self.mostrar_toast(f"{len(novas)} transações importadas\n"
+                           f"({resumo['duplicadas']} duplicadas, {resumo['invalidas']} inválidas)")
+
+    def escolher_exportacao(self):
+        """Pede o arquivo e o formato da exportação (histórico e gastos por mês e categoria)"""
+        from kivy.uix.popup import Popup
+
+        content = BoxLayout(orientation='vertical', spacing=dp(10))
+        content.add_widget(Label(
+            text="Exportar transações e gastos por mês e categoria\n"
+                 "(o relatório HTML pode ser impresso ou salvo em PDF)",
+            halign='center'
+        ))
+        nome = f"duc_financas_{datetime.now().strftime('%Y-%m-%d')}"
+        input_arquivo = TextInput(
+            text=os.path.join(os.path.expanduser("~"), nome + ".csv"),
+            multiline=False,
+            size_hint_y=None,
+            height=dp(40)
         )
-        detalhes_layout.add_widget(label_data)
+        content.add_widget(input_arquivo)
 
-        info_layout.add_widget(detalhes_layout)
-        item_layout.add_widget(info_layout)
+        btn_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=dp(40))
 
-        # Botões de ação
-        botoes_layout = BoxLayout(orientation='horizontal', size_hint_x=0.3)
+        def exportar(extensao):
+            arquivo = input_arquivo.text.strip()
+            if not arquivo:
+                self.mostrar_toast("Informe o arquivo!")
+                return
+            popup.dismiss()
+            self.exportar(os.path.splitext(arquivo)[0] + extensao)
 
-        btn_editar = Button(
-            text='EDIT',
-            size_hint_x=0.5,
-            font_size='16sp',
-            color=get_color_from_hex('#64B5F6')
+        for texto, extensao in (('CSV', '.csv'), ('JSON-lines', '.jsonl'), ('Relatório', '.html')):
+            btn = Button(text=texto)
+            btn.bind(on_press=lambda x, extensao=extensao: exportar(extensao))
+            btn_layout.add_widget(btn)
+
+        btn_cancelar = Button(text='Cancelar')
+        btn_cancelar.bind(on_press=lambda x: popup.dismiss())
+        btn_layout.add_widget(btn_cancelar)
+
+        content.add_widget(btn_layout)
+
+        popup = Popup(
+            title='Exportar',
+            content=content,
+            size_hint=(0.95, 0.5)
         )
-        btn_editar.bind(on_press=lambda x: self.editar_transacao(transacao["id"]))
-        botoes_layout.add_widget(btn_editar)
+        popup.open()
 
-        btn_excluir = Button(
-            text='X',
-            size_hint_x=0.5,
-            font_size='23sp',
-            color=get_color_from_hex('#F44336')
+    def exportar(self, arquivo):
+        """Exporta numa thread, em blocos, mostrando o progresso"""
+        from kivy.uix.popup import Popup
+        from kivy.uix.progressbar import ProgressBar
+
+        if self.exportacao is not None:
+            self.mostrar_toast("Já há uma exportação em andamento!")
+            return
+
+        content = BoxLayout(orientation='vertical', spacing=dp(10))
+        label_progresso = Label(text='Exportando...')
+        content.add_widget(label_progresso)
+        barra = ProgressBar(max=1.0, size_hint_y=None, height=dp(20))
+        content.add_widget(barra)
+        btn_cancelar = Button(text='Cancelar', size_hint_y=None, height=dp(40))
+        content.add_widget(btn_cancelar)
+
+        popup = Popup(
+            title='Exportando',
+            content=content,
+            size_hint=(0.8, 0.35),
+            auto_dismiss=False
         )
-        btn_excluir.bind(on_press=lambda x: self.confirmar_exclusao(transacao["id"]))
-        botoes_layout.add_widget(btn_excluir)
 
-        item_layout.add_widget(botoes_layout)
+        def mostrar_progresso(gravadas, total):
+            if self.exportacao is not None:
+                label_progresso.text = f'{gravadas}/{total} transações'
+                barra.value = gravadas / total if total else 1.0
 
-        self.historico_layout.add_widget(item_layout)
+        def concluir(resultado):
+            self.exportacao = None
+            popup.dismiss()
+            if "erro" in resultado:
+                self.mostrar_toast(f"Erro ao exportar: {resultado['erro']}")
+            else:
+                self.mostrar_toast(f"{resultado['transacoes']} transações exportadas\n"
+                                   + "\n".join(os.path.basename(nome)
+                                               for nome in resultado['arquivos']))
+
+        def cancelar(instance):
+            if self.exportacao is not None:
+                self.exportacao.cancelar()
+                self.exportacao = None
+            popup.dismiss()
+            self.mostrar_toast("Exportação cancelada")
+
+        btn_cancelar.bind(on_press=cancelar)
+        # A cópia das colunas é feita aqui; formatar e gravar fica com a thread
+        self.exportacao = self.livro.exportacao(
+            arquivo,
+            ao_progresso=lambda gravadas, total: Clock.schedule_once(
+                lambda dt: mostrar_progresso(gravadas, total)),
+            ao_concluir=lambda resultado: Clock.schedule_once(lambda dt: concluir(resultado)))
+        popup.open()
+        self.exportacao.iniciar()
+
+    def escolher_pasta_sincronizacao(self, instance):
+        """Pede a pasta compartilhada entre os dispositivos (a última usada vem preenchida)"""
+        from kivy.uix.popup import Popup
+
+        content = BoxLayout(orientation='vertical', spacing=dp(10))
+        content.add_widget(Label(
+            text="Pasta compartilhada entre os dispositivos\n(Syncthing, Dropbox, cartão...)",
+            halign='center'
+        ))
+        input_pasta = TextInput(
+            text=self.livro.config.get("pasta_sincronizacao", ""),
+            multiline=False,
+            size_hint_y=None,
+            height=dp(40)
+        )
+        content.add_widget(input_pasta)
+
+        btn_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=dp(40))
+
+        def sincronizar(instance):
+            pasta = input_pasta.text.strip()
+            if not pasta:
+                self.mostrar_toast("Informe a pasta!")
+                return
+            popup.dismiss()
+            self.sincronizar(pasta)
+
+        btn_sincronizar = Button(text='Sincronizar')
+        btn_sincronizar.bind(on_press=sincronizar)
+        btn_layout.add_widget(btn_sincronizar)
+
+        btn_cancelar = Button(text='Cancelar')
+        btn_cancelar.bind(on_press=lambda x: popup.dismiss())
+        btn_layout.add_widget(btn_cancelar)
+
+        content.add_widget(btn_layout)
+
+        popup = Popup(
+            title='Sincronizar',
+            content=content,
+            size_hint=(0.9, 0.4)
+        )
+        popup.open()
+
+    def sincronizar(self, pasta):
+        """Mescla os outros dispositivos e grava a réplica deste (só os meses
+        com hash diferente são lidos e gravados)"""
+        if pasta != self.livro.config.get("pasta_sincronizacao"):
+            self.livro.config["pasta_sincronizacao"] = pasta
+            self.livro.salvar_config()
+        try:
+            resumos = self.livro.sincronizar(pasta)
+        except (OSError, ValueError) as e:
+            self.mostrar_toast(f"Erro ao sincronizar: {e}")
+            return
+        self.marcar_sujo("historico", "saldo", "analise")
+        adicionadas = sum(resumo["adicionadas"] for resumo in resumos.values())
+        editadas = sum(resumo["editadas"] for resumo in resumos.values())
+        excluidas = sum(resumo["excluidas"] for resumo in resumos.values())
+        self.mostrar_toast(f"Sincronizado com {len(resumos)} dispositivo(s)\n"
+                           f"{adicionadas} novas, {editadas} editadas, {excluidas} excluídas")
+
+    @instrumentos.cronometrado("historico")
+    def atualizar_historico(self):
+        """Reconstrói a lista do histórico (sem criar widgets)"""
+        if self.filtro:
+            # Só as mais recentes; uma a mais diz se ficaram linhas de fora
+            limite = self.limite_historico
+            ordem = self.livro.buscar(**self.filtro, limite=limite + 1)
+            self.historico_truncado = len(ordem) > limite
+            self.ordem_historico = ordem[1:] if self.historico_truncado else ordem
+            mais = '+' if self.historico_truncado else ''
+            texto = (f'Histórico ({len(self.ordem_historico)}{mais} '
+                     f'de {len(self.livro.historico)})')
+            if "fim" in self.filtro:
+                dia = data_de_minutos(self.filtro["fim"]).split(' ')[0]
+                texto += (f' · saldo em {dia}: '
+                          f'R$ {formatar_centavos(self.livro.saldo_em(self.filtro["fim"]))}')
+            self.label_historico.text = texto
+        else:
+            historico = self.livro.historico
+            self.ordem_historico = historico.ids_vivos()
+            self.linhas_historico = array('i', compress(range(len(historico.vivas)),
+                                                        historico.vivas))
+            self.ids_historico = historico.ids
+            arquivados = len(self.livro.meses_arquivados())
+            self.label_historico.text = (f'Histórico (+{arquivados} meses anteriores ao fim da lista)'
+                                         if arquivados else 'Histórico')
+        self.rv_historico.data = [self.LINHA_HISTORICO] * len(self.ordem_historico)
+
+    def ao_rolar_historico(self, rv, scroll_y):
+        """No fim da lista (transações mais antigas), traz a próxima página da
+        busca ou, sem filtro, carrega o mês arquivado anterior"""
+        if scroll_y > 0:
+            return
+        if self.filtro:
+            if not self.historico_truncado:
+                return
+            self.limite_historico *= 2
+        elif self.livro.meses_arquivados():
+            self.livro.carregar_mes_anterior()
+        else:
+            return
+        linhas_antes = len(self.ordem_historico)
+        self.atualizar_historico()
+        # Mantém à vista as mesmas linhas: as novas entram abaixo delas
+        altura_linha = rv.layout_manager.default_size[1]
+        rolavel_antes = max(linhas_antes * altura_linha - rv.height, 0)
+        rolavel = len(self.ordem_historico) * altura_linha - rv.height
+        if rolavel > 0:
+            rv.scroll_y = 1 - rolavel_antes / rolavel
+
+    def ao_mudar_filtro(self, *args):
+        """Relê a busca e os filtros e agenda a atualização da lista"""
+        self.filtro = self.ler_filtro()
+        self.limite_historico = self.PAGINA_HISTORICO
+        self.marcar_sujo("historico")
+
+    def ler_filtro(self):
+        """Argumentos de LivroCaixa.buscar a partir dos campos (None se vazios);
+        campos incompletos ou inválidos, como uma data ainda sendo digitada, são ignorados"""
+        filtro = {}
+        if self.input_busca.text.strip():
+            filtro["consulta"] = self.input_busca.text
+        for campo, chave in ((self.input_data_inicio, "inicio"), (self.input_data_fim, "fim")):
+            try:
+                filtro[chave] = minutos_de_data(data_de_extrato(campo.text))
+            except (ValueError, IndexError):
+                continue
+            if chave == "fim" and " " not in campo.text.strip():
+                filtro[chave] += 24 * 60 - 1  # até o fim do dia
+        for campo, chave in ((self.input_valor_min, "minimo"), (self.input_valor_max, "maximo")):
+            try:
+                filtro[chave] = abs(centavos_de_texto(campo.text))
+            except ValueError:
+                continue
+        return filtro or None
+
+    def linha_historico(self, posicao):
+        """Dados da linha exibida na posição `posicao` (0 = mais recente)"""
+        transacao_id = self.ordem_historico[len(self.ordem_historico) - 1 - posicao]
+        return self.dados_item_historico(self.encontrar_transacao_por_id(transacao_id))
+
+    def dados_item_historico(self, transacao):
+        """Monta os dados de uma linha do histórico"""
+        centavos = transacao["centavos"]
+        return {
+            "transacao_id": transacao["id"],
+            "descricao": transacao["descricao"],
+            "valor_texto": f'R$ {formatar_centavos(centavos, sinal=True)}',
+            "receita": centavos > 0,
+            "data_texto": transacao["data"].split(' ')[0],  # Só a data
+        }
+
+    def inserir_item_historico(self, transacao_id, linha):
+        """Insere uma nova transação (linha `linha` da loja) no topo da lista"""
+        self.ordem_historico.append(transacao_id)
+        self.linhas_historico.append(linha)
+        self.rv_historico.data.insert(0, self.LINHA_HISTORICO)
+
+    def atualizar_item_historico(self, transacao_id):
+        """Atualiza apenas a linha da transação editada, se estiver visível"""
+        for view in self.rv_historico.layout_manager.children:
+            if view.transacao_id == transacao_id:
+                view.refresh_view_attrs(self.rv_historico, view.indice, self.LINHA_HISTORICO)
+
+    def remover_item_historico(self, linha):
+        """Remove apenas a linha da transação excluída (`linha` da loja), com
+        a posição achada por bisect"""
+        linhas = self.linhas_historico
+        posicao = bisect_left(linhas, linha) if linha is not None else len(linhas)
+        if posicao == len(linhas) or linhas[posicao] != linha:
+            return
+        indice = len(self.ordem_historico) - 1 - posicao
+        del self.ordem_historico[posicao]
+        del linhas[posicao]
+        del self.rv_historico.data[indice]
 
     def encontrar_transacao_por_id(self, transacao_id):
-        """Encontra uma transação pelo ID"""
-        for i, transacao in enumerate(self.historico):
-            if transacao.get("id") == transacao_id:
-                return i, transacao
-        return -1, None
+        """Encontra uma transação pelo ID (O(1))"""
+        return self.livro.obter(transacao_id)
 
     def editar_transacao(self, transacao_id):
         """Edita uma transação"""
-        indice, transacao = self.encontrar_transacao_por_id(transacao_id)
+        from kivy.uix.popup import Popup
+
+        transacao = self.encontrar_transacao_por_id(transacao_id)
         if transacao is None:
             self.mostrar_toast("Transação não encontrada!")
             return
@@ -383,7 +1313,7 @@ class DucFinancasApp(App):
 
         # Campos de edição
         input_valor = TextInput(
-            text=str(transacao["valor"]),
+            text=formatar_centavos(transacao["centavos"]),
             hint_text='Valor',
             multiline=False,
             input_filter='float',
@@ -406,21 +1336,31 @@ class DucFinancasApp(App):
 
         def salvar_edicao(instance):
             try:
-                novo_valor = float(input_valor.text)
+                novos_centavos = centavos_de_texto(input_valor.text)
                 nova_desc = input_desc.text.strip()
 
                 if not nova_desc:
                     self.mostrar_toast("Descrição não pode estar vazia!")
                     return
 
-                self.historico[indice]["valor"] = novo_valor
-                self.historico[indice]["descricao"] = nova_desc
-                self.historico[indice]["data_edicao"] = datetime.now().strftime("%d/%m/%Y %H:%M")
+                # O ID é o handle estável: revalida caso a transação tenha
+                # sido excluída enquanto o popup estava aberto
+                if self.encontrar_transacao_por_id(transacao_id) is None:
+                    popup.dismiss()
+                    self.mostrar_toast("Transação não encontrada!")
+                    return
 
-                self.salvar_dados()
-                self.atualizar_historico()
-                self.atualizar_saldo()
-                self.gerar_analise()
+                if not self.registrar_operacao({
+                    "op": "edit",
+                    "id": transacao_id,
+                    "campos": {
+                        "valor": novos_centavos / 100,
+                        "descricao": nova_desc,
+                        "data_edicao": datetime.now().strftime("%d/%m/%Y %H:%M")
+                    }
+                }):
+                    popup.dismiss()
+                    return
 
                 popup.dismiss()
                 self.mostrar_toast("Transação editada!")
@@ -449,7 +1389,9 @@ class DucFinancasApp(App):
 
     def confirmar_exclusao(self, transacao_id):
         """Confirma a exclusão de uma transação"""
-        indice, transacao = self.encontrar_transacao_por_id(transacao_id)
+        from kivy.uix.popup import Popup
+
+        transacao = self.encontrar_transacao_por_id(transacao_id)
         if transacao is None:
             self.mostrar_toast("Transação não encontrada!")
             return
@@ -458,7 +1400,7 @@ class DucFinancasApp(App):
         content = BoxLayout(orientation='vertical', spacing=dp(10))
 
         content.add_widget(Label(
-            text=f"Excluir '{transacao['descricao']}'\n(R$ {transacao['valor']:.2f})?",
+            text=f"Excluir '{transacao['descricao']}'\n(R$ {formatar_centavos(transacao['centavos'])})?",
             text_size=(dp(250), None),
             halign='center'
         ))
@@ -468,11 +1410,14 @@ class DucFinancasApp(App):
 
         def excluir(instance):
             try:
-                self.historico.pop(indice)
-                self.salvar_dados()
-                self.atualizar_historico()
-                self.atualizar_saldo()
-                self.gerar_analise()
+                if self.encontrar_transacao_por_id(transacao_id) is None:
+                    popup.dismiss()
+                    self.mostrar_toast("Transação não encontrada!")
+                    return
+
+                if not self.registrar_operacao({"op": "del", "id": transacao_id}):
+                    popup.dismiss()
+                    return
                 popup.dismiss()
                 self.mostrar_toast("Transação excluída!")
             except Exception as e:
@@ -497,6 +1442,8 @@ class DucFinancasApp(App):
 
     def confirmar_limpeza(self, instance):
         """Confirma a limpeza de todo o histórico"""
+        from kivy.uix.popup import Popup
+
         content = BoxLayout(orientation='vertical', spacing=dp(10))
 
         content.add_widget(Label(
@@ -507,11 +1454,9 @@ class DucFinancasApp(App):
         btn_layout = BoxLayout(orientation='horizontal')
 
         def limpar(instance):
-            self.historico.clear()
-            self.salvar_dados()
-            self.atualizar_historico()
-            self.atualizar_saldo()
-            self.gerar_analise()
+            if not self.registrar_operacao({"op": "clear"}):
+                popup.dismiss()
+                return
             popup.dismiss()
             self.mostrar_toast("Histórico limpo!")
 
@@ -532,124 +1477,121 @@ class DucFinancasApp(App):
         )
         popup.open()
 
+    @instrumentos.cronometrado("analise")
     def gerar_analise(self):
         """Gera a análise de gastos"""
-        self.analise_layout.clear_widgets()
+        # Aba ainda não aberta: será gerada na primeira ativação
+        if self.analise_layout is None:
+            return
 
-        # Analisa gastos por tópico e mês
-        dados_analise = defaultdict(lambda: defaultdict(lambda: {"quantidade": 0, "total": 0.0}))
+        # Agregados por mês e tópico, mantidos incrementalmente, mais os gastos
+        # recorrentes previstos para os próximos meses
+        dados_analise = self.livro.analise_prevista()
+        layout = self.analise_layout
 
-        for transacao in self.historico:
-            if transacao["valor"] < 0:  # Apenas gastos
-                try:
-                    data_str = transacao["data"].split(" ")[0]
-                    dia, mes, ano = data_str.split("/")
+        # Cartões de meses que deixaram de ter gastos voltam ao pool
+        for mes_key in [mes_key for mes_key in self.cartoes_mes if mes_key not in dados_analise]:
+            cartao = self.cartoes_mes.pop(mes_key)
+            layout.remove_widget(cartao)
+            self.cartoes_livres.append(cartao)
 
-                    chave_mes = f"{ano}-{mes.zfill(2)}"
-                    topico = transacao["descricao"].lower().strip()
+        if not dados_analise:
+            if self.label_sem_gastos.parent is None:
+                layout.add_widget(self.label_sem_gastos)
+        elif self.label_sem_gastos.parent is not None:
+            layout.remove_widget(self.label_sem_gastos)
+
+        # Cartões dos meses (mais recentes primeiro): os existentes só são
+        # redesenhados se os totais mudaram; meses novos entram na sua posição
+        meses_cronologicos = sorted(dados_analise)
+        for posicao, mes_key in enumerate(reversed(meses_cronologicos)):
+            cartao = self.cartoes_mes.get(mes_key)
+            if cartao is None:
+                cartao = self.cartoes_livres.pop() if self.cartoes_livres else CartaoMes()
+                self.cartoes_mes[mes_key] = cartao
+                layout.add_widget(cartao, index=len(layout.children) - posicao)
+            cartao.definir(mes_key, dados_analise[mes_key])
+
+        self.grafico_meses.definir((mes_key, self.cartoes_mes[mes_key].total)
+                                   for mes_key in meses_cronologicos)
+
+    def abrir_estatisticas(self):
+        """Abre o relatório de tendências e estatísticas, calculado numa thread"""
+        from kivy.uix.popup import Popup
+        from kivy.uix.scrollview import ScrollView
 
-                    dados_analise[chave_mes][topico]["quantidade"] += 1
-                    dados_analise[chave_mes][topico]["total"] += abs(transacao["valor"])
+        content = BoxLayout(orientation='vertical', spacing=dp(10))
+        # Uma Label por bloco de linhas: cada textura é desenhada num quadro diferente
+        self.layout_estatisticas = BoxLayout(orientation='vertical', size_hint_y=None)
+        self.layout_estatisticas.bind(minimum_height=self.layout_estatisticas.setter('height'))
+        self.layout_estatisticas.add_widget(self.criar_secao_estatisticas('Calculando...'))
+        scroll = ScrollView()
+        scroll.add_widget(self.layout_estatisticas)
+        content.add_widget(scroll)
 
-                except Exception as e:
-                    print(f"Erro ao processar transação: {e}")
-                    continue
+        btn_fechar = Button(text='Fechar', size_hint_y=None, height=dp(50))
+        content.add_widget(btn_fechar)
 
-        if not dados_analise:
-            self.analise_layout.add_widget(Label(
-                text="Nenhum gasto encontrado para análise.",
-                halign='center'
-            ))
+        popup = Popup(
+            title='Estatísticas',
+            content=content,
+            size_hint=(0.95, 0.9)
+        )
+        btn_fechar.bind(on_press=lambda x: popup.dismiss())
+        popup.bind(on_dismiss=lambda x: self.fechar_estatisticas())
+        self.popup_estatisticas = popup
+        popup.open()
+        self.calcular_estatisticas()
+
+    def calcular_estatisticas(self):
+        """(Re)inicia o cálculo sobre uma cópia dos dados, cancelando o anterior"""
+        if self.relatorio_estatistico is not None:
+            self.relatorio_estatistico.cancelar()
+        relatorio = RelatorioEstatistico(self.livro.instantaneo())
+        relatorio.ao_concluir = lambda resultado: Clock.schedule_once(
+            lambda dt: self.mostrar_estatisticas(relatorio, resultado))
+        self.relatorio_estatistico = relatorio
+        self.popup_estatisticas.title = 'Estatísticas (calculando...)'
+        relatorio.iniciar()
+
+    def mostrar_estatisticas(self, relatorio, resultado):
+        """Exibe o resultado, se ainda for o do cálculo mais recente"""
+        if relatorio is not self.relatorio_estatistico or self.popup_estatisticas is None:
             return
-
-        # Ordena meses (mais recentes primeiro)
-        meses_ordenados = sorted(dados_analise.keys(), reverse=True)
-
-        for mes_key in meses_ordenados:
-            ano, mes = mes_key.split("-")
-            nome_mes = month_name[int(mes)] if int(mes) <= 12 else "Mês inválido"
-
-            # Container do mês
-            mes_layout = BoxLayout(
-                orientation='vertical',
-                size_hint_y=None,
-                spacing=dp(5),
-                padding=dp(10)
-            )
-
-            # Canvas com fundo
-            with mes_layout.canvas.before:
-                Color(0.1, 0.1, 0, 1)
-                self.rect_mes = Rectangle(size=mes_layout.size, pos=mes_layout.pos)
-
-            def update_rect_mes(instance, value):
-                self.rect_mes.pos = instance.pos
-                self.rect_mes.size = instance.size
-
-            mes_layout.bind(pos=update_rect_mes, size=update_rect_mes)
-
-            # Título do mês
-            total_mes = sum(info['total'] for info in dados_analise[mes_key].values())
-            total_transacoes = sum(info['quantidade'] for info in dados_analise[mes_key].values())
-
-            mes_layout.add_widget(Label(
-                text=f"{nome_mes} {ano}\n{len(dados_analise[mes_key])} categorias | {total_transacoes} transações | R$ {total_mes:.2f}",
-                font_size='14sp',
-                bold=True,
-                size_hint_y=None,
-                height=dp(50),
-                halign='center'
-            ))
-
-            # Ordena tópicos por quantidade
-            topicos_ordenados = sorted(
-                dados_analise[mes_key].items(),
-                key=lambda x: x[1]["quantidade"],
-                reverse=True
-            )
-
-            # Lista os tópicos
-            for topico, info in topicos_ordenados:
-                item_layout = BoxLayout(
-                    orientation='horizontal',
-                    size_hint_y=None,
-                    height=dp(30)
-                )
-
-                item_layout.add_widget(Label(
-                    text=topico.title(),
-                    font_size='12sp',
-                    size_hint_x=0.5,
-                    halign='left'
-                ))
-
-                item_layout.add_widget(Label(
-                    text=f"{info['quantidade']}x",
-                    font_size='11sp',
-                    size_hint_x=0.2,
-                    halign='center',
-                    color=get_color_from_hex('#2196F3')  # Azul
-                ))
-
-                item_layout.add_widget(Label(
-                    text=f"R$ {info['total']:.2f}",
-                    font_size='11sp',
-                    size_hint_x=0.3,
-                    bold=True,
-                    halign='right',
-                    color=get_color_from_hex('#F44336')  # Vermelho
-                ))
-
-                mes_layout.add_widget(item_layout)
-
-            # Calcula altura do layout do mês
-            altura_mes = dp(50) + (len(topicos_ordenados) * dp(30)) + dp(20)
-            mes_layout.height = altura_mes
-
-            self.analise_layout.add_widget(mes_layout)
-
-            # Separador
-            self.analise_layout.add_widget(Label(text='', size_hint_y=None, height=dp(10)))
+        self.relatorio_estatistico = None
+        self.popup_estatisticas.title = 'Estatísticas'
+        if "erro" in resultado:
+            secoes = [[f"Erro ao calcular: {resultado['erro']}"]]
+        else:
+            secoes = secoes_estatisticas(resultado)
+        # Seções separadas por uma linha em branco, em blocos de poucas linhas
+        linhas = [linha for secao in secoes for linha in [""] + secao][1:]
+        blocos = [linhas[inicio:inicio + self.LINHAS_POR_BLOCO]
+                  for inicio in range(0, len(linhas), self.LINHAS_POR_BLOCO)]
+        self.layout_estatisticas.clear_widgets()
+        self.exibir_blocos_estatisticas(blocos)
+
+    def criar_secao_estatisticas(self, texto):
+        label = Label(text=texto, font_size='12sp', halign='left', valign='top',
+                      size_hint_y=None)
+        label.bind(width=lambda label, largura: setattr(label, 'text_size', (largura, None)),
+                   texture_size=lambda label, tamanho: setattr(label, 'height', tamanho[1]))
+        return label
+
+    def exibir_blocos_estatisticas(self, blocos, posicao=0):
+        """Acrescenta um bloco por quadro (a textura de um texto longo é cara)"""
+        if self.popup_estatisticas is None or self.relatorio_estatistico is not None:
+            return  # fechado, ou um novo cálculo já substituiu este resultado
+        self.layout_estatisticas.add_widget(
+            self.criar_secao_estatisticas("\n".join(blocos[posicao])))
+        if posicao + 1 < len(blocos):
+            Clock.schedule_once(lambda dt: self.exibir_blocos_estatisticas(blocos, posicao + 1))
+
+    def fechar_estatisticas(self):
+        if self.relatorio_estatistico is not None:
+            self.relatorio_estatistico.cancelar()
+            self.relatorio_estatistico = None
+        self.popup_estatisticas = None
 
 # Executa o app
 if __name__ == "__main__":
@@ -0,0 +1,526 @@
+"""Benchmark reproduzível do DuC Finanças com históricos sintéticos
+
+Gera históricos determinísticos (mesma semente, mesmos dados) com muitos
+meses, categorias com distribuição enviesada, edições e exclusões, e mede
+as operações mais sensíveis ao tamanho do histórico. Os caminhos com
+widgets rodam com o backend gráfico "mock" do Kivy (sem GPU nem monitor).
+
+Uso:
+    python benchmarks/bench_financas.py                      # 1k, 10k e 100k
+    python benchmarks/bench_financas.py -n 1000000 -o 1m.json
+    python benchmarks/bench_financas.py --armazenamento sqlite
+    python benchmarks/bench_financas.py --comparar antes.json -o depois.json
+"""
+import argparse
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Precisa vir antes de qualquer import do Kivy
+os.environ.setdefault("KIVY_GL_BACKEND", "mock")
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+os.environ.setdefault("KIVY_NO_FILELOG", "1")
+
+from kivy.config import Config
+
+# Sem limite de FPS: cada quadro forçado pelo benchmark roda imediatamente
+Config.set("graphics", "maxfps", "0")
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import Kivy  # noqa: E402
+import livro_caixa  # noqa: E402
+
+
+TAMANHOS_PADRAO = (1000, 10000, 100000)
+FIM_HISTORICO = datetime(2025, 12, 31, 23, 59)
+
+# Gastos frequentes primeiro: o peso de cada categoria cai como 1/k^1.2 (Zipf)
+CATEGORIAS = [
+    "Mercado", "Padaria", "Uber", "iFood", "Farmácia", "Posto", "Restaurante",
+    "Feira", "Streaming", "Estacionamento", "Academia", "Luz", "Água",
+    "Internet", "Aluguel", "Cinema", "Pet shop", "Livraria", "Presentes", "Viagem",
+] + [f"Loja {k}" for k in range(1, 181)]
+RECEITAS = ["Salário", "Freelance", "Reembolso", "Rendimentos"]
+FRACAO_RECEITAS = 0.08
+FRACAO_EDICOES = 0.02
+FRACAO_EXCLUSOES = 0.01
+# Operações deixadas no diário (o resto já está no snapshot), abaixo do
+# limite em que o app compactaria
+OPERACOES_NO_DIARIO = livro_caixa.DiarioTransacoes.LIMITE_COMPACTACAO - 100
+
+
+def formatar_data(momento):
+    return momento.strftime("%d/%m/%Y %H:%M")
+
+
+def variar_descricao(rng, descricao):
+    """Variações de digitação que a análise precisa agrupar no mesmo tópico"""
+    sorteio = rng.random()
+    if sorteio < 0.05:
+        return descricao.lower()
+    if sorteio < 0.08:
+        return descricao.upper()
+    if sorteio < 0.10:
+        return descricao + " "
+    return descricao
+
+
+def gerar_historico(quantidade, semente):
+    """Gera (transacoes, operacoes) determinísticas para `quantidade` transações"""
+    rng = random.Random(f"{semente}:{quantidade}")
+
+    # ~400 transações por mês, entre 1 e 20 anos de histórico
+    meses = max(12, min(240, quantidade // 400))
+    inicio = FIM_HISTORICO - timedelta(days=meses * 30)
+    minutos_total = meses * 30 * 24 * 60
+    momentos = sorted(rng.randrange(minutos_total) for _ in range(quantidade))
+
+    pesos = [1 / (k + 1) ** 1.2 for k in range(len(CATEGORIAS))]
+    categorias = rng.choices(CATEGORIAS, weights=pesos, k=quantidade)
+
+    transacoes = []
+    for i, (minuto, categoria) in enumerate(zip(momentos, categorias)):
+        if rng.random() < FRACAO_RECEITAS:
+            descricao = rng.choice(RECEITAS)
+            valor = round(rng.uniform(200, 8000), 2)
+        else:
+            descricao = categoria
+            valor = -round(min(rng.lognormvariate(3.5, 1.0), 20000), 2)
+        transacoes.append({
+            "id": 1_600_000_000_000_000 + i,
+            "valor": valor,
+            "descricao": variar_descricao(rng, descricao),
+            "data": formatar_data(inicio + timedelta(minutes=minuto)),
+        })
+
+    # Edições e exclusões sobre IDs sorteados, na ordem em que aconteceriam
+    operacoes = []
+    ids = [t["id"] for t in transacoes]
+    excluidos = set()
+    for transacao_id in rng.sample(ids, int(quantidade * FRACAO_EXCLUSOES)):
+        excluidos.add(transacao_id)
+        operacoes.append({"op": "del", "id": transacao_id})
+    editaveis = [transacao_id for transacao_id in ids if transacao_id not in excluidos]
+    for transacao_id in rng.sample(editaveis, int(quantidade * FRACAO_EDICOES)):
+        campos = {"data_edicao": formatar_data(FIM_HISTORICO)}
+        if rng.random() < 0.7:
+            campos["valor"] = -round(rng.lognormvariate(3.5, 1.0), 2)
+        if rng.random() < 0.5:
+            campos["descricao"] = rng.choices(CATEGORIAS, weights=pesos)[0]
+        operacoes.append({"op": "edit", "id": transacao_id, "campos": campos})
+    rng.shuffle(operacoes)
+    return transacoes, operacoes
+
+
+def preparar_arquivos(pasta, transacoes, operacoes, armazenamento):
+    """Grava o histórico como o app o deixaria: snapshot + diário curto"""
+    loja = livro_caixa.LojaTransacoes()
+    for transacao in transacoes:
+        loja.adicionar(transacao)
+    indice = livro_caixa.IndiceAnalise.construir(loja)
+
+    no_snapshot = operacoes[:-OPERACOES_NO_DIARIO] if len(operacoes) > OPERACOES_NO_DIARIO else []
+    no_diario = operacoes[len(no_snapshot):]
+    if armazenamento == "particoes":
+        # Como no uso real, o diário só tem alterações dos meses recentes
+        # (as demais já foram compactadas); senão todo mês seria carregado
+        def mes(operacao):
+            return livro_caixa.mes_de_minutos(loja.minutos[loja.obter(operacao["id"]).linha])
+
+        recentes = set(sorted({mes(operacao) for operacao in operacoes})
+                       [-livro_caixa.ParticoesMensais.MESES_RECENTES:])
+        no_diario = [operacao for operacao in operacoes if mes(operacao) in recentes]
+        no_diario = no_diario[-OPERACOES_NO_DIARIO:]
+        ids_no_diario = {operacao["id"] for operacao in no_diario}
+        no_snapshot = [operacao for operacao in operacoes if operacao["id"] not in ids_no_diario]
+    for operacao in no_snapshot:
+        transacao = loja.obter(operacao["id"])
+        indice.remover(transacao)
+        if operacao["op"] == "del":
+            loja.remover(operacao["id"])
+        else:
+            loja.editar(operacao["id"], operacao["campos"])
+            indice.adicionar(transacao)
+
+    if armazenamento == "sqlite":
+        arquivo = os.path.join(pasta, "dados.db")
+        destino = livro_caixa.BancoSQLite(arquivo)
+        destino.importar(loja, "benchmark")
+    elif armazenamento == "particoes":
+        arquivo = os.path.join(pasta, "dados.particoes")
+        destino = livro_caixa.ParticoesMensais(arquivo)
+        destino.compactar(loja, indice.exportar(), em_segundo_plano=False)
+        # Como o app grava: edições e exclusões levam o mês da transação
+        no_diario = [dict(operacao, mes=mes(operacao)) for operacao in no_diario]
+    else:
+        arquivo = os.path.join(pasta, "dados.json")
+        destino = livro_caixa.DiarioTransacoes(arquivo)
+        destino.compactar(loja, indice.exportar(), em_segundo_plano=False)
+    destino.registrar_lote([destino.numerar(operacao) for operacao in no_diario])
+    if armazenamento == "sqlite":
+        destino.conexao.close()
+    return arquivo
+
+
+def criar_app(pasta, arquivo):
+    app = Kivy.DucFinancasApp()
+    app.arquivo_dados = arquivo
+    app.arquivo_config = os.path.join(pasta, "config.json")
+    return app
+
+
+def cronometrar(funcao, repeticoes, preparar=None, por_chamada=1):
+    """Mediana e mínimo de `repeticoes` execuções (em segundos por chamada)"""
+    tempos = []
+    for _ in range(repeticoes):
+        argumento = preparar() if preparar else None
+        inicio = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            funcao(argumento) if preparar else funcao()
+        tempos.append((time.perf_counter() - inicio) / por_chamada)
+    return {
+        "mediana_s": statistics.median(tempos),
+        "minimo_s": min(tempos),
+        "repeticoes": repeticoes,
+    }
+
+
+def pico_memoria(funcao, preparar=None):
+    """Pico de memória alocada (tracemalloc) durante uma execução, em bytes"""
+    argumento = preparar() if preparar else None
+    tracemalloc.start()
+    try:
+        with redirect_stdout(io.StringIO()):
+            funcao(argumento) if preparar else funcao()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def medir(nome, medicoes, funcao, repeticoes, preparar=None, por_chamada=1):
+    resultado = cronometrar(funcao, repeticoes, preparar, por_chamada)
+    resultado["pico_memoria_bytes"] = pico_memoria(funcao, preparar)
+    medicoes[nome] = resultado
+    print(f"  {nome:<28} {resultado['mediana_s'] * 1e6:>12.1f} µs"
+          f"  (mín {resultado['minimo_s'] * 1e6:.1f} µs, "
+          f"pico {resultado['pico_memoria_bytes'] / 1e6:.1f} MB)")
+
+
+def obter_janela():
+    """Janela do Kivy (None se nenhum provedor de janela estiver disponível)"""
+    try:
+        from kivy.core.window import Window
+    except Exception:
+        return None
+    return Window
+
+
+def processar_quadros(quantidade=3):
+    from kivy.base import EventLoop
+    for _ in range(quantidade):
+        EventLoop.idle()
+
+
+def medir_tamanho(quantidade, args, pasta):
+    print(f"\n{quantidade} transações")
+    inicio = time.perf_counter()
+    transacoes, operacoes = gerar_historico(quantidade, args.semente)
+    arquivo = preparar_arquivos(pasta, transacoes, operacoes, args.armazenamento)
+    print(f"  (histórico gerado em {time.perf_counter() - inicio:.1f} s)")
+    medicoes = {}
+    repeticoes = args.repeticoes
+
+    # Carga: um app novo por execução, como numa abertura do aplicativo
+    def carregar(app):
+        app.carregar_dados()
+        app.livro.encerrar()
+
+    medir("carregar_dados", medicoes, carregar, repeticoes,
+          preparar=lambda: criar_app(pasta, arquivo))
+
+    # Memória que o histórico carregado continua ocupando depois da carga
+    app = criar_app(pasta, arquivo)
+    tracemalloc.start()
+    with redirect_stdout(io.StringIO()):
+        app.carregar_dados()
+    memoria_historico = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    app.livro.encerrar()
+
+    medir("salvar_dados", medicoes, app.salvar_dados, repeticoes)
+
+    # Buscas por ID: 10% de IDs inexistentes
+    rng = random.Random(args.semente)
+    ids = [t["id"] for t in transacoes]
+    consultas = [rng.choice(ids) if rng.random() < 0.9 else -1 for _ in range(10000)]
+
+    def buscar():
+        for transacao_id in consultas:
+            app.encontrar_transacao_por_id(transacao_id)
+
+    medir("encontrar_transacao_por_id", medicoes, buscar, repeticoes,
+          por_chamada=len(consultas))
+
+    # Busca a cada tecla (o índice é montado antes, na primeira busca)
+    teclas = ["mercado"[:i] for i in range(1, 8)]
+    app.livro.buscar(teclas[0])
+
+    def digitar():
+        for consulta in teclas:
+            app.livro.buscar(consulta)
+
+    medir("buscar_por_tecla", medicoes, digitar, repeticoes, por_chamada=len(teclas))
+
+    # Pior caso por tecla: prefixos que casam com quase tudo e filtros sem
+    # texto, com a primeira página da lista do app (limite + 1, como ela pede)
+    limite = app.PAGINA_HISTORICO + 1
+    ultimo = max(app.livro.historico.minutos)
+    piores = [
+        {"consulta": "l"},
+        {"consulta": "loja 1"},
+        {"minimo": 1000},
+        {"consulta": "l", "inicio": ultimo - 365 * 1440, "fim": ultimo},
+    ]
+    medir("buscar_por_tecla_pior_caso", medicoes,
+          lambda: [app.livro.buscar(**filtro, limite=limite) for filtro in piores],
+          repeticoes, por_chamada=len(piores))
+
+    # Saldo numa data e totais de período (o índice por dia é montado antes)
+    datas = [livro_caixa.minutos_de_data(t["data"]) for t in rng.sample(transacoes, 1000)]
+    medir("montar_indice_datas", medicoes,
+          lambda: livro_caixa.IndiceDatas.construir(app.livro.historico), repeticoes)
+    app.livro.datas()
+    medir("saldo_em", medicoes, lambda: [app.livro.saldo_em(data) for data in datas],
+          repeticoes, por_chamada=len(datas))
+    medir("totais_periodo", medicoes,
+          lambda: [app.livro.totais_periodo(data, data + 30 * 1440) for data in datas],
+          repeticoes, por_chamada=len(datas))
+
+    # Troca das regras de categorização (ida e volta): só os gastos das
+    # descrições afetadas mudam de balde
+    regras = [{"categoria": "Mercado", "palavras": ["mercado", "feira"], "prefixos": ["padar"]},
+              {"categoria": "Transporte", "palavras": ["uber", "posto", "estacionamento"]}]
+
+    def trocar_regras():
+        app.livro.recategorizar(regras)
+        app.livro.recategorizar([])
+
+    medir("recategorizar", medicoes, trocar_regras, repeticoes, por_chamada=2)
+
+    # Relatório de estatísticas (roda numa thread no app; aqui, direto):
+    # cópia das colunas na thread da UI + cálculo
+    medir("instantaneo_estatisticas", medicoes, app.livro.instantaneo, repeticoes)
+    medir("calcular_estatisticas", medicoes,
+          lambda: livro_caixa.RelatorioEstatistico(app.livro.instantaneo()).processar(),
+          repeticoes)
+
+    # Sincronização com outro dispositivo que tem o mesmo histórico e, a
+    # cada rodada, cinco transações editadas: só os meses com hash
+    # diferente são lidos, mesclados e regravados na pasta
+    medir("montar_hashes_mensais", medicoes,
+          lambda: livro_caixa.IndiceHashes.construir(app.livro.historico, app.livro.lapides),
+          repeticoes)
+    pasta_sync = os.path.join(pasta, "sync")
+    with redirect_stdout(io.StringIO()):
+        app.livro.carregar_tudo()
+        outro = livro_caixa.LivroCaixa(os.path.join(pasta, "outro", "dados.json"),
+                                       os.path.join(pasta, "outro", "config.json"))
+        os.makedirs(os.path.dirname(outro.arquivo_dados), exist_ok=True)
+        outro.carregar()
+        vivas = list(app.livro.historico.como_dicts())
+        for posicao in range(0, len(vivas), 1000):
+            outro.registrar_operacao({"op": "lote", "transacoes": vivas[posicao:posicao + 1000]})
+        outro.sincronizar(pasta_sync)
+        app.livro.sincronizar(pasta_sync)
+    edicoes = iter(range(10 ** 6))
+
+    def alterar_outro():
+        with redirect_stdout(io.StringIO()):
+            for transacao in rng.sample(vivas, 5):
+                momento = FIM_HISTORICO + timedelta(minutes=next(edicoes))
+                outro.registrar_operacao({"op": "edit", "id": transacao["id"], "campos": {
+                    "valor": rng.randint(-50000, -1) / 100, "data_edicao": formatar_data(momento)}})
+            outro.sincronizar(pasta_sync)
+
+    medir("sincronizar_5_alteracoes", medicoes, lambda _: app.livro.sincronizar(pasta_sync),
+          repeticoes, preparar=alterar_outro)
+    outro.encerrar()
+
+    # Inclusão de gastos (registro + gravação enfileirada) sem e com orçamentos
+    # em todas as categorias: o aviso só compara os baldes tocados
+    minutos_gasto = livro_caixa.minutos_de_data(formatar_data(FIM_HISTORICO))
+
+    def incluir_gastos():
+        for posicao in range(100):
+            app.livro.registrar_operacao({"op": "add", "transacao": app.livro.nova_transacao(
+                -1234, CATEGORIAS[posicao % 20], minutos_gasto)})
+
+    medir("incluir_gasto", medicoes, incluir_gastos, repeticoes, por_chamada=100)
+    mes_gasto = livro_caixa.mes_de_minutos(minutos_gasto)
+    app.livro.orcamentos = {categoria: max(1, info[1]) for categoria, info
+                            in app.livro.indice_analise.meses[mes_gasto].items()}
+    app.livro.ao_alertar_orcamento = lambda *alerta: None
+    medir("incluir_gasto_com_orcamentos", medicoes, incluir_gastos, repeticoes, por_chamada=100)
+    app.livro.orcamentos, app.livro.ao_alertar_orcamento = {}, None
+
+    # Previsões com 20 regras recorrentes: contadas por regra, sem gerar transações
+    app.livro.recorrencias = {
+        posicao: livro_caixa.Recorrencia(posicao, CATEGORIAS[posicao], -(posicao + 1) * 1000,
+                                         livro_caixa.FREQUENCIAS[posicao % 3], posicao % 3 + 1,
+                                         minutos_gasto - 365 * 1440, ate=minutos_gasto)
+        for posicao in range(20)}
+    medir("saldo_previsto_um_ano", medicoes,
+          lambda: app.livro.saldo_previsto(minutos_gasto + 365 * 1440), repeticoes)
+    medir("analise_prevista", medicoes, app.livro.analise_prevista, repeticoes)
+    app.livro.recorrencias = {}
+
+    # Exportação em blocos (na thread do app; aqui, direto): CSV com a análise
+    # ao lado e o relatório HTML, sem montar o arquivo inteiro na memória
+    for formato in ("csv", "html"):
+        medir(f"exportar_{formato}", medicoes, lambda formato=formato: app.livro.exportar(
+            os.path.join(pasta, f"exportacao.{formato}"), formato), repeticoes)
+
+    janela = obter_janela()
+    if janela is None:
+        print("  (sem provedor de janela: caminhos com widgets pulados)")
+        medicoes["widgets"] = {"pulado": "nenhum provedor de janela disponível"}
+    else:
+        medir_widgets(app, janela, medicoes, repeticoes)
+        app.on_stop()
+    return {
+        "transacoes": quantidade,
+        "operacoes": len(operacoes),
+        "memoria_historico_bytes": memoria_historico,
+        "medicoes": medicoes,
+    }
+
+
+def medir_widgets(app, janela, medicoes, repeticoes):
+    """Mede os caminhos que mexem em widgets, com a interface montada"""
+    with redirect_stdout(io.StringIO()):
+        raiz = app.build()
+    janela.add_widget(raiz)
+    processar_quadros()
+    try:
+        medir("atualizar_saldo", medicoes,
+              lambda: [app.atualizar_saldo() for _ in range(1000)],
+              repeticoes, por_chamada=1000)
+
+        # Re-renderização do histórico: nova lista + o quadro que cria as linhas
+        def renderizar_historico():
+            app.atualizar_historico()
+            processar_quadros(1)
+
+        medir("renderizar_historico", medicoes, renderizar_historico, repeticoes)
+
+        def rolar_historico():
+            app.rv_historico.scroll_y = random.random()
+            processar_quadros(1)
+
+        medir("rolar_historico", medicoes, rolar_historico, repeticoes * 10)
+
+        # Primeira abertura da aba Análise monta o contêiner e gera os cartões
+        app.tab_panel.switch_to(app.tab_analise)
+        processar_quadros()
+
+        def gerar_analise():
+            app.gerar_analise()
+            processar_quadros(1)
+
+        medir("gerar_analise", medicoes, gerar_analise, repeticoes)
+
+        # Um gasto novo no mês mais recente: só o cartão desse mês deve mudar
+        def analise_apos_gasto():
+            app.livro.aplicar_operacao({"op": "add", "transacao": app.livro.nova_transacao(
+                -1234, "Mercado", livro_caixa.minutos_de_data(formatar_data(FIM_HISTORICO)))})
+            gerar_analise()
+
+        medir("analise_apos_gasto", medicoes, analise_apos_gasto, repeticoes)
+    finally:
+        janela.remove_widget(raiz)
+        processar_quadros(1)
+
+
+def versao_codigo():
+    """Commit atual do repositório (para comparar resultados entre commits)"""
+    try:
+        return subprocess.run(
+            ["git", "-C", RAIZ, "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(anterior, atual):
+    """Mostra a variação das medianas em relação a um resultado anterior"""
+    print(f"\nComparação com {anterior.get('commit')} -> {atual.get('commit')}")
+    for tamanho, resultado in atual["resultados"].items():
+        base = anterior["resultados"].get(tamanho)
+        if base is None:
+            continue
+        print(f"  {tamanho} transações")
+        for nome, medicao in resultado["medicoes"].items():
+            antes = base["medicoes"].get(nome, {}).get("mediana_s")
+            depois = medicao.get("mediana_s")
+            if not antes or depois is None:
+                continue
+            variacao = (depois - antes) / antes * 100
+            alerta = "  <- mais lento" if variacao > 10 else ""
+            print(f"    {nome:<28} {variacao:+7.1f}%{alerta}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do DuC Finanças")
+    parser.add_argument("-n", "--tamanhos", type=int, nargs="+", default=list(TAMANHOS_PADRAO),
+                        help="quantidades de transações a medir (ex.: 1000 10000 1000000)")
+    parser.add_argument("-r", "--repeticoes", type=int, default=5)
+    parser.add_argument("-s", "--semente", type=int, default=42)
+    parser.add_argument("--armazenamento", choices=("json", "sqlite", "particoes"),
+                        default="json")
+    parser.add_argument("-o", "--saida", default="bench_financas.json",
+                        help="arquivo JSON com os resultados")
+    parser.add_argument("--comparar", help="resultado JSON anterior para comparação")
+    args = parser.parse_args()
+
+    resultado = {
+        "commit": versao_codigo(),
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "semente": args.semente,
+        "armazenamento": args.armazenamento,
+        "resultados": {},
+    }
+    for quantidade in args.tamanhos:
+        pasta = tempfile.mkdtemp(prefix="bench_financas_")
+        try:
+            resultado["resultados"][str(quantidade)] = medir_tamanho(quantidade, args, pasta)
+        finally:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados gravados em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            comparar(json.load(f), resultado)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Instrumentação dos caminhos quentes do DuC Finanças
+
+Medições de carga, gravação, saldo, listas, análise e quadros, agregadas
+em histogramas móveis e exportáveis como um trace JSON (formato de eventos
+do Chrome, aberto em chrome://tracing ou ui.perfetto.dev). Desligada, cada
+ponto medido custa só a checagem de um atributo. Liga com a variável de
+ambiente DUC_INSTRUMENTACAO=1, pelo painel do app (F12) ou com --trace na
+linha de comando.
+"""
+from collections import deque
+from contextlib import nullcontext
+import functools
+import json
+import os
+import threading
+import time
+
+
+# Limites superiores dos baldes dos histogramas, em milissegundos
+LIMITES_BALDES_MS = (0.5, 1, 2, 4, 8, 16, 33, 66, 133, 266, 533, 1000, float("inf"))
+
+
+class HistogramaMovel:
+    """Durações recentes de um ponto medido (janela móvel) e totais desde o início"""
+
+    JANELA = 512
+
+    def __init__(self):
+        self.amostras = deque(maxlen=self.JANELA)
+        self.quantidade = 0
+        self.total = 0.0
+        self.maximo = 0.0
+
+    def registrar(self, segundos):
+        self.amostras.append(segundos)
+        self.quantidade += 1
+        self.total += segundos
+        if segundos > self.maximo:
+            self.maximo = segundos
+
+    def resumo(self):
+        """Média e percentis da janela, em milissegundos"""
+        ordenadas = sorted(self.amostras)
+        if not ordenadas:
+            return {"quantidade": self.quantidade}
+
+        def percentil(fracao):
+            return ordenadas[min(len(ordenadas) - 1, int(fracao * len(ordenadas)))] * 1000
+
+        return {
+            "quantidade": self.quantidade,
+            "media_ms": sum(ordenadas) / len(ordenadas) * 1000,
+            "p50_ms": percentil(0.5),
+            "p95_ms": percentil(0.95),
+            "p99_ms": percentil(0.99),
+            "max_janela_ms": ordenadas[-1] * 1000,
+            "max_ms": self.maximo * 1000,
+        }
+
+    def baldes(self):
+        """Contagem da janela por balde (limite superior em ms)"""
+        contagem = [0] * len(LIMITES_BALDES_MS)
+        for segundos in self.amostras:
+            milissegundos = segundos * 1000
+            for posicao, limite in enumerate(LIMITES_BALDES_MS):
+                if milissegundos <= limite:
+                    contagem[posicao] += 1
+                    break
+        return {str(limite): quantidade for limite, quantidade in zip(LIMITES_BALDES_MS, contagem)}
+
+
+class Instrumentacao:
+    """Coleta de medições: histogramas por nome e eventos para o trace.
+
+    Uso: `with instrumentos.medir("nome"):` ou o decorador
+    `@instrumentos.cronometrado("nome")`. Pode ser chamada de qualquer
+    thread (a compactação e o escritor gravam fora da UI).
+    """
+
+    MAX_EVENTOS = 20000
+
+    def __init__(self, ativo=False):
+        self.ativo = ativo
+        self.histogramas = {}
+        self.eventos = deque(maxlen=self.MAX_EVENTOS)
+        self.inicio = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def ativar(self, ativo=True):
+        self.ativo = ativo
+
+    def limpar(self):
+        with self._lock:
+            self.histogramas.clear()
+            self.eventos.clear()
+
+    def registrar(self, nome, inicio, duracao, trilha=None):
+        """Registra uma duração (segundos; `inicio` em perf_counter)"""
+        with self._lock:
+            histograma = self.histogramas.get(nome)
+            if histograma is None:
+                histograma = self.histogramas[nome] = HistogramaMovel()
+            histograma.registrar(duracao)
+            self.eventos.append((nome, inicio, duracao,
+                                 trilha or threading.current_thread().name))
+
+    def medir(self, nome):
+        """Gerenciador de contexto que mede o bloco (nulo se desligada)"""
+        if not self.ativo:
+            return NULO
+        return Medicao(self, nome)
+
+    def cronometrado(self, nome):
+        """Decorador que mede cada chamada da função quando ligada"""
+        def decorador(funcao):
+            @functools.wraps(funcao)
+            def medida(*args, **kwargs):
+                if not self.ativo:
+                    return funcao(*args, **kwargs)
+                inicio = time.perf_counter()
+                try:
+                    return funcao(*args, **kwargs)
+                finally:
+                    self.registrar(nome, inicio, time.perf_counter() - inicio)
+            return medida
+        return decorador
+
+    def resumo(self):
+        """{nome: resumo do histograma}, em ordem alfabética"""
+        with self._lock:
+            return {nome: self.histogramas[nome].resumo() for nome in sorted(self.histogramas)}
+
+    def exportar(self, arquivo):
+        """Grava o trace JSON (eventos + histogramas); retorna quantos eventos"""
+        with self._lock:
+            eventos = list(self.eventos)
+            histogramas = {nome: dict(histograma.resumo(), baldes_ms=histograma.baldes())
+                           for nome, histograma in sorted(self.histogramas.items())}
+        trilhas = {}
+        trace = {
+            "traceEvents": [
+                {"name": nome, "ph": "X", "pid": 1,
+                 "tid": trilhas.setdefault(trilha, len(trilhas) + 1),
+                 "ts": round((inicio - self.inicio) * 1e6, 1), "dur": round(duracao * 1e6, 1)}
+                for nome, inicio, duracao, trilha in eventos
+            ],
+            "displayTimeUnit": "ms",
+            "histogramas": histogramas,
+        }
+        trace["traceEvents"] += [
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": trilha}}
+            for trilha, tid in trilhas.items()
+        ]
+        temporario = arquivo + ".tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(trace, f, ensure_ascii=False)
+        os.replace(temporario, arquivo)
+        return len(eventos)
+
+
+class Medicao:
+    __slots__ = ("instrumentacao", "nome", "inicio")
+
+    def __init__(self, instrumentacao, nome):
+        self.instrumentacao = instrumentacao
+        self.nome = nome
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *excecao):
+        self.instrumentacao.registrar(self.nome, self.inicio, time.perf_counter() - self.inicio)
+        return False
+
+
+NULO = nullcontext()
+
+# Instância usada pelo livro-caixa, pelo app e pela linha de comando
+instrumentos = Instrumentacao(ativo=os.environ.get("DUC_INSTRUMENTACAO") == "1")
@@ -0,0 +1,404 @@
+"""Linha de comando do DuC Finanças, para operações em massa sem interface gráfica
+
+Uso:
+    python duc_cli.py importar extrato.csv extrato.ofx
+    python duc_cli.py exportar historico.csv
+    python duc_cli.py exportar relatorio.html
+    python duc_cli.py relatorio --mes 2025-12 --recalcular
+    python duc_cli.py relatorio --de 01/03/2025 --ate 31/03/2025
+    python duc_cli.py serie --por mes > saldo_mensal.csv
+    python duc_cli.py estatisticas --categorias 20
+    python duc_cli.py regras adicionar Mercado --palavras mercado supermercado --prefixos hortifruti
+    python duc_cli.py orcamentos definir Mercado 800
+    python duc_cli.py recorrencias adicionar Aluguel -1500 --inicio 05/01/2026
+    python duc_cli.py sincronizar ~/Sync/duc
+    python duc_cli.py mesclar ../outro_celular/duc_financas_dados.json --ambos
+    python duc_cli.py compactar
+    python duc_cli.py --trace trace.json relatorio --recalcular
+"""
+import argparse
+from contextlib import redirect_stdout
+import json
+import sys
+import time
+
+from desempenho import instrumentos
+from livro_caixa import (FREQUENCIAS, Exportacao, ImportadorExtrato, LivroCaixa,
+                         RelatorioEstatistico, centavos_de_texto, data_de_extrato, data_de_minutos, formatar_centavos,
+                         intervalo_do_mes, minutos_de_data, secoes_estatisticas)
+
+# Transações por operação "lote" gravada no diário (o mesmo tamanho usado pelo app)
+LOTE_IMPORTACAO = 1000
+
+
+def minutos_do_argumento(texto):
+    """Data da linha de comando (dd/mm/aaaa, aaaa-mm-dd...) em minutos"""
+    try:
+        return minutos_de_data(data_de_extrato(texto))
+    except (ValueError, IndexError):
+        raise argparse.ArgumentTypeError(f"data inválida: {texto}")
+
+
+def importar(livro, args):
+    for arquivo in args.arquivos:
+        inicio = time.perf_counter()
+        try:
+            novas, resumo = ImportadorExtrato(arquivo, livro.historico,
+                                              arquivadas=livro.leitor_arquivadas()).processar()
+        except Exception as e:
+            print(f"{arquivo}: erro ao importar: {e}", file=sys.stderr)
+            return 1
+        for posicao in range(0, len(novas), LOTE_IMPORTACAO):
+            fatia = novas[posicao:posicao + LOTE_IMPORTACAO]
+            livro.registrar_operacao({
+                "op": "lote",
+                "transacoes": [livro.nova_transacao(centavos, descricao, minutos)
+                               for centavos, minutos, descricao in fatia]
+            })
+        print(f"{arquivo}: {len(novas)} transações importadas "
+              f"({resumo['duplicadas']} duplicadas, {resumo['invalidas']} inválidas) "
+              f"em {time.perf_counter() - inicio:.2f} s")
+    return 0
+
+
+def exportar(livro, args):
+    def ao_progresso(gravadas, total):
+        if sys.stderr.isatty():
+            print(f"\r{gravadas}/{total} transações", end="", file=sys.stderr, flush=True)
+
+    resultado = livro.exportacao(args.saida, args.formato, ao_progresso).processar()
+    if sys.stderr.isatty():
+        print(file=sys.stderr)
+    print(f"{resultado['transacoes']} transações exportadas para {', '.join(resultado['arquivos'])}")
+    return 0
+
+
+def relatorio(livro, args):
+    if args.recalcular:
+        totais_ok = livro.validar_totais()
+        analise_divergente = livro.recalcular_analise()
+        if analise_divergente:
+            print("Análise: índice divergente, remontado a partir do histórico")
+        if analise_divergente or not totais_ok:
+            livro.salvar()
+
+    meses = livro.indice_analise.meses
+    selecionados = [args.mes] if args.mes else sorted(meses, reverse=True)
+
+    periodo = None
+    if args.de is not None or args.ate is not None:
+        periodo = livro.totais_periodo(args.de, args.ate)
+
+    if args.json:
+        print(json.dumps({
+            "transacoes": livro.quantidade,
+            "receitas": livro.receitas,
+            "despesas": livro.despesas,
+            "saldo": livro.saldo,
+            "periodo": periodo,
+            "gastos_por_mes": {mes: meses.get(mes, {}) for mes in selecionados},
+        }, ensure_ascii=False, indent=2))
+        return 0
+
+    print(f"Transações: {livro.quantidade}")
+    print(f"Receitas:   R$ {formatar_centavos(livro.receitas)}")
+    print(f"Despesas:   R$ {formatar_centavos(livro.despesas)}")
+    print(f"Saldo:      R$ {formatar_centavos(livro.saldo)}")
+    if periodo is not None:
+        print(f"\nPeríodo:    {periodo['quantidade']} transações")
+        print(f"Receitas:   R$ {formatar_centavos(periodo['receitas'])}")
+        print(f"Despesas:   R$ {formatar_centavos(periodo['despesas'])}")
+        if args.ate is not None:
+            print(f"Saldo em {data_de_minutos(args.ate).split(' ')[0]}: "
+                  f"R$ {formatar_centavos(livro.saldo_em(args.ate))}")
+    for mes in selecionados:
+        topicos = meses.get(mes, {})
+        total = sum(total for quantidade, total in topicos.values())
+        gastos = sum(quantidade for quantidade, total in topicos.values())
+        print(f"\n{mes}  R$ {formatar_centavos(total)} em {gastos} gastos")
+        maiores = sorted(topicos.items(), key=lambda item: item[1][1], reverse=True)
+        for topico, (quantidade, total) in maiores[:args.topicos]:
+            print(f"  {topico[:30]:<30} {quantidade:>5}x  R$ {formatar_centavos(total):>12}")
+    return 0
+
+
+def serie(livro, args):
+    print("data;saldo")
+    for momento, saldo in livro.serie_saldo(args.de, args.ate, args.por):
+        if args.por == "dia":
+            momento = data_de_minutos(momento).split(' ')[0]
+        print(f"{momento};{formatar_centavos(saldo)}")
+    return 0
+
+
+def estatisticas(livro, args):
+    resultado = RelatorioEstatistico(livro.instantaneo()).processar()
+    if args.json:
+        print(json.dumps(resultado, ensure_ascii=False, indent=2))
+    else:
+        secoes = secoes_estatisticas(resultado, args.categorias, args.meses)
+        print("\n\n".join("\n".join(linhas) for linhas in secoes))
+    return 0
+
+
+def descrever_regra(regra):
+    condicoes = []
+    if regra.get("palavras"):
+        condicoes.append("palavras: " + ", ".join(regra["palavras"]))
+    if regra.get("prefixos"):
+        condicoes.append("prefixos: " + ", ".join(regra["prefixos"]))
+    if regra.get("regex"):
+        condicoes.append(f"regex: {regra['regex']}")
+    if regra.get("minimo") is not None:
+        condicoes.append(f"a partir de R$ {regra['minimo']:.2f}")
+    if regra.get("maximo") is not None:
+        condicoes.append(f"até R$ {regra['maximo']:.2f}")
+    return f"{regra['categoria']} <- " + "; ".join(condicoes)
+
+
+def regras(livro, args):
+    atuais = list(livro.regras.regras)
+    if args.acao == "adicionar":
+        regra = {"categoria": args.categoria}
+        for campo in ("palavras", "prefixos", "regex", "minimo", "maximo"):
+            if getattr(args, campo):
+                regra[campo] = getattr(args, campo)
+        atuais.insert(len(atuais) if args.posicao is None else args.posicao - 1, regra)
+    elif args.acao == "remover":
+        if not 1 <= args.numero <= len(atuais):
+            print(f"regra {args.numero} não existe", file=sys.stderr)
+            return 1
+        del atuais[args.numero - 1]
+
+    if args.acao in ("adicionar", "remover"):
+        try:
+            livro.definir_regras(atuais)
+        except ValueError as e:
+            print(f"regra inválida: {e}", file=sys.stderr)
+            return 1
+    for numero, regra in enumerate(livro.regras.regras, 1):
+        print(f"{numero:>3}. {descrever_regra(regra)}")
+    return 0
+
+
+def orcamentos(livro, args):
+    try:
+        if args.acao == "definir":
+            livro.definir_orcamento(args.categoria, args.limite)
+        elif args.acao == "remover":
+            if livro.regras.normalizar_categoria(args.categoria) not in livro.orcamentos:
+                print(f"sem orçamento para {args.categoria}", file=sys.stderr)
+                return 1
+            livro.definir_orcamento(args.categoria, None)
+    except ValueError as e:
+        print(f"orçamento inválido: {e}", file=sys.stderr)
+        return 1
+    mes = args.mes or time.strftime("%Y-%m")
+    print(f"Orçamentos de {mes}:")
+    for categoria, gasto, limite in livro.situacao_orcamentos(mes):
+        print(f"  {categoria:<20} R$ {formatar_centavos(gasto):>10} de R$ "
+              f"{formatar_centavos(limite):>10} ({gasto * 100 // limite}%)")
+    return 0
+
+
+def descrever_frequencia(recorrencia):
+    unidade = {"mensal": "meses", "semanal": "semanas", "dias": "dias"}[recorrencia.frequencia]
+    if recorrencia.intervalo == 1:
+        return "diária" if recorrencia.frequencia == "dias" else recorrencia.frequencia
+    return f"a cada {recorrencia.intervalo} {unidade}"
+
+
+def recorrencias(livro, args):
+    if args.acao == "adicionar":
+        try:
+            recorrencia = livro.adicionar_recorrencia(
+                args.descricao, centavos_de_texto(args.valor), args.frequencia, args.intervalo,
+                args.inicio, args.fim + 1439 if args.fim is not None else None)
+        except ValueError as e:
+            print(f"recorrência inválida: {e}", file=sys.stderr)
+            return 1
+        print(f"recorrência {recorrencia.id} criada")
+    elif args.acao == "remover":
+        if not livro.remover_recorrencia(args.id):
+            print(f"recorrência {args.id} não existe", file=sys.stderr)
+            return 1
+    lancadas = livro.lancar_recorrencias()
+    if lancadas:
+        print(f"{lancadas} ocorrências vencidas lançadas")
+    agora = minutos_de_data(time.strftime("%d/%m/%Y %H:%M"))
+    for recorrencia in livro.recorrencias.values():
+        proxima = recorrencia.proxima(agora)
+        print(f"{recorrencia.id}  {recorrencia.descricao:<20} R$ "
+              f"{formatar_centavos(recorrencia.centavos, sinal=True):>10}  "
+              f"{descrever_frequencia(recorrencia):<18} próxima: "
+              f"{data_de_minutos(proxima)[:10] if proxima is not None else 'encerrada'}")
+    _, fim_mes = intervalo_do_mes(time.strftime("%Y-%m"))
+    print(f"Saldo: R$ {formatar_centavos(livro.saldo)}; previsto no fim do mês: "
+          f"R$ {formatar_centavos(livro.saldo_previsto(fim_mes - 1))}")
+    return 0
+
+
+def descrever_mescla(origem, resumo):
+    if not resumo["meses"]:
+        return f"{origem}: nada a mesclar"
+    return (f"{origem}: {resumo['meses']} meses diferentes; {resumo['adicionadas']} adicionadas, "
+            f"{resumo['editadas']} editadas, {resumo['excluidas']} excluídas")
+
+
+def sincronizar(livro, args):
+    pasta = args.pasta or livro.config.get("pasta_sincronizacao")
+    if not pasta:
+        print("informe a pasta de sincronização (fica gravada na configuração)", file=sys.stderr)
+        return 1
+    if pasta != livro.config.get("pasta_sincronizacao"):
+        livro.config["pasta_sincronizacao"] = pasta
+        livro.salvar_config()
+    inicio = time.perf_counter()
+    resumos = livro.sincronizar(pasta)
+    for dispositivo, resumo in resumos.items():
+        print(descrever_mescla(dispositivo, resumo))
+    print(f"{livro.dispositivo()}: réplica atualizada em {pasta} "
+          f"({time.perf_counter() - inicio:.3f} s)")
+    return 0
+
+
+def mesclar(livro, args):
+    # O outro livro é aberto sem configuração: as regras não importam para a mescla
+    outro = LivroCaixa(args.outro, "")
+    with redirect_stdout(sys.stderr):
+        outro.carregar()
+    try:
+        inicio = time.perf_counter()
+        print(descrever_mescla(args.outro, livro.mesclar(outro)))
+        if args.ambos:
+            print(descrever_mescla(livro.arquivo_dados, outro.mesclar(livro)))
+        print(f"Mescla em {time.perf_counter() - inicio:.3f} s")
+    finally:
+        outro.encerrar()
+    return 0
+
+
+def compactar(livro, args):
+    livro.salvar()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="duc_cli", description="DuC Finanças sem interface")
+    parser.add_argument("--dados", default="duc_financas_dados.json",
+                        help="arquivo de dados (.json, .db ou pasta .particoes)")
+    parser.add_argument("--config", default="duc_financas_config.json")
+    parser.add_argument("--trace", help="grava as medições de desempenho neste JSON")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    cmd = comandos.add_parser("importar", help="importa extratos CSV/OFX (sem duplicar)")
+    cmd.add_argument("arquivos", nargs="+")
+    cmd.set_defaults(executar=importar)
+
+    cmd = comandos.add_parser("exportar", help="exporta o histórico e os gastos por mês e "
+                                               "categoria em CSV, JSON-lines, JSON ou HTML")
+    cmd.add_argument("saida", help="o formato vem da extensão (.csv, .jsonl, .json, .html)")
+    cmd.add_argument("--formato", choices=Exportacao.FORMATOS)
+    cmd.set_defaults(executar=exportar)
+
+    cmd = comandos.add_parser("relatorio", help="saldo e gastos por mês e tópico")
+    cmd.add_argument("--mes", help="só o mês AAAA-MM")
+    cmd.add_argument("--topicos", type=int, default=10, help="tópicos por mês")
+    cmd.add_argument("--recalcular", action="store_true",
+                     help="recalcula totais e análise do zero e grava se divergirem")
+    cmd.add_argument("--de", type=minutos_do_argumento, help="início do período (dd/mm/aaaa)")
+    cmd.add_argument("--ate", type=minutos_do_argumento,
+                     help="fim do período, inclusive; mostra também o saldo nessa data")
+    cmd.add_argument("--json", action="store_true")
+    cmd.set_defaults(executar=relatorio)
+
+    cmd = comandos.add_parser("serie", help="saldo ao fim de cada dia ou mês (CSV)")
+    cmd.add_argument("--por", choices=("dia", "mes"), default="dia")
+    cmd.add_argument("--de", type=minutos_do_argumento)
+    cmd.add_argument("--ate", type=minutos_do_argumento)
+    cmd.set_defaults(executar=serie)
+
+    cmd = comandos.add_parser("estatisticas",
+                              help="tendências anuais, variação mensal e percentis por categoria")
+    cmd.add_argument("--categorias", type=int, default=15, help="categorias exibidas")
+    cmd.add_argument("--meses", type=int, default=12, help="meses exibidos")
+    cmd.add_argument("--json", action="store_true")
+    cmd.set_defaults(executar=estatisticas)
+
+    cmd = comandos.add_parser("regras", help="regras de categorização da análise")
+    acoes = cmd.add_subparsers(dest="acao")
+    acoes.add_parser("listar")
+    acao = acoes.add_parser("adicionar", help="acrescenta uma regra (vale a primeira que casar)")
+    acao.add_argument("categoria")
+    acao.add_argument("--palavras", nargs="+", help="palavras ou frases da descrição")
+    acao.add_argument("--prefixos", nargs="+", help="início de alguma palavra da descrição")
+    acao.add_argument("--regex", help="expressão regular (sem diferenciar maiúsculas)")
+    acao.add_argument("--minimo", type=float, help="valor mínimo, em módulo (R$)")
+    acao.add_argument("--maximo", type=float, help="valor máximo, em módulo (R$)")
+    acao.add_argument("--posicao", type=int, help="posição da regra (1 = primeira)")
+    acao = acoes.add_parser("remover")
+    acao.add_argument("numero", type=int)
+    cmd.set_defaults(executar=regras)
+
+    cmd = comandos.add_parser("orcamentos", help="limites mensais de gasto por categoria")
+    cmd.add_argument("--mes", help="mês AAAA-MM da situação (padrão: o atual)")
+    acoes = cmd.add_subparsers(dest="acao")
+    acoes.add_parser("listar")
+    acao = acoes.add_parser("definir", help="avisa ao cruzar 80%% e 100%% do limite")
+    acao.add_argument("categoria")
+    acao.add_argument("limite", type=float, help="limite mensal (R$)")
+    acao = acoes.add_parser("remover")
+    acao.add_argument("categoria")
+    cmd.set_defaults(executar=orcamentos)
+
+    cmd = comandos.add_parser("recorrencias",
+                              help="transações recorrentes (lança as vencidas ao executar)")
+    acoes = cmd.add_subparsers(dest="acao")
+    acoes.add_parser("listar")
+    acao = acoes.add_parser("adicionar")
+    acao.add_argument("descricao")
+    acao.add_argument("valor", help="negativo para gastos")
+    acao.add_argument("--frequencia", choices=FREQUENCIAS, default="mensal")
+    acao.add_argument("--intervalo", type=int, default=1,
+                      help="a cada quantos meses, semanas ou dias")
+    acao.add_argument("--inicio", type=minutos_do_argumento,
+                      help="primeira ocorrência (padrão: agora)")
+    acao.add_argument("--fim", type=minutos_do_argumento, help="último dia possível (inclusive)")
+    acao = acoes.add_parser("remover", help="as ocorrências já lançadas ficam")
+    acao.add_argument("id", type=int)
+    cmd.set_defaults(executar=recorrencias)
+
+    cmd = comandos.add_parser("sincronizar",
+                              help="mescla as réplicas dos outros dispositivos numa pasta "
+                                   "compartilhada e grava a deste")
+    cmd.add_argument("pasta", nargs="?", help="padrão: a última usada (da configuração)")
+    cmd.set_defaults(executar=sincronizar)
+
+    cmd = comandos.add_parser("mesclar", help="traz as diferenças de outro arquivo de dados")
+    cmd.add_argument("outro", help="arquivo de dados (.json, .db ou pasta .particoes)")
+    cmd.add_argument("--ambos", action="store_true",
+                     help="grava também no outro arquivo o que só este tem")
+    cmd.set_defaults(executar=mesclar)
+
+    cmd = comandos.add_parser("compactar", help="grava um snapshot e poda o diário")
+    cmd.set_defaults(executar=compactar)
+
+    args = parser.parse_args(argv)
+    if args.trace:
+        instrumentos.ativar()
+    livro = LivroCaixa(args.dados, args.config)
+    # Mensagens de diagnóstico da carga vão para stderr (stdout fica para os resultados)
+    with redirect_stdout(sys.stderr):
+        livro.carregar()
+    try:
+        with instrumentos.medir(args.comando):
+            return args.executar(livro, args)
+    finally:
+        livro.encerrar()
+        if args.trace:
+            eventos = instrumentos.exportar(args.trace)
+            print(f"{eventos} medições gravadas em {args.trace}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,3734 @@
+"""Livro-caixa do DuC Finanças, sem nenhuma dependência de interface gráfica
+
+Histórico em colunas, persistência (snapshot + diário, partições mensais ou
+SQLite), índices de análise, importação de extratos, sincronização entre
+dispositivos e transações recorrentes. Usado pelo app Kivy
+(Kivy.py) e pela linha de comando (duc_cli.py).
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from calendar import monthrange
+from collections import Counter
+import csv
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+import hashlib
+import heapq
+import html
+from itertools import chain, compress, islice
+import json
+import os
+import platform
+import queue
+import re
+import struct
+import sys
+import threading
+import time
+import unicodedata
+import zlib
+
+from desempenho import instrumentos
+
+
+EPOCA = datetime(1970, 1, 1)
+ORDINAL_EPOCA = EPOCA.toordinal()
+
+
+def minutos_de_data(texto):
+    """Converte dd/mm/AAAA HH:MM em minutos desde 01/01/1970"""
+    data_str, hora_str = texto.split(" ")
+    dia, mes, ano = data_str.split("/")
+    hora, minuto = hora_str.split(":")
+    dias = date(int(ano), int(mes), int(dia)).toordinal() - ORDINAL_EPOCA
+    return dias * 1440 + int(hora) * 60 + int(minuto)
+
+
+def centavos_de_texto(texto):
+    """Converte o valor digitado ("-50", "+12.5", "3,99") em centavos inteiros"""
+    try:
+        valor = Decimal(texto.strip().replace(",", "."))
+    except InvalidOperation:
+        raise ValueError(f"valor inválido: {texto}")
+    if not valor.is_finite():
+        raise ValueError(f"valor inválido: {texto}")
+    return int((valor * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def centavos_de_valor(valor):
+    """Converte o valor gravado no JSON (número em reais) em centavos inteiros"""
+    return int(round(valor * 100))
+
+
+def formatar_centavos(centavos, sinal=False):
+    """Formata centavos como "1234.56" usando só aritmética inteira"""
+    prefixo = "-" if centavos < 0 else ("+" if sinal and centavos > 0 else "")
+    return f"{prefixo}{abs(centavos) // 100}.{abs(centavos) % 100:02d}"
+
+
+def gravar_json(arquivo, dados, recuo=None):
+    """Grava um JSON (compacto, ou indentado com `recuo`) de forma atômica
+    (arquivo temporário + os.replace)"""
+    temporario = arquivo + ".tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        # dumps (e não dump) para usar o codificador em C no formato compacto
+        if recuo:
+            f.write(json.dumps(dados, ensure_ascii=False, indent=recuo))
+        else:
+            f.write(json.dumps(dados, ensure_ascii=False, separators=(',', ':')))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, arquivo)
+
+
+def mes_de_minutos(minutos):
+    """Chave "AAAA-MM" do mês de uma data em minutos desde 01/01/1970"""
+    d = EPOCA + timedelta(minutes=minutos)
+    return f"{d.year}-{d.month:02d}"
+
+
+def intervalo_do_mes(mes):
+    """(início, fim) em minutos do mês "AAAA-MM", com o fim exclusivo"""
+    ano, numero = map(int, mes.split("-"))
+    seguinte = date(ano + numero // 12, numero % 12 + 1, 1)
+    return ((date(ano, numero, 1).toordinal() - ORDINAL_EPOCA) * 1440,
+            (seguinte.toordinal() - ORDINAL_EPOCA) * 1440)
+
+
+def data_de_minutos(minutos):
+    """Converte minutos desde 01/01/1970 de volta em dd/mm/AAAA HH:MM"""
+    d = EPOCA + timedelta(minutes=minutos)
+    return f"{d.day:02d}/{d.month:02d}/{d.year} {d.hour:02d}:{d.minute:02d}"
+
+
+class Transacao:
+    """Visão leve de uma linha da LojaTransacoes, acessada como um dict"""
+
+    __slots__ = ("loja", "linha")
+
+    def __init__(self, loja, linha):
+        self.loja = loja
+        self.linha = linha
+
+    def __getitem__(self, campo):
+        loja, linha = self.loja, self.linha
+        if campo == "id":
+            return loja.ids[linha]
+        if campo == "centavos":
+            return loja.centavos[linha]
+        if campo == "valor":
+            return loja.centavos[linha] / 100
+        if campo == "descricao":
+            return loja.textos[loja.descricoes[linha]]
+        if campo == "data":
+            return data_de_minutos(loja.minutos[linha])
+        if campo == "data_edicao" and loja.edicoes[linha] >= 0:
+            return data_de_minutos(loja.edicoes[linha])
+        raise KeyError(campo)
+
+    def get(self, campo, padrao=None):
+        try:
+            return self[campo]
+        except KeyError:
+            return padrao
+
+    def como_dict(self):
+        """Cópia da transação no formato de dict usado no JSON"""
+        transacao = {
+            "id": self["id"],
+            "valor": self["valor"],
+            "descricao": self["descricao"],
+            "data": self["data"]
+        }
+        if self.loja.edicoes[self.linha] >= 0:
+            transacao["data_edicao"] = self["data_edicao"]
+        return transacao
+
+
+class LojaTransacoes:
+    """Armazenamento compacto do histórico em colunas (array).
+
+    Cada transação ocupa uma linha em arrays tipados: valor em centavos,
+    data e edição em minutos desde a época e descrição como índice numa
+    tabela de textos internados. As colunas suportam o protocolo de buffer
+    e podem ser varridas de uma vez (sum, numpy.frombuffer). Exclusões só
+    marcam a linha como morta (zerando seu valor); as linhas mortas são
+    descartadas quando passam a ocupar boa parte dos arrays.
+
+    A coluna `categorias` guarda a categoria (internada pelas
+    RegrasCategorias em `dono_categorias`) de cada linha, calculada na
+    primeira consulta; -1 indica que ainda não foi calculada ou que a
+    descrição/valor mudou.
+
+    Saldo, receitas e despesas (em centavos) são mantidos por deltas a cada
+    alteração; validar_totais() os confere contra as colunas.
+    """
+
+    def __init__(self):
+        self.limpar()
+
+    def limpar(self):
+        self.ids = array('q')
+        self.centavos = array('q')
+        self.minutos = array('i')
+        self.descricoes = array('i')
+        self.edicoes = array('i')  # -1 = nunca editada
+        self.categorias = array('i')  # -1 = ainda não categorizada
+        self.dono_categorias = None  # RegrasCategorias que numerou a coluna
+        self.vivas = bytearray()
+        self.linhas = {}  # id -> linha
+        self.textos = []
+        self.indices_textos = {}
+        self.mortas = 0
+        self.receitas = 0
+        self.despesas = 0  # soma dos valores negativos
+
+    @property
+    def saldo(self):
+        return self.receitas + self.despesas
+
+    def _somar_totais(self, centavos, sinal=1):
+        if centavos > 0:
+            self.receitas += sinal * centavos
+        else:
+            self.despesas += sinal * centavos
+
+    def __len__(self):
+        return len(self.linhas)
+
+    def __contains__(self, transacao_id):
+        return transacao_id in self.linhas
+
+    def __iter__(self):
+        vivas = self.vivas
+        for linha in range(len(vivas)):
+            if vivas[linha]:
+                yield Transacao(self, linha)
+
+    def __reversed__(self):
+        vivas = self.vivas
+        for linha in range(len(vivas) - 1, -1, -1):
+            if vivas[linha]:
+                yield Transacao(self, linha)
+
+    def _internar(self, texto):
+        indice = self.indices_textos.get(texto)
+        if indice is None:
+            indice = self.indices_textos[texto] = len(self.textos)
+            self.textos.append(texto)
+        return indice
+
+    @staticmethod
+    def _minutos(texto):
+        try:
+            return minutos_de_data(texto)
+        except (ValueError, AttributeError) as e:
+            print(f"Data inválida '{texto}': {e}")
+            return 0
+
+    def adicionar(self, transacao):
+        """Acrescenta uma transação (dict com id, valor, descricao e data)"""
+        if transacao["id"] in self.linhas:
+            self.editar(transacao["id"], transacao)
+            return self.obter(transacao["id"])
+
+        linha = len(self.ids)
+        centavos = centavos_de_valor(transacao["valor"])
+        self.ids.append(transacao["id"])
+        self.centavos.append(centavos)
+        self.minutos.append(self._minutos(transacao["data"]))
+        self.descricoes.append(self._internar(transacao["descricao"]))
+        edicao = transacao.get("data_edicao")
+        self.edicoes.append(self._minutos(edicao) if edicao else -1)
+        self.categorias.append(-1)
+        self.vivas.append(1)
+        self.linhas[transacao["id"]] = linha
+        self._somar_totais(centavos)
+        return Transacao(self, linha)
+
+    def obter(self, transacao_id):
+        """Retorna a visão de uma transação pelo ID, ou None"""
+        linha = self.linhas.get(transacao_id)
+        return None if linha is None else Transacao(self, linha)
+
+    def editar(self, transacao_id, campos):
+        """Altera os campos informados de uma transação"""
+        linha = self.linhas[transacao_id]
+        if "valor" in campos:
+            self._somar_totais(self.centavos[linha], -1)
+            self.centavos[linha] = centavos_de_valor(campos["valor"])
+            self._somar_totais(self.centavos[linha])
+        if "descricao" in campos:
+            self.descricoes[linha] = self._internar(campos["descricao"])
+        if "valor" in campos or "descricao" in campos:
+            self.categorias[linha] = -1
+        if "data" in campos:
+            self.minutos[linha] = self._minutos(campos["data"])
+        if campos.get("data_edicao"):
+            self.edicoes[linha] = self._minutos(campos["data_edicao"])
+
+    def remover(self, transacao_id):
+        """Remove uma transação em O(1); retorna False se o ID não existe"""
+        linha = self.linhas.pop(transacao_id, None)
+        if linha is None:
+            return False
+        self._somar_totais(self.centavos[linha], -1)
+        self.vivas[linha] = 0
+        self.centavos[linha] = 0  # mantém sum(centavos) correto sem máscara
+        self.mortas += 1
+        if self.mortas > 1024 and self.mortas * 4 > len(self.vivas):
+            self._descartar_mortas()
+        return True
+
+    def _descartar_mortas(self):
+        """Reescreve as colunas sem as linhas mortas (custo amortizado)"""
+        vivas = [linha for linha in range(len(self.vivas)) if self.vivas[linha]]
+        for nome in ("ids", "centavos", "minutos", "descricoes", "edicoes", "categorias"):
+            coluna = getattr(self, nome)
+            setattr(self, nome, array(coluna.typecode, [coluna[linha] for linha in vivas]))
+        self.vivas = bytearray(b"\x01") * len(vivas)
+        self.linhas = {transacao_id: linha for linha, transacao_id in enumerate(self.ids)}
+        self.mortas = 0
+
+    def ids_vivos(self):
+        """IDs das transações, na ordem de inserção"""
+        if not self.mortas:
+            return self.ids[:]
+        return array('q', (self.ids[linha] for linha in range(len(self.vivas)) if self.vivas[linha]))
+
+    def validar_totais(self):
+        """Recalcula os totais varrendo a coluna de centavos e corrige o cache.
+
+        Retorna a lista de divergências encontradas (vazia se estava correto).
+        """
+        receitas = sum(c for c in self.centavos if c > 0)
+        despesas = sum(self.centavos) - receitas
+        divergencias = []
+        if receitas != self.receitas:
+            divergencias.append(("receitas", self.receitas, receitas))
+        if despesas != self.despesas:
+            divergencias.append(("despesas", self.despesas, despesas))
+        self.receitas, self.despesas = receitas, despesas
+        return divergencias
+
+    def copia(self):
+        """Cópia das colunas (memcpy) para serialização fora da thread da UI"""
+        copia = LojaTransacoes()
+        for nome in ("ids", "centavos", "minutos", "descricoes", "edicoes", "categorias"):
+            setattr(copia, nome, getattr(self, nome)[:])
+        copia.vivas = self.vivas[:]
+        copia.dono_categorias = self.dono_categorias
+        copia.textos = self.textos[:]
+        copia.mortas = self.mortas
+        copia.receitas, copia.despesas = self.receitas, self.despesas
+        return copia
+
+    def como_dicts(self):
+        """Gera as transações no formato de dict usado no JSON"""
+        for transacao in self:
+            yield transacao.como_dict()
+
+    def antepor(self, transacoes):
+        """Coloca as transações (dicts) antes das linhas atuais, renumerando as
+        linhas (usado ao carregar um mês mais antigo que os já em memória)"""
+        nova = LojaTransacoes()
+        nova.dono_categorias = self.dono_categorias
+        for transacao in transacoes:
+            nova.adicionar(transacao)
+        textos = [nova._internar(texto) for texto in self.textos]
+        for linha in compress(range(len(self.vivas)), self.vivas):
+            transacao_id = self.ids[linha]
+            if transacao_id in nova.linhas:
+                continue
+            nova.linhas[transacao_id] = len(nova.ids)
+            nova.ids.append(transacao_id)
+            nova.centavos.append(self.centavos[linha])
+            nova.minutos.append(self.minutos[linha])
+            nova.descricoes.append(textos[self.descricoes[linha]])
+            nova.edicoes.append(self.edicoes[linha])
+            nova.categorias.append(self.categorias[linha])
+            nova.vivas.append(1)
+            nova._somar_totais(self.centavos[linha])
+        self.__dict__.update(nova.__dict__)
+
+
+# Snapshot binário: cabeçalho, colunas de largura fixa (little-endian), tabela
+# de textos (tamanhos + UTF-8) e CRC32 no final. O índice de análise também
+# vai em registros fixos (mês, tópico, quantidade, total), com os textos na
+# mesma tabela: os primeiros textos são as descrições das transações. A
+# versão 2 acrescenta as lápides (exclusões) e os hashes por mês usados na
+# sincronização; a versão 1 continua sendo lida.
+MAGICO_SNAPSHOT = b"DUCF"
+VERSAO_SNAPSHOT = 2
+# mágico, versão, opções, seq, linhas, textos, textos das descrições,
+# bytes dos textos, registros da análise (+ lápides e hashes na versão 2)
+CABECALHO_SNAPSHOT = struct.Struct("<4sHHqIIIIIII")
+CABECALHO_SNAPSHOT_V1 = struct.Struct("<4sHHqIIIII")
+COLUNAS_SNAPSHOT = (("ids", 'q'), ("centavos", 'q'), ("minutos", 'i'),
+                    ("descricoes", 'i'), ("edicoes", 'i'))
+COLUNAS_ANALISE = (("meses", 'i'), ("topicos", 'i'), ("quantidades", 'q'), ("totais", 'q'))
+COLUNAS_LAPIDES = (("ids", 'q'), ("meses", 'i'), ("exclusoes", 'i'))
+# Hash de 128 bits em duas metades
+COLUNAS_HASHES = (("meses", 'i'), ("altos", 'Q'), ("baixos", 'Q'))
+# Bit das opções: o snapshot traz os hashes por mês (ausentes se nunca montados)
+COM_HASHES = 1
+
+
+def _bytes_coluna(coluna):
+    if sys.byteorder == "big":
+        coluna = coluna[:]
+        coluna.byteswap()
+    return coluna.tobytes()
+
+
+def gravar_snapshot_binario(arquivo, seq, loja, analise, lapides=None, hashes=None):
+    """Grava as linhas vivas da loja, a análise, as lápides ({id: (mes,
+    exclusao)}) e os hashes por mês ({mes: int}, ou None) no formato
+    binário, de forma atômica"""
+    colunas = [getattr(loja, nome) for nome, typecode in COLUNAS_SNAPSHOT]
+    if loja.mortas:
+        colunas = [array(coluna.typecode, compress(coluna, loja.vivas)) for coluna in colunas]
+
+    # Só os textos ainda usados, renumerados na ordem em que aparecem
+    usados = {}
+    colunas[3] = array('i', (usados.setdefault(indice, len(usados)) for indice in colunas[3]))
+    textos = [loja.textos[indice] for indice in usados]
+    textos_loja = len(textos)
+    indices = {texto: indice for indice, texto in enumerate(textos)}
+
+    def indice_texto(texto):
+        indice = indices.get(texto)
+        if indice is None:
+            indice = indices[texto] = len(textos)
+            textos.append(texto)
+        return indice
+
+    registros = [array(typecode) for nome, typecode in COLUNAS_ANALISE]
+    for mes, topicos in analise.items():
+        indice_mes = indice_texto(mes)
+        for topico, (quantidade, total) in topicos.items():
+            registros[0].append(indice_mes)
+            registros[1].append(indice_texto(topico))
+            registros[2].append(quantidade)
+            registros[3].append(total)
+
+    colunas_lapides = [array(typecode) for nome, typecode in COLUNAS_LAPIDES]
+    for transacao_id, (mes, exclusao) in (lapides or {}).items():
+        colunas_lapides[0].append(transacao_id)
+        colunas_lapides[1].append(indice_texto(mes))
+        colunas_lapides[2].append(exclusao)
+    colunas_hashes = [array(typecode) for nome, typecode in COLUNAS_HASHES]
+    for mes, valor in (hashes or {}).items():
+        colunas_hashes[0].append(indice_texto(mes))
+        colunas_hashes[1].append(valor >> 64)
+        colunas_hashes[2].append(valor & 0xFFFFFFFFFFFFFFFF)
+
+    codificados = [texto.encode('utf-8') for texto in textos]
+    tamanhos = array('I', map(len, codificados))
+    partes = [CABECALHO_SNAPSHOT.pack(MAGICO_SNAPSHOT, VERSAO_SNAPSHOT,
+                                      COM_HASHES if hashes is not None else 0, seq,
+                                      len(colunas[0]), len(textos), textos_loja, sum(tamanhos),
+                                      len(registros[0]), len(colunas_lapides[0]),
+                                      len(colunas_hashes[0]))]
+    partes += [_bytes_coluna(coluna)
+               for coluna in colunas + registros + colunas_lapides + colunas_hashes + [tamanhos]]
+    partes += codificados
+    crc = 0
+    for parte in partes:
+        crc = zlib.crc32(parte, crc)
+    partes.append(struct.pack("<I", crc))
+
+    temporario = arquivo + ".tmp"
+    with open(temporario, 'wb') as f:
+        f.write(b"".join(partes))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, arquivo)
+
+
+def ler_snapshot_binario(arquivo):
+    """Lê um snapshot binário com uma única leitura; retorna (seq, loja,
+    analise, lapides, hashes), com hashes None se o snapshot não os tem"""
+    with open(arquivo, 'rb') as f:
+        dados = f.read()
+    if len(dados) < CABECALHO_SNAPSHOT_V1.size + 4 or dados[:4] != MAGICO_SNAPSHOT:
+        raise ValueError(f"{arquivo}: não é um snapshot do DuC Finanças")
+    (versao,) = struct.unpack_from("<H", dados, 4)
+    if versao == 1:
+        cabecalho = CABECALHO_SNAPSHOT_V1
+        (magico, versao, opcoes, seq, linhas, quantidade_textos, textos_loja,
+         bytes_textos, registros) = cabecalho.unpack_from(dados)
+        quantidade_lapides = quantidade_hashes = 0
+    elif versao == VERSAO_SNAPSHOT and len(dados) >= CABECALHO_SNAPSHOT.size + 4:
+        cabecalho = CABECALHO_SNAPSHOT
+        (magico, versao, opcoes, seq, linhas, quantidade_textos, textos_loja, bytes_textos,
+         registros, quantidade_lapides, quantidade_hashes) = cabecalho.unpack_from(dados)
+    else:
+        raise ValueError(f"{arquivo}: versão {versao} do snapshot não suportada")
+
+    def largura(colunas):
+        return sum(array(typecode).itemsize for nome, typecode in colunas)
+
+    esperado = (cabecalho.size + linhas * largura(COLUNAS_SNAPSHOT)
+                + registros * largura(COLUNAS_ANALISE)
+                + quantidade_lapides * largura(COLUNAS_LAPIDES)
+                + quantidade_hashes * largura(COLUNAS_HASHES)
+                + quantidade_textos * array('I').itemsize + bytes_textos + 4)
+    if len(dados) != esperado:
+        raise ValueError(f"{arquivo}: tamanho {len(dados)} != {esperado} (arquivo truncado?)")
+    visao = memoryview(dados)
+    (crc,) = struct.unpack_from("<I", dados, len(dados) - 4)
+    if zlib.crc32(visao[:-4]) != crc:
+        raise ValueError(f"{arquivo}: checksum inválido (arquivo corrompido)")
+
+    posicao = cabecalho.size
+
+    def ler_coluna(typecode, quantidade):
+        nonlocal posicao
+        coluna = array(typecode)
+        fim = posicao + quantidade * coluna.itemsize
+        coluna.frombytes(visao[posicao:fim])
+        if sys.byteorder == "big":
+            coluna.byteswap()
+        posicao = fim
+        return coluna
+
+    loja = LojaTransacoes()
+    for nome, typecode in COLUNAS_SNAPSHOT:
+        setattr(loja, nome, ler_coluna(typecode, linhas))
+    meses, topicos, quantidades, totais = (ler_coluna(typecode, registros)
+                                           for nome, typecode in COLUNAS_ANALISE)
+    ids_lapides, meses_lapides, exclusoes = (ler_coluna(typecode, quantidade_lapides)
+                                             for nome, typecode in COLUNAS_LAPIDES)
+    meses_hashes, altos, baixos = (ler_coluna(typecode, quantidade_hashes)
+                                   for nome, typecode in COLUNAS_HASHES)
+    textos = []
+    for tamanho in ler_coluna('I', quantidade_textos):
+        textos.append(str(visao[posicao:posicao + tamanho], 'utf-8'))
+        posicao += tamanho
+
+    loja.textos = textos[:textos_loja]
+    loja.indices_textos = {texto: indice for indice, texto in enumerate(loja.textos)}
+    loja.categorias = array('i', [-1]) * linhas
+    loja.vivas = bytearray(b"\x01") * linhas
+    loja.linhas = dict(zip(loja.ids, range(linhas)))
+    loja.receitas = sum(centavos for centavos in loja.centavos if centavos > 0)
+    loja.despesas = sum(loja.centavos) - loja.receitas
+
+    analise = {}
+    for mes, topico, quantidade, total in zip(meses, topicos, quantidades, totais):
+        topicos_mes = analise.get(textos[mes])
+        if topicos_mes is None:
+            topicos_mes = analise[textos[mes]] = {}
+        topicos_mes[textos[topico]] = [quantidade, total]
+    lapides = {transacao_id: (textos[mes], exclusao)
+               for transacao_id, mes, exclusao in zip(ids_lapides, meses_lapides, exclusoes)}
+    hashes = None
+    if opcoes & COM_HASHES:
+        hashes = {textos[mes]: alto << 64 | baixo
+                  for mes, alto, baixo in zip(meses_hashes, altos, baixos)}
+    return seq, loja, analise, lapides, hashes
+
+
+class DiarioTransacoes:
+    """Persistência em snapshot + diário (journal) de operações.
+
+    Cada alteração acrescenta um registro pequeno ao diário em vez de
+    regravar o histórico inteiro. Na carga, o diário é reaplicado sobre o
+    snapshot; quando cresce demais, um novo snapshot é gravado em segundo
+    plano e o diário é podado.
+
+    O snapshot anterior fica como cópia (.anterior.bin, ou o JSON .bak logo
+    depois da migração) e o diário guarda as operações desde ela: se o
+    snapshot não passar na verificação, a carga segue pela cópia.
+    """
+
+    LIMITE_COMPACTACAO = 500
+
+    def __init__(self, arquivo_dados):
+        self.arquivo_dados = arquivo_dados
+        self.arquivo_snapshot = os.path.splitext(arquivo_dados)[0] + ".bin"
+        self.arquivo_anterior = os.path.splitext(arquivo_dados)[0] + ".anterior.bin"
+        self.arquivo_diario = os.path.splitext(arquivo_dados)[0] + ".diario.jsonl"
+        self.seq = 0
+        # seq do snapshot atual, que vira a cópia na próxima compactação
+        self.seq_snapshot = 0
+        self.registros_no_diario = 0
+        self._lock = threading.Lock()
+        self._thread_compactacao = None
+
+    def carregar(self):
+        """Lê o snapshot e as operações do diário posteriores a ele"""
+        snapshot, corrompidos = self._ler_snapshot()
+        operacoes = self._ler_diario(snapshot["seq"])
+        if operacoes and operacoes[0]["seq"] != snapshot["seq"] + 1:
+            # A cópia é antiga demais (ou falta o snapshot): o diário já não
+            # tem tudo o que veio depois dela
+            raise ValueError(
+                f"operações {snapshot['seq'] + 1} a {operacoes[0]['seq'] - 1} perdidas; "
+                f"recupere à mão a partir de {', '.join(corrompidos) or self.arquivo_diario}")
+        self.seq = operacoes[-1]["seq"] if operacoes else snapshot["seq"]
+        self.seq_snapshot = snapshot["seq"]
+        self.registros_no_diario = len(operacoes)
+        return snapshot, operacoes
+
+    def _ler_snapshot(self):
+        """Lê o snapshot mais recente que passar na verificação; retorna
+        (snapshot, arquivos corrompidos). Um binário corrompido ou truncado
+        é renomeado para .corrompido (fica para recuperação manual) e a
+        carga segue pela cópia da compactação anterior ou pelo JSON"""
+        corrompidos = []
+        for arquivo in (self.arquivo_snapshot, self.arquivo_anterior):
+            if not os.path.exists(arquivo):
+                continue
+            try:
+                # Snapshot binário: as colunas já vêm prontas para a memória
+                seq, loja, analise, lapides, hashes = ler_snapshot_binario(arquivo)
+            except ValueError as e:
+                print(f"Snapshot: {e}")
+                os.replace(arquivo, arquivo + ".corrompido")
+                corrompidos.append(arquivo + ".corrompido")
+                continue
+            if corrompidos:
+                print(f"Snapshot: carregando a cópia {arquivo} e o diário")
+            return {"versao": 3, "seq": seq, "transacoes": [], "loja": loja, "analise": analise,
+                    "lapides": lapides, "hashes": hashes}, corrompidos
+
+        # JSON das versões anteriores (ou a cópia .bak deixada pela migração);
+        # a próxima compactação grava o binário
+        snapshot = {"seq": 0, "transacoes": []}
+        for arquivo in (self.arquivo_dados, self.arquivo_dados + ".bak"):
+            if arquivo == self.arquivo_snapshot or not os.path.exists(arquivo):
+                continue
+            with open(arquivo, 'r', encoding='utf-8') as f:
+                conteudo = json.load(f)
+            # Formato antigo: lista pura de transações
+            if isinstance(conteudo, list):
+                snapshot["transacoes"] = conteudo
+            else:
+                snapshot.update(conteudo)
+            if corrompidos:
+                print(f"Snapshot: carregando a cópia {arquivo} e o diário")
+            return snapshot, corrompidos
+        # Cópias renomeadas numa carga anterior também impedem começar do zero
+        corrompidos = corrompidos or [
+            arquivo + ".corrompido" for arquivo in (self.arquivo_snapshot, self.arquivo_anterior)
+            if os.path.exists(arquivo + ".corrompido")]
+        if corrompidos:
+            raise ValueError(f"nenhuma cópia legível do snapshot; "
+                             f"recupere à mão a partir de {', '.join(corrompidos)}")
+        return snapshot, corrompidos
+
+    def _ler_diario(self, seq_snapshot):
+        """Lê o diário, descartando um último registro truncado"""
+        operacoes = []
+        if not os.path.exists(self.arquivo_diario):
+            return operacoes
+
+        posicao_valida = 0
+        with open(self.arquivo_diario, 'rb') as f:
+            for linha in f:
+                # Registro sem quebra de linha: escrita interrompida
+                if not linha.endswith(b"\n"):
+                    break
+                try:
+                    operacao = json.loads(linha)
+                except ValueError:
+                    break
+                posicao_valida += len(linha)
+                if operacao["seq"] > seq_snapshot:
+                    operacoes.append(operacao)
+            tamanho = f.seek(0, os.SEEK_END)
+
+        if posicao_valida < tamanho:
+            print(f"Diário: {tamanho - posicao_valida} bytes incompletos descartados")
+            with open(self.arquivo_diario, 'r+b') as f:
+                f.truncate(posicao_valida)
+        return operacoes
+
+    def numerar(self, operacao):
+        """Atribui o próximo número de sequência (na thread da UI, junto da
+        aplicação em memória, para que o snapshot saiba o que já contém)"""
+        self.seq += 1
+        return dict(operacao, seq=self.seq)
+
+    def registrar(self, operacao):
+        """Numera e acrescenta uma operação ao diário de forma síncrona"""
+        return self.registrar_lote([self.numerar(operacao)])
+
+    def registrar_lote(self, operacoes):
+        """Acrescenta operações já numeradas com um único fsync; retorna True
+        se já é hora de compactar"""
+        linhas = "".join(json.dumps(operacao, ensure_ascii=False, separators=(',', ':')) + "\n"
+                         for operacao in operacoes)
+        with self._lock:
+            with open(self.arquivo_diario, 'a', encoding='utf-8') as f:
+                f.write(linhas)
+                f.flush()
+                os.fsync(f.fileno())
+            self.registros_no_diario += len(operacoes)
+            return self.registros_no_diario >= self.LIMITE_COMPACTACAO
+
+    def compactar(self, loja, analise, em_segundo_plano=True, sincronizacao=None):
+        """Grava um novo snapshot e descarta do diário o que ele já contém
+        (`sincronizacao`: lápides e hashes por mês, ver LivroCaixa.estado_sincronizacao)"""
+        if self._thread_compactacao is not None and self._thread_compactacao.is_alive():
+            if em_segundo_plano:
+                return
+            self._thread_compactacao.join()
+
+        # A cópia (memcpy das colunas) é feita aqui para que o snapshot
+        # reflita exatamente self.seq; a serialização fica para a thread
+        snapshot = self._montar_snapshot(loja, analise)
+        snapshot.update(sincronizacao or {})
+        if not em_segundo_plano:
+            self._gravar_snapshot(snapshot)
+            return
+
+        self._thread_compactacao = threading.Thread(
+            target=self._gravar_snapshot, args=(snapshot,), daemon=True
+        )
+        self._thread_compactacao.start()
+
+    def aguardar(self):
+        """Aguarda o término de uma compactação em andamento"""
+        if self._thread_compactacao is not None:
+            self._thread_compactacao.join()
+
+    def _montar_snapshot(self, loja, analise):
+        return {
+            "versao": 3,
+            "seq": self.seq,
+            "transacoes": loja.copia(),
+            "analise": analise
+        }
+
+    def existe(self):
+        """Há dados gravados (snapshot binário, JSON antigo ou diário)?"""
+        return any(os.path.exists(arquivo) for arquivo in
+                   (self.arquivo_snapshot, self.arquivo_anterior, self.arquivo_dados,
+                    self.arquivo_diario))
+
+    @instrumentos.cronometrado("gravar_snapshot")
+    def _gravar_snapshot(self, snapshot):
+        """Troca o snapshot de forma atômica (arquivo temporário + os.replace);
+        o atual passa a ser a cópia anterior"""
+        try:
+            novo = self.arquivo_snapshot + ".novo"
+            gravar_snapshot_binario(novo, snapshot["seq"],
+                                    snapshot["transacoes"], snapshot["analise"],
+                                    snapshot.get("lapides"), snapshot.get("hashes"))
+            if os.path.exists(self.arquivo_snapshot):
+                os.replace(self.arquivo_snapshot, self.arquivo_anterior)
+            os.replace(novo, self.arquivo_snapshot)
+            # O JSON antigo fica como cópia de segurança, fora do caminho da carga
+            if self.arquivo_dados != self.arquivo_snapshot and os.path.exists(self.arquivo_dados):
+                os.replace(self.arquivo_dados, self.arquivo_dados + ".bak")
+
+            with self._lock:
+                # O diário guarda as operações desde a cópia, para a recuperação
+                self._podar_diario(snapshot["seq"], manter_desde=self.seq_snapshot)
+                self.seq_snapshot = snapshot["seq"]
+        except Exception as e:
+            print(f"Erro ao compactar dados: {e}")
+
+    def _podar_diario(self, seq, manter_desde=None):
+        """Mantém no diário apenas as operações posteriores ao snapshot `seq`
+        (ou a `manter_desde`, se menor); só as posteriores ao snapshot contam
+        para a próxima compactação"""
+        if not os.path.exists(self.arquivo_diario):
+            self.registros_no_diario = 0
+            return
+
+        manter_desde = seq if manter_desde is None else min(seq, manter_desde)
+        restantes = []
+        posteriores = 0
+        with open(self.arquivo_diario, 'rb') as f:
+            for linha in f:
+                if linha.endswith(b"\n"):
+                    seq_linha = json.loads(linha)["seq"]
+                    if seq_linha > manter_desde:
+                        restantes.append(linha)
+                        posteriores += seq_linha > seq
+
+        temporario = self.arquivo_diario + ".tmp"
+        with open(temporario, 'wb') as f:
+            f.writelines(restantes)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, self.arquivo_diario)
+        self.registros_no_diario = posteriores
+
+
+class ParticoesMensais(DiarioTransacoes):
+    """Persistência em partições mensais: um JSON por mês e um manifesto.
+
+    O manifesto guarda quantidade, receitas e despesas de cada mês (e de
+    cada dia com lançamentos, para os totais por data), além do índice de
+    análise, das lápides e dos hashes por mês da sincronização.
+    Na carga só vão para a memória os meses mais recentes (e os que o
+    diário altera); os demais ficam arquivados, entram no saldo pelos
+    totais do manifesto e são lidos sob demanda. O diário de operações é o
+    mesmo do DiarioTransacoes; a compactação regrava só os meses em
+    memória.
+    """
+
+    MESES_RECENTES = 3
+
+    def __init__(self, pasta, meses_recentes=None):
+        os.makedirs(pasta, exist_ok=True)
+        super().__init__(os.path.join(pasta, "manifesto.json"))
+        self.pasta = pasta
+        self.meses_recentes = meses_recentes or self.MESES_RECENTES
+        # Meses gravados que não estão em memória:
+        # {mes: {quantidade, receitas, despesas, dias: [[dia, receitas, despesas, quantidade]]}}
+        self.arquivados = {}
+        self.totais_arquivados = (0, 0, 0)
+        self.ultimo_id = 0
+
+    def arquivo_mes(self, mes):
+        return os.path.join(self.pasta, f"{mes}.json")
+
+    @staticmethod
+    def meses_da_operacao(operacao):
+        """Meses que uma operação altera (None = desconhecido ou todos: edição/
+        exclusão gravada sem o campo "mes", troca das regras de categorização;
+        "mes" None é uma transação que não existia em nenhum mês)"""
+        tipo = operacao["op"]
+        if tipo == "regras":
+            return None
+        if tipo == "add":
+            transacoes = [operacao["transacao"]]
+        elif tipo == "lote":
+            transacoes = operacao["transacoes"]
+        elif tipo in ("edit", "del"):
+            if "mes" not in operacao:
+                return None
+            transacoes = [operacao["campos"]] if "data" in operacao.get("campos", {}) else []
+        else:
+            return set()
+        meses = {mes_de_minutos(LojaTransacoes._minutos(transacao["data"]))
+                 for transacao in transacoes}
+        if operacao.get("mes") is not None:
+            meses.add(operacao["mes"])
+        return meses
+
+    def carregar(self):
+        """Lê o manifesto, o diário e só as partições recentes ou alteradas pelo diário"""
+        manifesto = {"seq": 0, "meses": {}, "analise": {}}
+        if os.path.exists(self.arquivo_dados):
+            with open(self.arquivo_dados, 'r', encoding='utf-8') as f:
+                manifesto.update(json.load(f))
+
+        operacoes = self._ler_diario(manifesto["seq"])
+        self.seq = operacoes[-1]["seq"] if operacoes else manifesto["seq"]
+        self.registros_no_diario = len(operacoes)
+        self.ultimo_id = manifesto.get("ultimo_id", 0)
+
+        # Um "clear" no diário invalida tudo o que já está nas partições
+        meses = manifesto["meses"]
+        reaplicar = operacoes
+        for posicao in range(len(operacoes) - 1, -1, -1):
+            if operacoes[posicao]["op"] == "clear":
+                meses = {}
+                reaplicar = operacoes[posicao:]
+                break
+
+        carregar = set(sorted(meses)[-self.meses_recentes:])
+        for operacao in reaplicar:
+            alterados = self.meses_da_operacao(operacao)
+            if alterados is None:
+                carregar = set(meses)
+                break
+            carregar |= alterados & meses.keys()
+
+        self.arquivados = {mes: totais for mes, totais in meses.items() if mes not in carregar}
+        self._somar_arquivados()
+        snapshot = {
+            "versao": 3,
+            "seq": manifesto["seq"],
+            "transacoes": chain.from_iterable(self.ler_mes(mes) for mes in sorted(carregar)),
+            "analise": manifesto["analise"],
+            "lapides": {int(transacao_id): tuple(lapide)
+                        for transacao_id, lapide in manifesto.get("lapides", {}).items()}
+        }
+        if "hashes" in manifesto:
+            snapshot["hashes"] = {mes: int(valor, 16) for mes, valor in manifesto["hashes"].items()}
+        return snapshot, operacoes
+
+    def ler_mes(self, mes):
+        """Transações (dicts) gravadas na partição de um mês"""
+        try:
+            with open(self.arquivo_mes(mes), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            print(f"Partição {mes} não encontrada")
+            return []
+
+    def carregar_mes(self, mes):
+        """Tira um mês do arquivo e retorna suas transações, para irem à memória"""
+        transacoes = self.ler_mes(mes)
+        del self.arquivados[mes]
+        self._somar_arquivados()
+        return transacoes
+
+    def _somar_arquivados(self):
+        totais = self.arquivados.values()
+        self.totais_arquivados = (sum(mes["receitas"] for mes in totais),
+                                  sum(mes["despesas"] for mes in totais),
+                                  sum(mes["quantidade"] for mes in totais))
+
+    def numerar(self, operacao):
+        if operacao["op"] == "clear":
+            self.arquivados = {}
+            self._somar_arquivados()
+        return super().numerar(operacao)
+
+    def _montar_snapshot(self, loja, analise):
+        snapshot = super()._montar_snapshot(loja, analise)
+        snapshot["arquivados"] = dict(self.arquivados)
+        return snapshot
+
+    @instrumentos.cronometrado("gravar_snapshot")
+    def _gravar_snapshot(self, snapshot):
+        """Regrava as partições dos meses em memória e depois o manifesto"""
+        try:
+            loja = snapshot["transacoes"]
+            por_mes = {}
+            meses_por_dia = {}
+            for transacao in loja:
+                dia = loja.minutos[transacao.linha] // 1440
+                mes = meses_por_dia.get(dia)
+                if mes is None:
+                    mes = meses_por_dia[dia] = mes_de_minutos(dia * 1440)
+                por_mes.setdefault(mes, []).append(transacao)
+
+            meses = snapshot["arquivados"]
+            for mes, transacoes in por_mes.items():
+                gravar_json(self.arquivo_mes(mes), [transacao.como_dict() for transacao in transacoes])
+                dias = {}
+                for transacao in transacoes:
+                    centavos = transacao["centavos"]
+                    totais = dias.setdefault(loja.minutos[transacao.linha] // 1440, [0, 0, 0])
+                    totais[0 if centavos > 0 else 1] += centavos
+                    totais[2] += 1
+                meses[mes] = {"quantidade": len(transacoes),
+                              "receitas": sum(totais[0] for totais in dias.values()),
+                              "despesas": sum(totais[1] for totais in dias.values()),
+                              "dias": [[dia, *totais] for dia, totais in sorted(dias.items())]}
+
+            self.ultimo_id = max(self.ultimo_id, max(loja.ids, default=0))
+            manifesto = {
+                "versao": 1,
+                "seq": snapshot["seq"],
+                "ultimo_id": self.ultimo_id,
+                "meses": meses,
+                "analise": snapshot["analise"],
+                "lapides": {str(transacao_id): list(lapide)
+                            for transacao_id, lapide in snapshot.get("lapides", {}).items()}
+            }
+            if snapshot.get("hashes") is not None:
+                manifesto["hashes"] = {mes: f"{valor:032x}"
+                                       for mes, valor in snapshot["hashes"].items()}
+            gravar_json(self.arquivo_dados, manifesto)
+
+            # Partições de meses que ficaram vazios (ou apagados por um "clear")
+            for nome in os.listdir(self.pasta):
+                mes, extensao = os.path.splitext(nome)
+                if extensao == ".json" and re.fullmatch(r"\d{4}-\d{2}", mes) and mes not in meses:
+                    os.remove(os.path.join(self.pasta, nome))
+
+            with self._lock:
+                self._podar_diario(snapshot["seq"])
+        except Exception as e:
+            print(f"Erro ao compactar dados: {e}")
+
+
+class BancoSQLite:
+    """Persistência opcional em SQLite: um armazenamento durável, sem diário.
+
+    Usa modo WAL e grava cada lote de operações numa única transação. Como
+    nos outros armazenamentos, o histórico vai inteiro para a memória na
+    carga e as consultas (busca, saldo, análise) são respondidas pelos
+    índices do LivroCaixa; o banco só confere o saldo (validar_totais).
+    Oferece a mesma interface do DiarioTransacoes.
+    """
+
+    def __init__(self, arquivo_banco):
+        import sqlite3
+
+        self.arquivo_banco = arquivo_banco
+        self._lock = threading.Lock()
+        self.conexao = sqlite3.connect(arquivo_banco, check_same_thread=False)
+        self.conexao.execute("PRAGMA journal_mode=WAL")
+        self.conexao.execute("PRAGMA synchronous=NORMAL")
+        with self.conexao:
+            colunas = [linha[1] for linha in
+                       self.conexao.execute("PRAGMA table_info(transacoes)")]
+            if "mes" in colunas:
+                # Bancos antigos tinham mes e topico (e seus índices) para
+                # consultas que saíram do banco: a tabela é refeita sem eles
+                self.conexao.execute("ALTER TABLE transacoes RENAME TO transacoes_antiga")
+            self.conexao.executescript("""
+                CREATE TABLE IF NOT EXISTS transacoes (
+                    id INTEGER PRIMARY KEY,
+                    ordem INTEGER NOT NULL,
+                    centavos INTEGER NOT NULL,
+                    minutos INTEGER NOT NULL,
+                    descricao TEXT NOT NULL,
+                    minutos_edicao INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT);
+                CREATE TABLE IF NOT EXISTS lapides (
+                    id INTEGER PRIMARY KEY,
+                    mes TEXT NOT NULL,
+                    minutos_exclusao INTEGER NOT NULL
+                );
+            """)
+            if "mes" in colunas:
+                self.conexao.executescript("""
+                    INSERT INTO transacoes (id, ordem, centavos, minutos, descricao, minutos_edicao)
+                        SELECT id, ordem, centavos, minutos, descricao, minutos_edicao
+                        FROM transacoes_antiga;
+                    DROP TABLE transacoes_antiga;
+                """)
+            self.conexao.execute(
+                "CREATE INDEX IF NOT EXISTS idx_transacoes_ordem ON transacoes(ordem)")
+        self.proxima_ordem = self.conexao.execute(
+            "SELECT COALESCE(MAX(ordem), 0) + 1 FROM transacoes").fetchone()[0]
+
+    def carregar(self):
+        """Lê as transações na ordem de inserção; a análise é montada na memória,
+        com as regras de categorização"""
+        cursor = self.conexao.execute(
+            "SELECT id, centavos, minutos, descricao, minutos_edicao "
+            "FROM transacoes ORDER BY ordem")
+
+        def transacoes():
+            for transacao_id, centavos, minutos, descricao, minutos_edicao in cursor:
+                transacao = {
+                    "id": transacao_id,
+                    "valor": centavos / 100,
+                    "descricao": descricao,
+                    "data": data_de_minutos(minutos)
+                }
+                if minutos_edicao is not None:
+                    transacao["data_edicao"] = data_de_minutos(minutos_edicao)
+                yield transacao
+
+        lapides = {transacao_id: (mes, exclusao) for transacao_id, mes, exclusao in
+                   self.conexao.execute("SELECT id, mes, minutos_exclusao FROM lapides")}
+        snapshot = {"versao": 3, "seq": 0, "transacoes": transacoes(), "lapides": lapides}
+        return snapshot, []
+
+    def numerar(self, operacao):
+        """O banco aplica as operações na ordem recebida; não há sequência"""
+        return operacao
+
+    def registrar(self, operacao):
+        """Grava uma operação; nunca precisa de compactação"""
+        return self.registrar_lote([operacao])
+
+    def registrar_lote(self, operacoes):
+        """Grava várias operações numa única transação do SQLite"""
+        with self._lock, self.conexao:
+            for operacao in operacoes:
+                self._executar(operacao)
+        return False
+
+    def _executar(self, operacao):
+        tipo = operacao["op"]
+        if tipo == "add":
+            self._inserir(operacao["transacao"])
+        elif tipo == "lote":
+            for transacao in operacao["transacoes"]:
+                self._inserir(transacao)
+        elif tipo == "edit":
+            campos = operacao["campos"]
+            atribuicoes, parametros = [], []
+            if "valor" in campos:
+                atribuicoes.append("centavos = ?")
+                parametros.append(centavos_de_valor(campos["valor"]))
+            if "descricao" in campos:
+                atribuicoes.append("descricao = ?")
+                parametros.append(campos["descricao"])
+            if "data" in campos:
+                atribuicoes.append("minutos = ?")
+                parametros.append(minutos_de_data(campos["data"]))
+            if campos.get("data_edicao"):
+                atribuicoes.append("minutos_edicao = ?")
+                parametros.append(minutos_de_data(campos["data_edicao"]))
+            if atribuicoes:
+                self.conexao.execute(
+                    f"UPDATE transacoes SET {', '.join(atribuicoes)} WHERE id = ?",
+                    parametros + [operacao["id"]])
+        elif tipo == "del":
+            self.conexao.execute("DELETE FROM transacoes WHERE id = ?", (operacao["id"],))
+            if operacao.get("data_exclusao") and operacao.get("mes"):
+                self.conexao.execute(
+                    "INSERT OR REPLACE INTO lapides (id, mes, minutos_exclusao) VALUES (?, ?, ?)",
+                    (operacao["id"], operacao["mes"], minutos_de_data(operacao["data_exclusao"])))
+        elif tipo == "clear":
+            self.conexao.execute("DELETE FROM transacoes")
+            self.conexao.execute("DELETE FROM lapides")
+
+    def _inserir(self, transacao):
+        edicao = transacao.get("data_edicao")
+        self.conexao.execute(
+            "INSERT OR REPLACE INTO transacoes "
+            "(id, ordem, centavos, minutos, descricao, minutos_edicao) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (transacao["id"], self.proxima_ordem, centavos_de_valor(transacao["valor"]),
+             minutos_de_data(transacao["data"]), transacao["descricao"],
+             minutos_de_data(edicao) if edicao else None))
+        # Uma transação restaurada pela sincronização deixa de ser lápide
+        self.conexao.execute("DELETE FROM lapides WHERE id = ?", (transacao["id"],))
+        self.proxima_ordem += 1
+
+    def compactar(self, loja, analise, em_segundo_plano=True, sincronizacao=None):
+        """No SQLite basta fazer o checkpoint do WAL (as lápides já estão no banco)"""
+        with self._lock:
+            self.conexao.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def aguardar(self):
+        pass
+
+    # Conferências (migração e validar_totais)
+
+    def contar(self):
+        return self.conexao.execute("SELECT COUNT(*) FROM transacoes").fetchone()[0]
+
+    def saldo_centavos(self):
+        return self.conexao.execute(
+            "SELECT COALESCE(SUM(centavos), 0) FROM transacoes").fetchone()[0]
+
+    # Migração do JSON
+
+    def migrado(self):
+        return self.conexao.execute(
+            "SELECT valor FROM meta WHERE chave = 'migrado_de'").fetchone() is not None
+
+    def importar(self, loja, origem, lapides=None):
+        """Copia uma LojaTransacoes (e suas lápides) para o banco numa única
+        transação e confere"""
+        with self._lock, self.conexao:
+            self.conexao.execute("DELETE FROM transacoes")
+            self.conexao.execute("DELETE FROM lapides")
+            self.proxima_ordem = 1
+            for transacao in loja.como_dicts():
+                self._inserir(transacao)
+            self.conexao.executemany(
+                "INSERT INTO lapides (id, mes, minutos_exclusao) VALUES (?, ?, ?)",
+                ((transacao_id, mes, exclusao)
+                 for transacao_id, (mes, exclusao) in (lapides or {}).items()))
+
+            # Verificação: mesmos IDs e valores, na mesma ordem
+            gravadas = self.conexao.execute("SELECT id, centavos FROM transacoes ORDER BY ordem")
+            esperadas = ((t["id"], t["centavos"]) for t in loja)
+            contagem = 0
+            for gravada, esperada in zip(gravadas, esperadas):
+                if tuple(gravada) != esperada:
+                    raise ValueError(f"migração divergente: {tuple(gravada)} != {esperada}")
+                contagem += 1
+            if contagem != len(loja):
+                raise ValueError(f"migração divergente: {contagem} de {len(loja)} transações")
+
+            self.conexao.execute(
+                "INSERT OR REPLACE INTO meta (chave, valor) VALUES ('migrado_de', ?)", (origem,))
+
+
+# Marcador na fila do escritor: grava o lote sem esperar mais operações
+DESCARREGAR = object()
+
+
+class EscritorAssincrono:
+    """Grava as operações em lotes numa thread própria, fora da thread da UI.
+
+    As operações são enfileiradas sem bloquear. A thread espera ATRASO
+    segundos sem novas operações (debounce, limitado a ESPERA_MAXIMA) e
+    grava o lote inteiro de uma vez no armazenamento.
+    """
+
+    ATRASO = 0.3
+    ESPERA_MAXIMA = 2.0
+    LOTE_MAXIMO = 1000
+
+    def __init__(self, armazenamento, ao_pedir_compactacao):
+        self.armazenamento = armazenamento
+        self.ao_pedir_compactacao = ao_pedir_compactacao
+        self.fila = queue.Queue()
+        self.thread = threading.Thread(target=self._executar, daemon=True)
+        self.thread.start()
+
+    def enfileirar(self, operacao):
+        self.fila.put(operacao)
+
+    def descarregar(self):
+        """Grava já o que foi enfileirado, sem esperar o debounce, e bloqueia
+        até terminar"""
+        self.fila.put(DESCARREGAR)
+        self.fila.join()
+
+    def encerrar(self):
+        """Grava o que estiver pendente e encerra a thread"""
+        self.fila.put(None)
+        self.thread.join()
+
+    def _executar(self):
+        encerrar = False
+        while not encerrar:
+            operacao = self.fila.get()
+            if operacao is None:
+                self.fila.task_done()
+                break
+            if operacao is DESCARREGAR:
+                self.fila.task_done()
+                continue
+
+            lote = [operacao]
+            limite = time.monotonic() + self.ESPERA_MAXIMA
+            while len(lote) < self.LOTE_MAXIMO:
+                espera = min(self.ATRASO, limite - time.monotonic())
+                if espera <= 0:
+                    break
+                try:
+                    operacao = self.fila.get(timeout=espera)
+                except queue.Empty:
+                    break
+                if operacao is None or operacao is DESCARREGAR:
+                    self.fila.task_done()
+                    encerrar = operacao is None
+                    break
+                lote.append(operacao)
+
+            self._gravar(lote)
+            for _ in lote:
+                self.fila.task_done()
+
+    @instrumentos.cronometrado("gravar_lote")
+    def _gravar(self, lote):
+        try:
+            if self.armazenamento.registrar_lote(lote):
+                self.ao_pedir_compactacao()
+        except Exception as e:
+            print(f"Erro ao salvar dados: {e}")
+
+
+def normalizar_texto(texto):
+    """Minúsculas, sem acentos e com espaços simples (para comparar textos)"""
+    sem_acentos = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return " ".join(sem_acentos.lower().split())
+
+
+def centavos_de_extrato(texto):
+    """Converte valores de extrato ("1.234,56", "-1,234.56", "(50.00)", "R$ 10") em centavos"""
+    texto = texto.replace("R$", "").replace(" ", "").strip()
+    negativo = texto.startswith("(") and texto.endswith(")")
+    texto = texto.strip("()")
+    if "," in texto and "." in texto:
+        # O último separador é o decimal
+        if texto.rfind(",") > texto.rfind("."):
+            texto = texto.replace(".", "").replace(",", ".")
+        else:
+            texto = texto.replace(",", "")
+    elif "," in texto:
+        texto = texto.replace(",", ".")
+    elif texto.count(".") > 1:
+        texto = texto.replace(".", "")
+    centavos = centavos_de_texto(texto)
+    return -abs(centavos) if negativo else centavos
+
+
+def data_de_extrato(texto):
+    """Normaliza datas de extrato (dd/mm/aaaa, dd/mm/aa, aaaa-mm-dd, OFX aaaammdd...)
+    para o formato do app, dd/mm/AAAA HH:MM"""
+    texto = texto.strip()
+    if re.fullmatch(r"\d{8}.*", texto):  # OFX: AAAAMMDD[HHMMSS][.XXX][[-3:BRT]]
+        ano, mes, dia = texto[0:4], texto[4:6], texto[6:8]
+        hora = texto[8:10] if texto[8:10].isdigit() else "00"
+        minuto = texto[10:12] if texto[10:12].isdigit() else "00"
+    else:
+        partes = texto.split()
+        data_str = partes[0]
+        hora, minuto = (partes[1].split(":") + ["00"])[:2] if len(partes) > 1 else ("00", "00")
+        if "-" in data_str:
+            ano, mes, dia = data_str.split("-")
+        else:
+            dia, mes, ano = data_str.split("/")
+            if len(ano) == 2:
+                ano = "20" + ano
+    data = datetime(int(ano), int(mes), int(dia), int(hora), int(minuto))
+    return data.strftime("%d/%m/%Y %H:%M")
+
+
+# Nomes de coluna reconhecidos nos CSVs de bancos (já normalizados)
+COLUNAS_EXTRATO = {
+    "data": ("data", "date", "dt"),
+    "valor": ("valor", "value", "amount", "quantia", "montante"),
+    "descricao": ("descricao", "description", "historico", "memo", "lancamento",
+                  "estabelecimento", "titulo", "detalhe"),
+}
+
+
+def ler_extrato_csv(arquivo, ao_progresso=None):
+    """Gera (data, valor, descrição) brutos de um extrato CSV, linha a linha"""
+    tamanho = max(os.path.getsize(arquivo), 1)
+    lidos = 0
+
+    with open(arquivo, 'r', encoding='utf-8-sig', errors='replace', newline='') as f:
+        amostra = f.read(4096)
+        f.seek(0)
+        # Do Sniffer só vale o separador: as aspas seguem o padrão (aspas
+        # dobradas dentro do campo), que ele nem sempre reconhece
+        try:
+            separador = csv.Sniffer().sniff(amostra, delimiters=";,\t|").delimiter
+        except csv.Error:
+            separador = ","
+
+        def linhas():
+            nonlocal lidos
+            for numero, linha in enumerate(f):
+                lidos += len(linha)
+                if ao_progresso is not None and numero % 2000 == 0:
+                    ao_progresso(lidos / tamanho)
+                yield linha
+
+        leitor = csv.reader(linhas(), delimiter=separador)
+        primeira = next(leitor, None)
+        if primeira is None:
+            return
+
+        # Mapeia as colunas pelo cabeçalho; sem cabeçalho, assume data, descrição, valor
+        nomes = [normalizar_texto(nome) for nome in primeira]
+        colunas = {}
+        for campo, chaves in COLUNAS_EXTRATO.items():
+            for i, nome in enumerate(nomes):
+                if i not in colunas.values() and any(nome.startswith(chave) for chave in chaves):
+                    colunas[campo] = i
+                    break
+        if len(colunas) < 3:
+            colunas = {"data": 0, "descricao": 1, "valor": 2}
+            if len(primeira) >= 3:
+                yield primeira[0], primeira[2], primeira[1]
+
+        maior = max(colunas.values())
+        for linha in leitor:
+            if len(linha) > maior:
+                yield linha[colunas["data"]], linha[colunas["valor"]], linha[colunas["descricao"]]
+
+
+def ler_extrato_ofx(arquivo, ao_progresso=None):
+    """Gera (data, valor, descrição) brutos dos <STMTTRN> de um OFX (SGML ou XML)"""
+    tamanho = max(os.path.getsize(arquivo), 1)
+    lidos = 0
+    campos = None
+
+    with open(arquivo, 'r', encoding='latin-1') as f:
+        for numero, linha in enumerate(f):
+            lidos += len(linha)
+            if ao_progresso is not None and numero % 5000 == 0:
+                ao_progresso(lidos / tamanho)
+
+            # Uma linha pode ter várias tags (OFX sem quebras de linha)
+            for tag, valor in re.findall(r"<(/?[A-Za-z0-9.]+)>([^<\r\n]*)", linha):
+                tag = tag.upper()
+                if tag == "STMTTRN":
+                    campos = {}
+                elif tag == "/STMTTRN" and campos is not None:
+                    descricao = campos.get("MEMO") or campos.get("NAME") or ""
+                    yield campos.get("DTPOSTED", ""), campos.get("TRNAMT", ""), descricao
+                    campos = None
+                elif campos is not None and not tag.startswith("/"):
+                    campos[tag] = valor.strip()
+
+
+def normalizar_extrato(registros, invalidos):
+    """Converte registros brutos para o formato do app: (centavos, minutos, descrição)"""
+    for data_bruta, valor_bruto, descricao in registros:
+        try:
+            descricao = " ".join(descricao.split())
+            data = data_de_extrato(data_bruta)
+            yield centavos_de_extrato(valor_bruto), minutos_de_data(data), descricao or "Importado"
+        except (ValueError, IndexError):
+            invalidos.append((data_bruta, valor_bruto, descricao))
+
+
+class ImportadorExtrato:
+    """Importa um extrato CSV/OFX numa thread, sem tocar na thread da UI.
+
+    Pipeline em geradores: leitura → normalização → deduplicação contra o
+    histórico existente. Só as transações novas ficam em memória (como
+    tuplas); a gravação em lote fica a cargo de quem recebe ao_concluir.
+    A deduplicação compara (data, valor, descrição) contando ocorrências,
+    para que duas compras iguais no mesmo dia não sejam descartadas, e só
+    olha as transações existentes dentro do período do extrato.
+    """
+
+    def __init__(self, arquivo, loja, ao_progresso=None, ao_concluir=None, arquivadas=None):
+        self.arquivo = arquivo
+        self.loja = loja  # cópia das colunas, lida só pela thread
+        self.ao_progresso = ao_progresso
+        self.ao_concluir = ao_concluir
+        # Função (inicio, fim) -> transações gravadas fora da memória (meses arquivados)
+        self.arquivadas = arquivadas
+
+    def iniciar(self):
+        threading.Thread(target=self._executar, daemon=True).start()
+
+    @instrumentos.cronometrado("importar_extrato")
+    def processar(self):
+        """Lê, normaliza e deduplica o extrato; retorna (novas, resumo)"""
+        invalidos = []
+        if self.arquivo.lower().endswith(".ofx"):
+            registros = ler_extrato_ofx(self.arquivo, self.ao_progresso)
+        else:
+            registros = ler_extrato_csv(self.arquivo, self.ao_progresso)
+        candidatas = list(normalizar_extrato(registros, invalidos))
+        novas = list(self.deduplicar(candidatas))
+        return novas, {
+            "lidas": len(candidatas) + len(invalidos),
+            "duplicadas": len(candidatas) - len(novas),
+            "invalidas": len(invalidos)
+        }
+
+    def _executar(self):
+        try:
+            novas, resumo = self.processar()
+        except Exception as e:
+            self.ao_concluir(None, {"erro": str(e)})
+            return
+        self.ao_concluir(novas, resumo)
+
+    def deduplicar(self, candidatas):
+        if not candidatas:
+            return
+        inicio = min(minutos for centavos, minutos, descricao in candidatas)
+        fim = max(minutos for centavos, minutos, descricao in candidatas)
+
+        loja = self.loja
+        existentes = Counter(
+            (loja.minutos[linha], loja.centavos[linha],
+             normalizar_texto(loja.textos[loja.descricoes[linha]]))
+            for linha in range(len(loja.vivas))
+            if loja.vivas[linha] and inicio <= loja.minutos[linha] <= fim
+        )
+        if self.arquivadas is not None:
+            for transacao in self.arquivadas(inicio, fim):
+                minutos = minutos_de_data(transacao["data"])
+                if inicio <= minutos <= fim:
+                    existentes[(minutos, centavos_de_valor(transacao["valor"]),
+                                normalizar_texto(transacao["descricao"]))] += 1
+        vistas = Counter()
+        for centavos, minutos, descricao in candidatas:
+            chave = (minutos, centavos, normalizar_texto(descricao))
+            vistas[chave] += 1
+            if vistas[chave] > existentes[chave]:
+                yield centavos, minutos, descricao
+
+
+class RegrasCategorias:
+    """Categorização por regras do usuário, compiladas num classificador.
+
+    Cada regra é um dict {"categoria", "palavras", "prefixos", "regex",
+    "minimo", "maximo"} (valores em reais, comparados em módulo). A regra
+    casa se a descrição tiver uma das palavras (ou frases), uma palavra
+    começando por um dos prefixos ou casar com a regex, e se o valor estiver
+    na faixa; vale a primeira que casar. Sem regra, a categoria é a
+    descrição em minúsculas (o tópico das versões anteriores).
+
+    As categorias são internadas como inteiros pequenos (`nomes[categoria]`)
+    e as condições de texto são avaliadas uma vez por descrição distinta:
+    o cache guarda, por texto, as regras candidatas na ordem.
+    """
+
+    def __init__(self, regras=()):
+        self.nomes = []
+        self.indices = {}
+        self.compilar(regras)
+
+    def internar(self, nome):
+        categoria = self.indices.get(nome)
+        if categoria is None:
+            categoria = self.indices[nome] = len(self.nomes)
+            self.nomes.append(nome)
+        return categoria
+
+    def compilar(self, regras):
+        """Valida e compila as regras (ValueError se alguma for inválida);
+        as categorias já internadas mantêm seus números"""
+        compiladas, palavras, prefixos, frases, expressoes = [], {}, {}, [], []
+        sempre = 0
+        for posicao, regra in enumerate(regras):
+            nome = str(regra.get("categoria", "")).strip()
+            if not nome:
+                raise ValueError(f"regra {posicao + 1}: categoria vazia")
+            bit = 1 << posicao
+            limites = []
+            for campo in ("minimo", "maximo"):
+                valor = regra.get(campo)
+                if valor is not None and not isinstance(valor, (int, float)):
+                    raise ValueError(f"regra {posicao + 1}: {campo} inválido: {valor!r}")
+                limites.append(None if valor is None else abs(centavos_de_valor(valor)))
+            condicoes = 0
+            for palavra in map(normalizar_texto, regra.get("palavras", ())):
+                if " " in palavra:
+                    frases.append((f" {palavra} ", bit))
+                elif palavra:
+                    palavras[palavra] = palavras.get(palavra, 0) | bit
+                condicoes += 1
+            for prefixo in map(normalizar_texto, regra.get("prefixos", ())):
+                if prefixo:
+                    prefixos[prefixo] = prefixos.get(prefixo, 0) | bit
+                    condicoes += 1
+            if regra.get("regex"):
+                try:
+                    expressoes.append((re.compile(regra["regex"], re.IGNORECASE), bit))
+                except re.error as e:
+                    raise ValueError(f"regra {posicao + 1}: regex inválida: {e}")
+                condicoes += 1
+            if not condicoes:
+                if limites == [None, None]:
+                    raise ValueError(f"regra {posicao + 1}: nenhuma condição")
+                sempre |= bit  # só a faixa de valores
+            compiladas.append((self.internar(nome), *limites))
+
+        self.regras = [dict(regra) for regra in regras]
+        self.compiladas = compiladas
+        self.palavras, self.prefixos, self.frases, self.expressoes = (
+            palavras, prefixos, frases, expressoes)
+        self.tamanhos_prefixos = sorted({len(prefixo) for prefixo in prefixos})
+        self.sempre = sempre
+        self.cache = {}
+
+    def candidatas(self, texto):
+        """Tupla (categoria, minimo, maximo) das regras cujas condições de
+        texto casam com a descrição, na ordem, terminando na categoria padrão"""
+        candidatas = self.cache.get(texto)
+        if candidatas is not None:
+            return candidatas
+
+        termos = re.findall(r"\w+", normalizar_texto(texto))
+        mascara = self.sempre
+        for termo in termos:
+            mascara |= self.palavras.get(termo, 0)
+            for tamanho in self.tamanhos_prefixos:
+                if tamanho > len(termo):
+                    break
+                mascara |= self.prefixos.get(termo[:tamanho], 0)
+        if self.frases:
+            espacado = f" {' '.join(termos)} "
+            for frase, bit in self.frases:
+                if frase in espacado:
+                    mascara |= bit
+        for expressao, bit in self.expressoes:
+            if expressao.search(texto):
+                mascara |= bit
+
+        lista = []
+        while mascara:
+            bit = mascara & -mascara
+            mascara ^= bit
+            categoria, minimo, maximo = self.compiladas[bit.bit_length() - 1]
+            lista.append((categoria, minimo, maximo))
+            if minimo is None and maximo is None:
+                break  # as regras seguintes nunca seriam alcançadas
+        else:
+            lista.append((self.internar(texto.lower().strip()), None, None))
+        candidatas = self.cache[texto] = tuple(lista)
+        return candidatas
+
+    @staticmethod
+    def escolher(candidatas, centavos):
+        """Primeira candidata cuja faixa contém o valor"""
+        valor = abs(centavos)
+        for categoria, minimo, maximo in candidatas:
+            if (minimo is None or valor >= minimo) and (maximo is None or valor <= maximo):
+                return categoria
+        return candidatas[-1][0]
+
+    def normalizar_categoria(self, nome):
+        """Nome de categoria como a análise o guarda: o de uma regra com o
+        mesmo nome (sem diferenciar maiúsculas) ou, sem regra, em minúsculas"""
+        nome = nome.strip()
+        for regra in self.regras:
+            categoria = str(regra.get("categoria", "")).strip()
+            if categoria.lower() == nome.lower():
+                return categoria
+        return nome.lower()
+
+    def categoria(self, texto, centavos):
+        """Categoria (número internado) de uma descrição e valor"""
+        return self.escolher(self.candidatas(texto), centavos)
+
+    def assumir(self, loja):
+        """Passa a usar a coluna de categorias da loja, descartando-a se foi
+        numerada por outras regras (os números internados não valeriam aqui)"""
+        if loja.dono_categorias is not self:
+            loja.categorias = array('i', [-1]) * len(loja.categorias)
+            loja.dono_categorias = self
+
+    def da_linha(self, loja, linha):
+        """Categoria de uma linha da loja, calculada uma vez e guardada na coluna"""
+        if loja.dono_categorias is not self:
+            self.assumir(loja)
+        categoria = loja.categorias[linha]
+        if categoria < 0:
+            categoria = loja.categorias[linha] = self.categoria(
+                loja.textos[loja.descricoes[linha]], loja.centavos[linha])
+        return categoria
+
+
+class IndiceAnalise:
+    """Agregados de gastos por (mês, categoria), mantidos de forma incremental.
+
+    Estrutura: {"AAAA-MM": {categoria: [quantidade, total_centavos]}}. É
+    atualizado a cada operação e gravado junto ao snapshot, evitando
+    reprocessar todo o histórico a cada atualização da aba Análise. A
+    categoria de cada gasto vem das RegrasCategorias.
+    """
+
+    def __init__(self, meses=None, regras=None):
+        self.meses = meses if meses is not None else {}
+        self.regras = regras if regras is not None else RegrasCategorias()
+        self.meses_por_dia = {}
+        # Com um dict, somar guarda nele o total de cada balde antes da
+        # primeira alteração: {(mes, topico): total_centavos}
+        self.anteriores = None
+
+    @classmethod
+    def construir(cls, transacoes, regras=None):
+        """Monta o índice do zero a partir das transações (visões da loja)"""
+        indice = cls(regras=regras)
+        for transacao in transacoes:
+            indice.adicionar(transacao)
+        return indice
+
+    def mes(self, minutos):
+        """Chave "AAAA-MM" de uma data em minutos, com cache por dia"""
+        dia = minutos // 1440
+        mes = self.meses_por_dia.get(dia)
+        if mes is None:
+            mes = self.meses_por_dia[dia] = mes_de_minutos(dia * 1440)
+        return mes
+
+    def chave(self, transacao):
+        """Retorna (mês, categoria) de um gasto, ou None se não for gasto"""
+        loja, linha = transacao.loja, transacao.linha
+        if loja.centavos[linha] >= 0:
+            return None
+        return self.mes(loja.minutos[linha]), self.regras.nomes[self.regras.da_linha(loja, linha)]
+
+    def adicionar(self, transacao, sinal=1):
+        """Soma (ou subtrai, com sinal=-1) um gasto no seu balde"""
+        try:
+            chave = self.chave(transacao)
+        except Exception as e:
+            print(f"Erro ao processar transação: {e}")
+            return
+        if chave is not None:
+            self.somar(*chave, sinal, sinal * transacao["centavos"])
+
+    def somar(self, mes, topico, quantidade, centavos):
+        """Soma `quantidade` gastos totalizando `centavos` (negativos) no balde
+        (mes, topico); valores com o sinal trocado retiram"""
+        topicos = self.meses.setdefault(mes, {})
+        info = topicos.setdefault(topico, [0, 0])
+        if self.anteriores is not None:
+            self.anteriores.setdefault((mes, topico), info[1])
+        info[0] += quantidade
+        info[1] -= centavos
+
+        # Remove baldes vazios para não exibir meses/tópicos sem gastos
+        if info[0] <= 0:
+            del topicos[topico]
+            if not topicos:
+                del self.meses[mes]
+
+    def remover(self, transacao):
+        """Retira um gasto do seu balde"""
+        self.adicionar(transacao, sinal=-1)
+
+    def limpar(self):
+        self.meses.clear()
+
+    def exportar(self):
+        """Cópia serializável do índice, para gravar no snapshot"""
+        return {mes: {topico: list(info) for topico, info in topicos.items()}
+                for mes, topicos in self.meses.items()}
+
+
+class CalculoCancelado(Exception):
+    """Os dados mudaram durante um cálculo em segundo plano"""
+
+
+def percentil(ordenados, fracao):
+    """Percentil (0 a 1) de uma sequência ordenada, com interpolação linear"""
+    if not ordenados:
+        return 0
+    posicao = fracao * (len(ordenados) - 1)
+    inferior = int(posicao)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return round(ordenados[inferior]
+                 + (ordenados[superior] - ordenados[inferior]) * (posicao - inferior))
+
+
+def percentil_de_listas(listas, fracao):
+    """Percentil (0 a 1) da união de várias listas ordenadas, sem juntá-las
+    nem ordenar tudo de novo: cada posição é achada por busca binária no valor"""
+    tamanho = sum(map(len, listas))
+    if not tamanho:
+        return 0
+
+    def elemento(posicao):
+        # Menor valor com mais de `posicao` elementos menores ou iguais a ele
+        baixo = min(lista[0] for lista in listas if lista)
+        alto = max(lista[-1] for lista in listas if lista)
+        while baixo < alto:
+            meio = (baixo + alto) // 2
+            if sum(bisect_right(lista, meio) for lista in listas) > posicao:
+                alto = meio
+            else:
+                baixo = meio + 1
+        return baixo
+
+    posicao = fracao * (tamanho - 1)
+    inferior = int(posicao)
+    valor = elemento(inferior)
+    if posicao == inferior:
+        return valor
+    return round(valor + (elemento(inferior + 1) - valor) * (posicao - inferior))
+
+
+def meses_entre(primeiro, ultimo):
+    """Chaves "AAAA-MM" de `primeiro` a `ultimo`, inclusive"""
+    ano, mes = map(int, primeiro.split("-"))
+    meses = []
+    while True:
+        chave = f"{ano}-{mes:02d}"
+        meses.append(chave)
+        if chave >= ultimo:
+            return meses
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+
+
+class RelatorioEstatistico:
+    """Estatísticas de vários anos calculadas numa thread, fora da UI.
+
+    Trabalha sobre um instantâneo somente leitura (LivroCaixa.instantaneo:
+    cópia das colunas, nomes das categorias e leitor dos meses arquivados)
+    e entrega a ao_concluir um dict com tendências anuais, gastos por mês
+    com a variação sobre o mês anterior, média, mediana e percentis por
+    categoria e percentis gerais dos gastos (valores em centavos). Os gastos
+    são agrupados numa única passada pelas colunas; ordenação e somas ficam
+    em funções nativas, e os percentis gerais saem das listas já ordenadas
+    por categoria (uma ordenação única de tudo seguraria o GIL por muito
+    tempo). cancelar() interrompe o cálculo na próxima fatia
+    de linhas, e entre as fatias a thread cede o GIL para a UI.
+    """
+
+    # Linhas entre duas verificações (~1 ms de trabalho, cedendo o GIL em seguida)
+    FATIA = 1024
+
+    def __init__(self, instantaneo, ao_concluir=None):
+        self.instantaneo = instantaneo
+        self.ao_concluir = ao_concluir
+        self.cancelado = threading.Event()
+
+    def iniciar(self):
+        threading.Thread(target=self._executar, daemon=True).start()
+
+    def cancelar(self):
+        self.cancelado.set()
+
+    def _verificar(self):
+        if self.cancelado.is_set():
+            raise CalculoCancelado()
+        time.sleep(0)  # deixa a thread da UI desenhar o próximo quadro
+
+    def _executar(self):
+        try:
+            resultado = self.processar()
+        except CalculoCancelado:
+            return
+        except Exception as e:
+            resultado = {"erro": str(e)}
+        if not self.cancelado.is_set():
+            self.ao_concluir(resultado)
+
+    def _linhas(self):
+        """(centavos, minutos, categoria) de cada transação, memória e arquivo"""
+        loja = self.instantaneo["loja"]
+        nomes = self.instantaneo["nomes"]
+        regras = RegrasCategorias(self.instantaneo["regras"])
+        centavos, minutos, descricoes = loja.centavos, loja.minutos, loja.descricoes
+        categorias, textos = loja.categorias, loja.textos
+        for numero, linha in enumerate(compress(range(len(loja.vivas)), loja.vivas)):
+            if not numero % self.FATIA:
+                self._verificar()
+            categoria = categorias[linha]
+            # Linhas ainda sem categoria são calculadas com regras próprias da thread
+            nome = (nomes[categoria] if categoria >= 0 else
+                    regras.nomes[regras.categoria(textos[descricoes[linha]], centavos[linha])])
+            yield centavos[linha], minutos[linha], nome
+
+        arquivadas = self.instantaneo.get("arquivadas")
+        if arquivadas is not None:
+            for numero, transacao in enumerate(arquivadas(None, None)):
+                if not numero % self.FATIA:
+                    self._verificar()
+                valor = centavos_de_valor(transacao["valor"])
+                yield (valor, LojaTransacoes._minutos(transacao["data"]),
+                       regras.nomes[regras.categoria(transacao["descricao"], valor)])
+
+    @instrumentos.cronometrado("estatisticas")
+    def processar(self):
+        """Calcula as estatísticas (na thread que chamar); retorna o dict"""
+        anos = {}        # ano -> [receitas, despesas, quantidade]
+        gastos_mes = {}  # mes -> gastos (positivos)
+        por_categoria = {}
+        meses_por_dia = {}
+        quantidade = 0
+        for centavos, minutos, categoria in self._linhas():
+            quantidade += 1
+            dia = minutos // 1440
+            mes = meses_por_dia.get(dia)
+            if mes is None:
+                mes = meses_por_dia[dia] = mes_de_minutos(dia * 1440)
+            ano = anos.get(mes[:4])
+            if ano is None:
+                ano = anos[mes[:4]] = [0, 0, 0]
+            ano[2] += 1
+            if centavos > 0:
+                ano[0] += centavos
+            elif centavos < 0:
+                ano[1] += centavos
+                gastos_mes[mes] = gastos_mes.get(mes, 0) - centavos
+                valores = por_categoria.get(categoria)
+                if valores is None:
+                    valores = por_categoria[categoria] = array('q')
+                valores.append(-centavos)
+
+        self._verificar()
+        meses = meses_entre(min(gastos_mes), max(gastos_mes)) if gastos_mes else []
+        tendencia_meses = []
+        anterior = None
+        for mes in meses:
+            gastos = gastos_mes.get(mes, 0)
+            tendencia_meses.append({
+                "mes": mes,
+                "gastos": gastos,
+                "variacao": None if anterior is None else gastos - anterior,
+                "variacao_pct": (None if not anterior else
+                                 round(100 * (gastos - anterior) / anterior, 1)),
+            })
+            anterior = gastos
+
+        tendencia_anos = []
+        anterior = None
+        for ano in sorted(anos):
+            receitas, despesas, quantidade_ano = anos[ano]
+            meses_ano = [mes for mes in meses if mes.startswith(ano)]
+            tendencia_anos.append({
+                "ano": int(ano),
+                "receitas": receitas,
+                "despesas": despesas,
+                "saldo": receitas + despesas,
+                "quantidade": quantidade_ano,
+                "gasto_mensal_medio": -despesas // len(meses_ano) if meses_ano else 0,
+                "variacao_despesas_pct": (None if not anterior else
+                                          round(100 * (despesas - anterior) / anterior, 1)),
+            })
+            anterior = despesas
+
+        categorias = []
+        listas = []
+        for categoria, valores in por_categoria.items():
+            self._verificar()
+            ordenados = sorted(valores)
+            listas.append(ordenados)
+            total = sum(ordenados)
+            categorias.append({
+                "categoria": categoria,
+                "quantidade": len(ordenados),
+                "total": total,
+                "media": total // len(ordenados),
+                "mediana": percentil(ordenados, 0.5),
+                "p90": percentil(ordenados, 0.9),
+                "maximo": ordenados[-1],
+                "media_mensal": total // len(meses),
+            })
+        categorias.sort(key=lambda item: item["total"], reverse=True)
+
+        self._verificar()
+        return {
+            "transacoes": quantidade,
+            "anos": tendencia_anos,
+            "meses": tendencia_meses,
+            "categorias": categorias,
+            "percentis": {nome: percentil_de_listas(listas, fracao)
+                          for nome, fracao in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))},
+        }
+
+
+def secoes_estatisticas(resultado, categorias=15, meses=12):
+    """Texto do relatório de estatísticas, em seções (listas de linhas),
+    para a linha de comando e o app"""
+    percentis = resultado["percentis"]
+    resumo = [f"{resultado['transacoes']} transações",
+              f"Gastos: mediana R$ {formatar_centavos(percentis['p50'])}, "
+              f"p90 R$ {formatar_centavos(percentis['p90'])}, "
+              f"p99 R$ {formatar_centavos(percentis['p99'])}"]
+
+    por_ano = ["Por ano"]
+    for ano in resultado["anos"]:
+        variacao = ano["variacao_despesas_pct"]
+        por_ano.append(f"  {ano['ano']}  receitas R$ {formatar_centavos(ano['receitas'])}  "
+                       f"despesas R$ {formatar_centavos(ano['despesas'])}  "
+                       f"saldo R$ {formatar_centavos(ano['saldo'])}  "
+                       f"média/mês R$ {formatar_centavos(ano['gasto_mensal_medio'])}"
+                       + (f"  ({variacao:+.1f}% despesas)" if variacao is not None else ""))
+
+    por_mes = [f"Últimos {meses} meses (gastos e variação)"]
+    for mes in resultado["meses"][-meses:]:
+        variacao = mes["variacao"]
+        texto = f"  {mes['mes']}  R$ {formatar_centavos(mes['gastos']):>12}"
+        if variacao is not None:
+            texto += f"  {formatar_centavos(variacao, sinal=True):>12}"
+            if mes["variacao_pct"] is not None:
+                texto += f" ({mes['variacao_pct']:+.1f}%)"
+        por_mes.append(texto)
+
+    por_categoria = ["Categorias (total, média, mediana, p90, média mensal)"]
+    for item in resultado["categorias"][:categorias]:
+        por_categoria.append(
+            f"  {item['categoria'][:24]:<24} {item['quantidade']:>6}x "
+            f"R$ {formatar_centavos(item['total'])}  "
+            f"{formatar_centavos(item['media'])} / {formatar_centavos(item['mediana'])} / "
+            f"{formatar_centavos(item['p90'])}  {formatar_centavos(item['media_mensal'])}/mês")
+    return [resumo, por_ano, por_mes, por_categoria]
+
+
+class Exportacao:
+    """Exportação do histórico e da análise numa thread, gravada em blocos.
+
+    Trabalha sobre um instantâneo (LivroCaixa.exportacao): as transações
+    saem de um gerador sobre as colunas copiadas e os meses arquivados
+    (lidos do disco), BLOCO de cada vez, para um arquivo temporário, de modo
+    que a memória não cresce com o tamanho do histórico. Formatos: "csv" e
+    "jsonl" (os gastos por mês e categoria vão num arquivo ao lado,
+    .analise.csv/.analise.jsonl), "json" (lista de transações, o formato de
+    dados das versões anteriores) e "html" (relatório para imprimir ou
+    salvar em PDF pelo navegador: resumo, gastos por mês e categoria e as
+    transações). ao_progresso(gravadas, total) é chamada a cada bloco e
+    ao_concluir recebe {"transacoes": n, "arquivos": [...]} ou {"erro": ...};
+    cancelar() interrompe no próximo bloco sem deixar arquivos parciais.
+    """
+
+    BLOCO = 4096
+    FORMATOS = ("csv", "jsonl", "json", "html")
+
+    def __init__(self, instantaneo, arquivo, formato="csv", ao_progresso=None, ao_concluir=None):
+        if formato not in self.FORMATOS:
+            raise ValueError(f"formato deve ser um de {', '.join(self.FORMATOS)}")
+        self.instantaneo = instantaneo
+        self.arquivo = arquivo
+        self.formato = formato
+        self.ao_progresso = ao_progresso
+        self.ao_concluir = ao_concluir
+        self.cancelado = threading.Event()
+        self.total = (sum(instantaneo["loja"].vivas)
+                      + instantaneo.get("quantidade_arquivadas", 0))
+        self.gravadas = 0
+
+    @classmethod
+    def formato_do_arquivo(cls, arquivo):
+        """Formato pela extensão do arquivo (CSV se não for conhecida)"""
+        extensao = os.path.splitext(arquivo)[1].lower().lstrip(".")
+        extensao = "html" if extensao == "htm" else extensao
+        return extensao if extensao in cls.FORMATOS else "csv"
+
+    def iniciar(self):
+        threading.Thread(target=self._executar, daemon=True).start()
+
+    def cancelar(self):
+        self.cancelado.set()
+
+    def _executar(self):
+        try:
+            resultado = self.processar()
+        except CalculoCancelado:
+            return
+        except Exception as e:
+            resultado = {"erro": str(e)}
+        if not self.cancelado.is_set() and self.ao_concluir is not None:
+            self.ao_concluir(resultado)
+
+    def transacoes(self):
+        """Gera as transações (dicts do JSON), arquivadas primeiro, por serem
+        as mais antigas; conta em self.gravadas as já geradas"""
+        arquivadas = self.instantaneo.get("arquivadas")
+        if arquivadas is not None:
+            for transacao in arquivadas(None, None):
+                self.gravadas += 1
+                yield transacao
+        loja = self.instantaneo["loja"]
+        ids, centavos, minutos, descricoes, edicoes, textos = (
+            loja.ids, loja.centavos, loja.minutos, loja.descricoes, loja.edicoes, loja.textos)
+        # Datas repetem muito (várias transações por dia): o dia é formatado uma vez
+        dias = {}
+
+        def data(valor):
+            dia, minuto = divmod(valor, 1440)
+            texto = dias.get(dia)
+            if texto is None:
+                texto = dias[dia] = data_de_minutos(dia * 1440)[:10]
+            return f"{texto} {minuto // 60:02d}:{minuto % 60:02d}"
+
+        for linha in compress(range(len(loja.vivas)), loja.vivas):
+            transacao = {"id": ids[linha], "valor": centavos[linha] / 100,
+                         "descricao": textos[descricoes[linha]], "data": data(minutos[linha])}
+            if edicoes[linha] >= 0:
+                transacao["data_edicao"] = data(edicoes[linha])
+            self.gravadas += 1
+            yield transacao
+
+    def analise(self):
+        """(mes, categoria, quantidade, total) dos gastos, mês a mês e do
+        maior gasto para o menor, como na aba Análise"""
+        for mes, topicos in sorted(self.instantaneo["analise"].items()):
+            for topico, (quantidade, total) in sorted(topicos.items(),
+                                                      key=lambda item: -item[1][1]):
+                yield mes, topico, quantidade, total
+
+    def _gravar(self, arquivo, linhas, escrever):
+        """Grava `linhas` em blocos via `escrever(f, bloco)` num temporário,
+        trocado pelo arquivo final só no fim"""
+        temporario = arquivo + ".tmp"
+        try:
+            with open(temporario, 'w', encoding='utf-8', newline='') as f:
+                while True:
+                    if self.cancelado.is_set():
+                        raise CalculoCancelado()
+                    bloco = list(islice(linhas, self.BLOCO))
+                    if not bloco:
+                        break
+                    escrever(f, bloco)
+                    if self.ao_progresso is not None:
+                        self.ao_progresso(self.gravadas, self.total)
+                    time.sleep(0)  # deixa a thread da UI desenhar o próximo quadro
+            os.replace(temporario, arquivo)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+
+    @staticmethod
+    def _escrever_csv(f, bloco):
+        csv.writer(f, delimiter=';').writerows(bloco)
+
+    @staticmethod
+    def _escrever_texto(f, bloco):
+        f.write("".join(bloco))
+
+    @instrumentos.cronometrado("exportar")
+    def processar(self):
+        """Grava a exportação (na thread que chamar); retorna o resumo"""
+        base, extensao = os.path.splitext(self.arquivo)
+        arquivos = [self.arquivo]
+        if self.formato == "csv":
+            self._gravar(self.arquivo, chain(
+                [["data", "descricao", "valor"]],
+                ([t["data"], t["descricao"], formatar_centavos(centavos_de_valor(t["valor"]))]
+                 for t in self.transacoes())), self._escrever_csv)
+            arquivos.append(f"{base}.analise{extensao}")
+            self._gravar(arquivos[-1], chain(
+                [["mes", "categoria", "quantidade", "total"]],
+                ([mes, topico, quantidade, formatar_centavos(total)]
+                 for mes, topico, quantidade, total in self.analise())), self._escrever_csv)
+        elif self.formato == "jsonl":
+            self._gravar(self.arquivo, (json.dumps(t, ensure_ascii=False) + "\n"
+                                        for t in self.transacoes()), self._escrever_texto)
+            arquivos.append(f"{base}.analise{extensao}")
+            self._gravar(arquivos[-1], (json.dumps(
+                {"mes": mes, "categoria": topico, "quantidade": quantidade,
+                 "total": total / 100}, ensure_ascii=False) + "\n"
+                for mes, topico, quantidade, total in self.analise()), self._escrever_texto)
+        elif self.formato == "json":
+            # Um elemento da lista por linha, com a vírgula antes de cada um dos seguintes
+            elementos = (json.dumps(t, ensure_ascii=False) for t in self.transacoes())
+            primeiro = next(elementos, None)
+            corpo = () if primeiro is None else chain(
+                ["  " + primeiro], (",\n  " + elemento for elemento in elementos))
+            self._gravar(self.arquivo, chain(["[\n"], corpo, ["\n]\n"]), self._escrever_texto)
+        else:
+            self._gravar(self.arquivo, self.linhas_html(), self._escrever_texto)
+        return {"transacoes": self.gravadas, "arquivos": arquivos}
+
+    def linhas_html(self):
+        """Relatório imprimível: resumo, gastos por mês e categoria e transações"""
+        escapar = html.escape
+        receitas, despesas = self.instantaneo["receitas"], self.instantaneo["despesas"]
+        gerado = datetime.now().strftime("%d/%m/%Y %H:%M")
+        yield ('<!DOCTYPE html>\n<html lang="pt-BR"><head><meta charset="utf-8">\n'
+               f"<title>DuC Finanças - relatório de {gerado}</title>\n"
+               "<style>body{font-family:sans-serif;font-size:11pt}"
+               "table{border-collapse:collapse;width:100%;margin-bottom:1em}"
+               "th,td{border-bottom:1px solid #ccc;padding:2px 6px;text-align:left}"
+               ".valor{text-align:right;font-variant-numeric:tabular-nums}"
+               "thead{display:table-header-group}tr{break-inside:avoid}"
+               "h2{break-before:page}@page{size:A4;margin:15mm}</style></head><body>\n"
+               f"<h1>DuC Finanças</h1><p>Relatório gerado em {gerado}</p>\n"
+               f"<table><tr><td>Transações</td><td class=valor>{self.total}</td></tr>"
+               f"<tr><td>Receitas</td><td class=valor>R$ {formatar_centavos(receitas)}</td></tr>"
+               f"<tr><td>Despesas</td><td class=valor>R$ {formatar_centavos(despesas)}</td></tr>"
+               f"<tr><td>Saldo</td><td class=valor>R$ {formatar_centavos(receitas + despesas)}"
+               "</td></tr></table>\n"
+               "<h2>Gastos por mês e categoria</h2>\n<table><thead><tr><th>Mês</th>"
+               "<th>Categoria</th><th class=valor>Qtd.</th><th class=valor>Total</th>"
+               "</tr></thead>\n")
+        for mes, topico, quantidade, total in self.analise():
+            yield (f"<tr><td>{mes}</td><td>{escapar(topico)}</td><td class=valor>{quantidade}"
+                   f"</td><td class=valor>R$ {formatar_centavos(total)}</td></tr>\n")
+        yield ("</table>\n<h2>Transações</h2>\n<table><thead><tr><th>Data</th>"
+               "<th>Descrição</th><th class=valor>Valor</th></tr></thead>\n")
+        for transacao in self.transacoes():
+            yield (f"<tr><td>{transacao['data']}</td><td>{escapar(transacao['descricao'])}</td>"
+                   f"<td class=valor>{formatar_centavos(centavos_de_valor(transacao['valor']))}"
+                   "</td></tr>\n")
+        yield "</table>\n</body></html>\n"
+
+
+class ArvoreFenwick:
+    """Somas de prefixo com atualização pontual, ambas em O(log n)"""
+
+    def __init__(self, valores):
+        # Montagem em O(n): cada nó repassa sua soma ao pai
+        self.arvore = array('q', [0]) + array('q', valores)
+        for i in range(1, len(self.arvore)):
+            pai = i + (i & -i)
+            if pai < len(self.arvore):
+                self.arvore[pai] += self.arvore[i]
+
+    def somar(self, posicao, delta):
+        i = posicao + 1
+        while i < len(self.arvore):
+            self.arvore[i] += delta
+            i += i & -i
+
+    def prefixo(self, posicao):
+        """Soma das posições 0..posicao"""
+        total = 0
+        i = min(posicao + 1, len(self.arvore) - 1)
+        while i > 0:
+            total += self.arvore[i]
+            i -= i & -i
+        return total
+
+
+class IndiceDatas:
+    """Receitas, despesas e quantidade por dia, em árvores de Fenwick.
+
+    Responde saldo numa data e totais de um período em O(log n) sem varrer
+    o histórico, e aceita lançamentos retroativos (fora do intervalo de dias
+    atual, o intervalo é ampliado e as árvores remontadas, o que é raro).
+    Os valores diários ficam também em arrays simples, para as séries.
+    """
+
+    MARGEM_DIAS = 366
+
+    def __init__(self):
+        self.primeiro_dia = 0
+        self.receitas = array('q')
+        self.despesas = array('q')
+        self.quantidades = array('q')
+        self._montar_arvores()
+
+    @classmethod
+    def construir(cls, loja, arquivados=()):
+        """Monta o índice a partir das colunas da loja, em O(n + dias);
+        `arquivados` traz [dia, receitas, despesas, quantidade] de dias que
+        não estão na loja (meses arquivados, pelos totais do manifesto)"""
+        indice = cls()
+        linhas = list(compress(range(len(loja.vivas)), loja.vivas))
+        arquivados = list(arquivados)
+        if not linhas and not arquivados:
+            return indice
+        minutos, centavos = loja.minutos, loja.centavos
+        dias = [minutos[linha] // 1440 for linha in linhas]
+        todos = dias + [totais[0] for totais in arquivados]
+        indice.primeiro_dia = min(todos)
+        tamanho = max(todos) - indice.primeiro_dia + 1 + cls.MARGEM_DIAS
+        receitas, despesas, quantidades = ([0] * tamanho for _ in range(3))
+        for linha, dia in zip(linhas, dias):
+            posicao = dia - indice.primeiro_dia
+            if centavos[linha] > 0:
+                receitas[posicao] += centavos[linha]
+            else:
+                despesas[posicao] += centavos[linha]
+            quantidades[posicao] += 1
+        for dia, receitas_dia, despesas_dia, quantidade in arquivados:
+            posicao = dia - indice.primeiro_dia
+            receitas[posicao] += receitas_dia
+            despesas[posicao] += despesas_dia
+            quantidades[posicao] += quantidade
+        indice.receitas = array('q', receitas)
+        indice.despesas = array('q', despesas)
+        indice.quantidades = array('q', quantidades)
+        indice._montar_arvores()
+        return indice
+
+    def _montar_arvores(self):
+        self.arvore_receitas = ArvoreFenwick(self.receitas)
+        self.arvore_despesas = ArvoreFenwick(self.despesas)
+        self.arvore_quantidades = ArvoreFenwick(self.quantidades)
+
+    def _ampliar(self, dia):
+        """Estende o intervalo de dias para incluir `dia` (com folga)"""
+        if not len(self.receitas):
+            self.primeiro_dia = dia
+        antes = max(0, self.primeiro_dia - dia + (self.MARGEM_DIAS if dia < self.primeiro_dia else 0))
+        depois = max(0, dia - (self.primeiro_dia + len(self.receitas) - 1))
+        if depois:
+            depois += self.MARGEM_DIAS
+        for nome in ("receitas", "despesas", "quantidades"):
+            coluna = getattr(self, nome)
+            setattr(self, nome, array('q', bytes(8 * antes)) + coluna + array('q', bytes(8 * depois)))
+        self.primeiro_dia -= antes
+        self._montar_arvores()
+
+    def adicionar(self, minutos, centavos, sinal=1):
+        """Soma (ou subtrai, com sinal=-1) um lançamento no seu dia"""
+        dia = minutos // 1440
+        if not self.primeiro_dia <= dia < self.primeiro_dia + len(self.receitas):
+            self._ampliar(dia)
+        posicao = dia - self.primeiro_dia
+        if centavos > 0:
+            self.receitas[posicao] += sinal * centavos
+            self.arvore_receitas.somar(posicao, sinal * centavos)
+        else:
+            self.despesas[posicao] += sinal * centavos
+            self.arvore_despesas.somar(posicao, sinal * centavos)
+        self.quantidades[posicao] += sinal
+        self.arvore_quantidades.somar(posicao, sinal)
+
+    def remover(self, minutos, centavos):
+        self.adicionar(minutos, centavos, sinal=-1)
+
+    def _posicao(self, minutos):
+        """Posição do dia de `minutos` nas árvores (-1 se anterior ao primeiro dia)"""
+        return max(-1, minutos // 1440 - self.primeiro_dia)
+
+    def totais_ate(self, minutos=None):
+        """(receitas, despesas, quantidade) até o fim do dia de `minutos` (None = tudo)"""
+        posicao = len(self.receitas) - 1 if minutos is None else self._posicao(minutos)
+        if posicao < 0:
+            return 0, 0, 0
+        return (self.arvore_receitas.prefixo(posicao), self.arvore_despesas.prefixo(posicao),
+                self.arvore_quantidades.prefixo(posicao))
+
+    def totais(self, inicio=None, fim=None):
+        """(receitas, despesas, quantidade) dos dias de `inicio` a `fim`, inclusive
+        (None = sem limite); período invertido não tem lançamentos"""
+        if inicio is not None and fim is not None and inicio // 1440 > fim // 1440:
+            return 0, 0, 0
+        ate_fim = self.totais_ate(fim)
+        antes = (0, 0, 0) if inicio is None else self.totais_ate(inicio - 1440)
+        return tuple(a - b for a, b in zip(ate_fim, antes))
+
+    def saldo_em(self, minutos):
+        """Saldo ao fim do dia de `minutos`"""
+        receitas, despesas, quantidade = self.totais_ate(minutos)
+        return receitas + despesas
+
+    def serie_saldo(self, inicio=None, fim=None, por="dia"):
+        """Gera (dia em minutos, saldo ao fim do dia) ou, com por="mes",
+        ("AAAA-MM", saldo ao fim do mês), de `inicio` a `fim`"""
+        if not len(self.receitas):
+            return
+        ultimo_dia = self.primeiro_dia + len(self.receitas) - 1
+        dia = self.primeiro_dia if inicio is None else inicio // 1440
+        fim_dia = ultimo_dia if fim is None else fim // 1440
+        # Os cortes de dias vazios só olham dias dentro do índice
+        if inicio is None:
+            # Sem início: começa no primeiro dia com lançamentos
+            while dia <= min(fim_dia, ultimo_dia) and not self.quantidades[dia - self.primeiro_dia]:
+                dia += 1
+        if fim is None:
+            fim_dia = max(fim_dia, dia)
+            while (fim_dia > max(dia, self.primeiro_dia)
+                   and not self.quantidades[fim_dia - self.primeiro_dia]):
+                fim_dia -= 1
+
+        saldo = self.saldo_em((dia - 1) * 1440)
+        mes_atual, saldo_mes = None, saldo
+        for dia in range(dia, fim_dia + 1):
+            posicao = dia - self.primeiro_dia
+            if 0 <= posicao < len(self.receitas):
+                saldo += self.receitas[posicao] + self.despesas[posicao]
+            if por == "mes":
+                mes = mes_de_minutos(dia * 1440)
+                if mes_atual is not None and mes != mes_atual:
+                    yield mes_atual, saldo_mes
+                mes_atual, saldo_mes = mes, saldo
+            else:
+                yield dia * 1440, saldo
+        if por == "mes" and mes_atual is not None:
+            yield mes_atual, saldo_mes
+
+
+def inserir_em_ordem(linhas, linha):
+    """Insere `linha` numa lista crescente de linhas, se ainda não estiver nela"""
+    posicao = bisect_left(linhas, linha)
+    if posicao == len(linhas) or linhas[posicao] != linha:
+        linhas.insert(posicao, linha)
+
+
+def linhas_decrescentes(listas):
+    """Intercala listas crescentes de linhas sob demanda, da maior linha
+    (a mais recente) para a menor, sem repetir linhas que constem de duas"""
+    if len(listas) == 1:
+        yield from reversed(listas[0])
+        return
+    anterior = None
+    for linha in heapq.merge(*map(reversed, listas), reverse=True):
+        if linha != anterior:
+            anterior = linha
+            yield linha
+
+
+class IndiceBusca:
+    """Índice invertido por prefixo sobre as descrições da LojaTransacoes.
+
+    Dois níveis: termo normalizado (minúsculas, sem acentos) -> textos
+    internados da loja que o contêm, e texto -> linhas que o usam. O
+    vocabulário fica ordenado, então todos os termos com um prefixo saem de
+    um bisect, e uma busca só visita as linhas dos textos encontrados. As
+    linhas de cada texto ficam em ordem crescente (uma edição insere com
+    bisect), de modo que várias listas se intercalam sob demanda.
+    Textos e linhas novos são indexados de forma incremental na busca
+    seguinte; se a loja renumerar as linhas (limpeza ou descarte de linhas
+    mortas), as listas de linhas são refeitas.
+    """
+
+    def __init__(self):
+        self.textos = None
+        self.textos_indexados = 0
+        self.textos_por_termo = {}  # termo -> {índice do texto na loja}
+        self.vocabulario = []       # termos, em ordem
+        self.ids = None
+        self.linhas_indexadas = 0
+        self.linhas_por_texto = {}  # índice do texto -> array de linhas
+
+    @staticmethod
+    def termos(texto):
+        return set(re.findall(r"\w+", normalizar_texto(texto)))
+
+    def atualizar(self, loja):
+        """Indexa o que a loja acrescentou desde a última busca"""
+        if loja.textos is not self.textos:
+            self.textos = loja.textos
+            self.textos_indexados = 0
+            self.textos_por_termo = {}
+        novos_termos = False
+        for indice in range(self.textos_indexados, len(self.textos)):
+            for termo in self.termos(self.textos[indice]):
+                indices = self.textos_por_termo.get(termo)
+                if indices is None:
+                    indices = self.textos_por_termo[termo] = set()
+                    novos_termos = True
+                indices.add(indice)
+        if novos_termos or not self.textos_indexados:
+            self.vocabulario = sorted(self.textos_por_termo)
+        self.textos_indexados = len(self.textos)
+
+        if loja.ids is not self.ids:
+            self.ids = loja.ids
+            self.linhas_indexadas = 0
+            self.linhas_por_texto = {}
+        descricoes = loja.descricoes
+        for linha in range(self.linhas_indexadas, len(descricoes)):
+            linhas = self.linhas_por_texto.get(descricoes[linha])
+            if linhas is None:
+                linhas = self.linhas_por_texto[descricoes[linha]] = array('i')
+            linhas.append(linha)
+        self.linhas_indexadas = len(descricoes)
+
+    def mover(self, linha, texto):
+        """Registra que a descrição de uma linha já indexada foi editada"""
+        if linha < self.linhas_indexadas:
+            inserir_em_ordem(self.linhas_por_texto.setdefault(texto, array('i')), linha)
+
+    def textos_da_consulta(self, consulta):
+        """Textos em que cada palavra da consulta é prefixo de algum termo"""
+        encontrados = None
+        vocabulario = self.vocabulario
+        for palavra in self.termos(consulta):
+            indices = set()
+            posicao = bisect_left(vocabulario, palavra)
+            while posicao < len(vocabulario) and vocabulario[posicao].startswith(palavra):
+                indices |= self.textos_por_termo[vocabulario[posicao]]
+                posicao += 1
+            encontrados = indices if encontrados is None else encontrados & indices
+            if not encontrados:
+                break
+        return encontrados if encontrados is not None else set(range(self.textos_indexados))
+
+    def listas(self, alvo):
+        """Listas de linhas (crescentes) dos textos em `alvo`; podem trazer
+        linhas excluídas ou que saíram do texto numa edição"""
+        return [self.linhas_por_texto[indice] for indice in alvo
+                if indice in self.linhas_por_texto]
+
+    def mascara(self, alvo):
+        """bytearray indexado pelo texto: 1 para os textos em `alvo`"""
+        mascara = bytearray(len(self.textos))
+        for indice in alvo:
+            mascara[indice] = 1
+        return mascara
+
+    def linhas(self, loja, consulta):
+        """Linhas vivas, em ordem, cuja descrição casa com a consulta"""
+        self.atualizar(loja)
+        return self.linhas_dos_textos(loja, self.textos_da_consulta(consulta))
+
+    def linhas_dos_textos(self, loja, alvo):
+        """Linhas vivas, em ordem, cuja descrição é um dos textos em `alvo`
+        (índices na loja); chame atualizar(loja) antes"""
+        listas = self.listas(alvo)
+        if not listas:
+            return []
+        # Descarta linhas excluídas e as que saíram do texto numa edição
+        mascara = self.mascara(alvo)
+        descricoes, vivas = loja.descricoes, loja.vivas
+        linhas = [linha for linha in linhas_decrescentes(listas)
+                  if vivas[linha] and mascara[descricoes[linha]]]
+        linhas.reverse()
+        return linhas
+
+
+class IndiceMeses:
+    """Linhas da LojaTransacoes por mês, para ler um mês sem varrer o histórico.
+
+    Mantido como as listas de linhas do IndiceBusca: linhas novas entram na
+    consulta seguinte, uma edição de data acrescenta a linha ao mês novo (a
+    lista antiga é filtrada na leitura) e uma renumeração da loja refaz
+    tudo.
+    """
+
+    def __init__(self):
+        self.ids = None
+        self.linhas_indexadas = 0
+        self.linhas_por_mes = {}  # mes -> array de linhas
+
+    def atualizar(self, loja, mes_de):
+        """Indexa as linhas acrescentadas desde a última consulta"""
+        if loja.ids is not self.ids:
+            self.ids = loja.ids
+            self.linhas_indexadas = 0
+            self.linhas_por_mes = {}
+        inicio = self.linhas_indexadas
+        dias = [minutos // 1440 for minutos in loja.minutos[inicio:]]
+        meses_por_dia = {dia: mes_de(dia * 1440) for dia in set(dias)}
+        acrescentar = {mes: self.linhas_por_mes.setdefault(mes, array('i')).append
+                       for mes in set(meses_por_dia.values())}
+        for linha, dia in enumerate(dias, inicio):
+            acrescentar[meses_por_dia[dia]](linha)
+        self.linhas_indexadas = inicio + len(dias)
+
+    def mover(self, linha, mes):
+        """Registra que a data de uma linha já indexada foi editada"""
+        if linha < self.linhas_indexadas:
+            inserir_em_ordem(self.linhas_por_mes.setdefault(mes, array('i')), linha)
+
+    def linhas(self, loja, mes):
+        """Linhas vivas, em ordem, com data no mês; chame atualizar(loja) antes"""
+        inicio, fim = intervalo_do_mes(mes)
+        minutos, vivas = loja.minutos, loja.vivas
+        return sorted({linha for linha in self.linhas_por_mes.get(mes, ())
+                       if vivas[linha] and inicio <= minutos[linha] < fim})
+
+
+# Sincronização entre dispositivos
+
+ESTRUTURA_HASH = struct.Struct("<qqii")
+ESTRUTURA_LAPIDE = struct.Struct("<qi")
+
+
+def hash_transacao(transacao_id, centavos, minutos, descricao, edicao):
+    """Hash de 128 bits do conteúdo de uma transação (edicao = -1 se nunca editada)"""
+    dados = ESTRUTURA_HASH.pack(transacao_id, centavos, minutos, edicao) + descricao.encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(dados, digest_size=16).digest(), 'little')
+
+
+def hash_lapide(transacao_id, exclusao):
+    """Hash de 128 bits da lápide de uma transação excluída"""
+    return int.from_bytes(hashlib.blake2b(ESTRUTURA_LAPIDE.pack(transacao_id, exclusao),
+                                          digest_size=16, person=b"lapide").digest(), 'little')
+
+
+def raiz_hashes(hashes):
+    """Hash único dos hashes por mês ({mes: hex}): igual nos dois lados, nada a mesclar"""
+    return hashlib.blake2b("".join(f"{mes}:{valor};" for mes, valor in sorted(hashes.items()))
+                           .encode(), digest_size=16).hexdigest()
+
+
+def dict_de_registro(registro):
+    """Transação no formato de dict a partir de um registro [id, centavos,
+    minutos, descrição, edição] da sincronização"""
+    transacao_id, centavos, minutos, descricao, edicao = registro
+    transacao = {"id": transacao_id, "valor": centavos / 100,
+                 "descricao": descricao, "data": data_de_minutos(minutos)}
+    if edicao >= 0:
+        transacao["data_edicao"] = data_de_minutos(edicao)
+    return transacao
+
+
+class IndiceHashes:
+    """Hash do conteúdo de cada mês, para comparar dois livros mês a mês.
+
+    Como numa árvore de Merkle, a raiz resume os meses e cada mês resume
+    suas transações e lápides; só os meses com hash diferente precisam ser
+    lidos. O hash de um mês é o XOR dos hashes de suas transações e
+    lápides, então cada operação o atualiza em O(1) (retirar e incluir são
+    o mesmo XOR). Vai no snapshot; só é montado do zero para dados
+    gravados por versões anteriores ou no SQLite.
+    """
+
+    def __init__(self, hashes=None):
+        self.hashes = dict(hashes or {})  # mes -> int
+
+    @classmethod
+    def construir(cls, loja, lapides):
+        """Monta o índice a partir das colunas da loja e das lápides, em O(n)"""
+        indice = cls()
+        meses_por_dia = {}
+        ids, centavos, minutos = loja.ids, loja.centavos, loja.minutos
+        descricoes, edicoes, textos = loja.descricoes, loja.edicoes, loja.textos
+        for linha in compress(range(len(loja.vivas)), loja.vivas):
+            dia = minutos[linha] // 1440
+            mes = meses_por_dia.get(dia)
+            if mes is None:
+                mes = meses_por_dia[dia] = mes_de_minutos(dia * 1440)
+            indice.alternar(mes, hash_transacao(ids[linha], centavos[linha], minutos[linha],
+                                                textos[descricoes[linha]], edicoes[linha]))
+        for transacao_id, (mes, exclusao) in lapides.items():
+            indice.alternar(mes, hash_lapide(transacao_id, exclusao))
+        return indice
+
+    def alternar(self, mes, valor):
+        """Inclui no mês um hash ausente, ou retira um presente"""
+        resultado = self.hashes.get(mes, 0) ^ valor
+        if resultado:
+            self.hashes[mes] = resultado
+        else:
+            self.hashes.pop(mes, None)
+
+    def exportar(self):
+        """{mes: hash em hexadecimal}"""
+        return {mes: f"{valor:032x}" for mes, valor in self.hashes.items()}
+
+
+class ReplicaPasta:
+    """Cópia de um livro numa pasta de sincronização, gravada por um
+    dispositivo e lida pelos outros.
+
+    Um manifesto com a raiz e os hashes por mês e um JSON por mês com as
+    transações (registros [id, centavos, minutos, descrição, edição], sem
+    datas em texto para converter) e as lápides. Serve qualquer pasta compartilhada (Syncthing,
+    Dropbox, cartão de memória): não há serviço de rede. Oferece a mesma
+    leitura do LivroCaixa (hashes_mensais e conteudo_meses), então um
+    livro mescla uma réplica ou outro livro do mesmo jeito.
+    """
+
+    def __init__(self, pasta):
+        self.pasta = pasta
+        self.arquivo_manifesto = os.path.join(pasta, "manifesto.json")
+
+    def arquivo_mes(self, mes):
+        return os.path.join(self.pasta, f"{mes}.json")
+
+    def manifesto(self):
+        try:
+            with open(self.arquivo_manifesto, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def hashes_mensais(self):
+        return self.manifesto().get("hashes", {})
+
+    def conteudo_meses(self, meses):
+        """{mes: {"transacoes": [registros], "lapides": {id: minutos da exclusão}}}"""
+        conteudo = {}
+        for mes in meses:
+            try:
+                with open(self.arquivo_mes(mes), 'r', encoding='utf-8') as f:
+                    gravado = json.load(f)
+            except FileNotFoundError:
+                gravado = {}
+            conteudo[mes] = {
+                "transacoes": gravado.get("transacoes", []),
+                "lapides": {int(transacao_id): exclusao
+                            for transacao_id, exclusao in gravado.get("lapides", {}).items()}
+            }
+        return conteudo
+
+    def gravar(self, livro, dispositivo):
+        """Atualiza a réplica com o livro, regravando só os meses cujo hash
+        mudou (e o manifesto por último); retorna quantos meses gravou"""
+        os.makedirs(self.pasta, exist_ok=True)
+        anteriores = self.hashes_mensais()
+        hashes = livro.hashes_mensais()
+        alterados = [mes for mes, valor in hashes.items() if anteriores.get(mes) != valor]
+        for mes, conteudo in livro.conteudo_meses(alterados).items():
+            gravar_json(self.arquivo_mes(mes), {
+                "transacoes": conteudo["transacoes"],
+                "lapides": {str(transacao_id): exclusao
+                            for transacao_id, exclusao in conteudo["lapides"].items()}
+            })
+        for mes in anteriores.keys() - hashes.keys():
+            try:
+                os.remove(self.arquivo_mes(mes))
+            except FileNotFoundError:
+                pass
+        gravar_json(self.arquivo_manifesto, {
+            "versao": 1,
+            "dispositivo": dispositivo,
+            "gravado_em": datetime.now().strftime("%d/%m/%Y %H:%M"),
+            "raiz": raiz_hashes(hashes),
+            "hashes": hashes
+        })
+        return len(alterados)
+
+
+# Orçamentos mensais por categoria
+
+# Frações do limite que geram aviso quando um gasto as cruza
+LIMIARES_ORCAMENTO = (0.8, 1.0)
+
+
+def orcamentos_de_config(orcamentos):
+    """{categoria: limite em centavos} a partir da config ({categoria: reais});
+    ValueError se algum limite não for positivo"""
+    limites = {}
+    for categoria, limite in orcamentos.items():
+        centavos = centavos_de_valor(float(limite))
+        if centavos <= 0:
+            raise ValueError(f"limite de {categoria!r} deve ser positivo")
+        limites[categoria] = centavos
+    return limites
+
+
+def descrever_alerta_orcamento(mes, categoria, fracao, total, limite):
+    """Texto do aviso de um orçamento cruzado (valores em centavos)"""
+    if fracao >= 1:
+        return (f"Orçamento de {categoria} estourado em {mes}: "
+                f"R$ {formatar_centavos(total)} de R$ {formatar_centavos(limite)}")
+    return (f"Orçamento de {categoria} em {mes}: {total * 100 // limite}% "
+            f"(R$ {formatar_centavos(total)} de R$ {formatar_centavos(limite)})")
+
+
+# Transações recorrentes
+
+FREQUENCIAS = ("mensal", "semanal", "dias")
+
+
+class Recorrencia:
+    """Regra de transação recorrente (salário, aluguel, assinaturas).
+
+    Guardada de forma compacta na config ("recorrencias"): as ocorrências
+    são calculadas pelo seu número na série, só para a janela pedida, sem
+    expandir a série. `ate` é a data (em minutos) da última ocorrência já
+    lançada no histórico; as seguintes são previstas.
+    """
+
+    __slots__ = ("id", "descricao", "centavos", "frequencia", "intervalo", "inicio", "fim",
+                 "ate", "passo", "mes_inicial", "dia", "hora")
+
+    def __init__(self, id, descricao, centavos, frequencia="mensal", intervalo=1,
+                 inicio=0, fim=None, ate=None):
+        if frequencia not in FREQUENCIAS:
+            raise ValueError(f"frequência deve ser uma de {', '.join(FREQUENCIAS)}")
+        if int(intervalo) < 1:
+            raise ValueError("intervalo deve ser ao menos 1")
+        if not centavos:
+            raise ValueError("valor não pode ser zero")
+        if not descricao.strip():
+            raise ValueError("descrição não pode estar vazia")
+        if fim is not None and fim < inicio:
+            raise ValueError("fim anterior ao início")
+        self.id = id
+        self.descricao = descricao.strip()
+        self.centavos = centavos
+        self.frequencia = frequencia
+        self.intervalo = int(intervalo)
+        self.inicio = inicio
+        self.fim = fim
+        self.ate = ate
+        self.passo = self.intervalo * (7 * 1440 if frequencia == "semanal" else 1440)
+        # Mensal: mesmo dia (ou o último do mês, se for menor) e hora do início
+        data = EPOCA + timedelta(minutes=inicio)
+        self.mes_inicial = data.year * 12 + data.month - 1
+        self.dia = data.day
+        self.hora = inicio % 1440
+
+    @classmethod
+    def de_dict(cls, dados):
+        """Lê uma regra gravada na config"""
+        return cls(int(dados["id"]), dados["descricao"], centavos_de_valor(dados["valor"]),
+                   dados.get("frequencia", "mensal"), dados.get("intervalo", 1),
+                   minutos_de_data(dados["inicio"]),
+                   minutos_de_data(dados["fim"]) if dados.get("fim") else None,
+                   minutos_de_data(dados["ate"]) if dados.get("ate") else None)
+
+    def como_dict(self):
+        dados = {"id": self.id, "descricao": self.descricao, "valor": self.centavos / 100,
+                 "frequencia": self.frequencia, "intervalo": self.intervalo,
+                 "inicio": data_de_minutos(self.inicio)}
+        if self.fim is not None:
+            dados["fim"] = data_de_minutos(self.fim)
+        if self.ate is not None:
+            dados["ate"] = data_de_minutos(self.ate)
+        return dados
+
+    def ocorrencia(self, numero):
+        """Data (em minutos) da ocorrência `numero` (0 = a do início)"""
+        if self.frequencia != "mensal":
+            return self.inicio + numero * self.passo
+        ano, mes = divmod(self.mes_inicial + numero * self.intervalo, 12)
+        dia = min(self.dia, monthrange(ano, mes + 1)[1])
+        return (date(ano, mes + 1, dia).toordinal() - ORDINAL_EPOCA) * 1440 + self.hora
+
+    def ultima_ate(self, minutos):
+        """Número da última ocorrência em ou antes de `minutos` (-1 se nenhuma)"""
+        if minutos is None or minutos < self.inicio:
+            return -1
+        if self.fim is not None and minutos > self.fim:
+            minutos = self.fim
+        if self.frequencia != "mensal":
+            return (minutos - self.inicio) // self.passo
+        data = EPOCA + timedelta(minutes=minutos)
+        numero = (data.year * 12 + data.month - 1 - self.mes_inicial) // self.intervalo
+        if self.ocorrencia(numero) > minutos:
+            numero -= 1
+        return numero
+
+    def quantidade(self, depois, ate):
+        """Quantas ocorrências caem em (depois, ate]"""
+        return max(0, self.ultima_ate(ate) - self.ultima_ate(depois))
+
+    def ocorrencias(self, depois, ate):
+        """Datas das ocorrências em (depois, ate], geradas sob demanda"""
+        for numero in range(self.ultima_ate(depois) + 1, self.ultima_ate(ate) + 1):
+            yield self.ocorrencia(numero)
+
+    def proxima(self, depois):
+        """Data da primeira ocorrência depois de `depois`, ou None se a série acabou"""
+        minutos = self.ocorrencia(self.ultima_ate(depois) + 1)
+        return minutos if self.fim is None or minutos <= self.fim else None
+
+
+class LivroCaixa:
+    """Regras de negócio do app: carga, IDs, operações, saldo e agregados.
+
+    Não depende de Kivy: o DucFinancasApp é só uma visão sobre um LivroCaixa
+    e a linha de comando usa o mesmo livro. Com `agendar` (uma função que
+    executa outra na thread dona dos dados, como Clock.schedule_once na UI),
+    as operações são gravadas por um EscritorAssincrono; sem ele, cada
+    operação é gravada antes de registrar_operacao retornar.
+    """
+
+    # Transações por operação "lote" ao trazer as novas de outro dispositivo
+    LOTE_SINCRONIZACAO = 1000
+
+    def __init__(self, arquivo_dados="duc_financas_dados.json",
+                 arquivo_config="duc_financas_config.json", agendar=None):
+        self.arquivo_dados = arquivo_dados
+        self.arquivo_config = arquivo_config
+        self.agendar = agendar
+        self.config = {}
+        # Histórico em colunas compactas, indexado por ID
+        self.historico = LojaTransacoes()
+        # Regras de categorização (config "regras_categorias"), usadas pela análise
+        self.regras = RegrasCategorias()
+        self.indice_analise = IndiceAnalise(regras=self.regras)
+        self.indice_busca = IndiceBusca()
+        self.indice_meses = IndiceMeses()
+        # Totais por dia: montado na primeira consulta por data, depois mantido por operação
+        self.indice_datas = None
+        # Exclusões guardadas para a sincronização: {id: (mes, minutos da exclusão)}
+        self.lapides = {}
+        # Hashes por mês: vêm do snapshot (ou são montados na primeira sincronização)
+        self.indice_hashes = None
+        # Limites mensais por categoria, em centavos (config "orcamentos", em reais)
+        self.orcamentos = {}
+        # Chamada com (mes, categoria, fracao, total, limite) quando uma inclusão
+        # ou edição faz o gasto do mês cruzar um dos LIMIARES_ORCAMENTO
+        self.ao_alertar_orcamento = None
+        # Regras recorrentes por ID (config "recorrencias")
+        self.recorrencias = {}
+        self.ultimo_id = 0
+        # Quantas vezes meses arquivados foram trazidos à memória (as linhas são renumeradas)
+        self.cargas = 0
+        self.armazenamento = None
+        self.escritor = None
+        # Motivo da falha na carga dos dados: enquanto houver, o livro fica
+        # somente leitura (nada é gravado por cima do que está no disco)
+        self.erro_carga = None
+
+    def carregar_config(self):
+        """Lê o arquivo de configuração (vazio se não existir)"""
+        if not os.path.exists(self.arquivo_config):
+            return {}
+        try:
+            with open(self.arquivo_config, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Erro ao carregar configuração: {e}")
+            return {}
+
+    def salvar_config(self):
+        """Grava o arquivo de configuração (indentado, para edição manual)"""
+        try:
+            gravar_json(self.arquivo_config, self.config, recuo=2)
+        except Exception as e:
+            print(f"Erro ao salvar configuração: {e}")
+
+    def criar_armazenamento(self):
+        """Escolhe o backend de persistência a partir de arquivo_dados/arquivo_config"""
+        # SQLite se arquivo_dados for um .db ou se a configuração pedir
+        # "armazenamento": "sqlite"; caso contrário, JSON + diário
+        # "particoes" guarda um arquivo por mês numa pasta .particoes
+        base, extensao = os.path.splitext(self.arquivo_dados)
+        if extensao.lower() in (".db", ".sqlite", ".sqlite3"):
+            return BancoSQLite(self.arquivo_dados)
+        if extensao.lower() == ".particoes":
+            return ParticoesMensais(self.arquivo_dados, self.config.get("meses_carregados"))
+        if self.config.get("armazenamento") == "sqlite":
+            return BancoSQLite(base + ".db")
+        if self.config.get("armazenamento") == "particoes":
+            return ParticoesMensais(base + ".particoes", self.config.get("meses_carregados"))
+        return DiarioTransacoes(self.arquivo_dados)
+
+    @instrumentos.cronometrado("carregar")
+    def carregar(self):
+        """Carrega os dados salvos (snapshot + diário de operações, ou SQLite)"""
+        self.config = self.carregar_config()
+        try:
+            self.regras.compilar(self.config.get("regras_categorias", []))
+        except ValueError as e:
+            print(f"Regras de categorização ignoradas: {e}")
+        try:
+            self.orcamentos = self.normalizar_orcamentos(
+                orcamentos_de_config(self.config.get("orcamentos", {})))
+        except (ValueError, TypeError, AttributeError) as e:
+            print(f"Orçamentos ignorados: {e}")
+        try:
+            self.recorrencias = {}
+            for dados in self.config.get("recorrencias", []):
+                recorrencia = Recorrencia.de_dict(dados)
+                self.recorrencias[recorrencia.id] = recorrencia
+        except (ValueError, TypeError, KeyError) as e:
+            print(f"Transações recorrentes ignoradas: {e}")
+        try:
+            self.armazenamento = self.criar_armazenamento()
+            if isinstance(self.armazenamento, BancoSQLite):
+                self.migrar_para_sqlite()
+            elif isinstance(self.armazenamento, ParticoesMensais):
+                self.migrar_para_particoes()
+            self.carregar_de(self.armazenamento)
+        except Exception as e:
+            # O histórico vazio não pode ir para o backend: sem escritor,
+            # operações nem compactação até uma carga bem-sucedida
+            print(f"Erro ao carregar dados: {e} (somente leitura)")
+            self.erro_carga = str(e)
+            self.historico = LojaTransacoes()
+            self.indice_analise = IndiceAnalise(regras=self.regras)
+            self.lapides = {}
+            self.indice_hashes = None
+            return
+        self.erro_carga = None
+        if self.agendar is not None:
+            # A compactação copia as colunas, então volta para a thread dona dos dados
+            self.escritor = EscritorAssincrono(
+                self.armazenamento, lambda: self.agendar(self.compactar))
+
+    def carregar_de(self, armazenamento):
+        """Monta o histórico e os índices a partir de um backend"""
+        snapshot, operacoes = armazenamento.carregar()
+
+        # Se o diário troca as regras de categorização, o snapshot foi gravado
+        # com as anteriores à primeira troca (a configuração já tem as novas)
+        for operacao in operacoes:
+            if operacao["op"] == "regras":
+                self.regras.compilar(operacao.get("anteriores", []))
+                break
+
+        # Só regrava na carga se alguma migração de fato alterou os dados
+        alterado = False
+
+        # Indexa por ID; IDs ausentes ou repetidos (esquema antigo) são regenerados
+        self.historico = snapshot.get("loja") or LojaTransacoes()
+        self.indice_datas = None
+        self.lapides = snapshot.get("lapides") or {}
+        hashes = snapshot.get("hashes")
+        self.indice_hashes = IndiceHashes(hashes) if hashes is not None else None
+        self.ultimo_id = max(self.historico.ids, default=0)
+        for transacao in snapshot["transacoes"]:
+            if transacao.get("id") is None or transacao["id"] in self.historico:
+                transacao["id"] = self.gerar_id()
+                alterado = True
+            else:
+                self.ultimo_id = max(self.ultimo_id, transacao["id"])
+            self.historico.adicionar(transacao)
+        if isinstance(armazenamento, ParticoesMensais):
+            self.ultimo_id = max(self.ultimo_id, armazenamento.ultimo_id)
+
+        # O índice de análise vem pronto no snapshot; só é montado do zero
+        # quando o arquivo está num formato anterior (sem índice em centavos)
+        # ou quando vem do SQLite, que não guarda a análise
+        if snapshot.get("versao", 1) >= 3 and "analise" in snapshot:
+            self.indice_analise = IndiceAnalise(snapshot["analise"], self.regras)
+        else:
+            self.indice_analise = IndiceAnalise.construir(self.historico, self.regras)
+            alterado = alterado or (len(self.historico) > 0
+                                    and not isinstance(armazenamento, BancoSQLite))
+        for operacao in operacoes:
+            self.aplicar_operacao(operacao)
+        if alterado:
+            self.salvar()
+        print(f"Dados carregados: {len(self.historico)} transações "
+              f"({len(operacoes)} operações do diário)")
+        if self.meses_arquivados():
+            print(f"{len(self.meses_arquivados())} meses arquivados "
+                  f"({self.totais_arquivados()[2]} transações) ficam no disco")
+
+    def migrar_para_sqlite(self):
+        """Na primeira execução com SQLite, importa e confere o JSON existente"""
+        banco = self.armazenamento
+        origem = os.path.splitext(banco.arquivo_banco)[0] + ".json"
+        diario = DiarioTransacoes(origem)
+        if banco.migrado() or not diario.existe():
+            return
+        if banco.contar() > 0:
+            print(f"Banco já contém dados; {origem} não será migrado")
+            return
+
+        self.carregar_de(diario)
+        banco.importar(self.historico, origem, self.lapides)
+        print(f"Migração concluída: {len(self.historico)} transações de {origem}")
+
+    def migrar_para_particoes(self):
+        """Na primeira execução com partições, divide o JSON existente por mês"""
+        particoes = self.armazenamento
+        origem = os.path.splitext(particoes.pasta)[0] + ".json"
+        diario = DiarioTransacoes(origem)
+        if os.path.exists(particoes.arquivo_dados) or not diario.existe():
+            return
+
+        self.carregar_de(diario)
+        particoes.compactar(self.historico, self.indice_analise.exportar(), em_segundo_plano=False,
+                            sincronizacao=self.estado_sincronizacao())
+        print(f"Migração concluída: {len(self.historico)} transações de {origem} "
+              f"em {particoes.pasta}")
+
+    @instrumentos.cronometrado("salvar")
+    def salvar(self):
+        """Grava um snapshot completo dos dados (compactação do diário)"""
+        if self.erro_carga is not None:
+            print(f"Dados não salvos: a carga falhou ({self.erro_carga})")
+            return
+        try:
+            self.armazenamento.compactar(self.historico, self.indice_analise.exportar(),
+                                         em_segundo_plano=False,
+                                         sincronizacao=self.estado_sincronizacao())
+            print("Dados salvos com sucesso!")
+        except Exception as e:
+            print(f"Erro ao salvar dados: {e}")
+
+    @instrumentos.cronometrado("compactar")
+    def compactar(self):
+        """Compacta o diário em segundo plano (chamado na thread dona dos dados)"""
+        if self.erro_carga is not None:
+            return
+        try:
+            self.armazenamento.compactar(self.historico, self.indice_analise.exportar(),
+                                         sincronizacao=self.estado_sincronizacao())
+        except Exception as e:
+            print(f"Erro ao compactar dados: {e}")
+
+    def aplicar_operacao(self, operacao):
+        """Aplica uma operação do diário ao histórico em memória"""
+        if self.meses_arquivados():
+            # Um mês só é alterado depois de estar inteiro em memória
+            meses = ParticoesMensais.meses_da_operacao(operacao)
+            if meses is None:
+                self.carregar_tudo()
+            else:
+                self.carregar_meses(meses)
+        tipo = operacao["op"]
+        if tipo == "add":
+            self.adicionar_na_memoria(operacao["transacao"])
+        elif tipo == "lote":
+            for transacao in operacao["transacoes"]:
+                self.adicionar_na_memoria(transacao)
+        elif tipo == "edit":
+            transacao = self.obter(operacao["id"])
+            if transacao is not None:
+                # Move o valor do balde antigo para o novo (valor/descrição mudaram)
+                self.indice_analise.remover(transacao)
+                self._indexar_data(transacao, -1)
+                self._indexar_hash(transacao)
+                self.historico.editar(operacao["id"], operacao["campos"])
+                self.indice_analise.adicionar(transacao)
+                self._indexar_data(transacao)
+                self._indexar_hash(transacao)
+                self.indice_busca.mover(transacao.linha, self.historico.descricoes[transacao.linha])
+                self.indice_meses.mover(transacao.linha, self.indice_analise.mes(
+                    self.historico.minutos[transacao.linha]))
+        elif tipo == "del":
+            transacao = self.obter(operacao["id"])
+            if transacao is not None:
+                self.indice_analise.remover(transacao)
+                self._indexar_data(transacao, -1)
+                self._indexar_hash(transacao)
+                self.historico.remover(operacao["id"])
+            # Exclusões gravadas por versões anteriores não têm data nem viram lápide
+            if operacao.get("data_exclusao") and operacao.get("mes"):
+                self._registrar_lapide(operacao["id"], operacao["mes"],
+                                       minutos_de_data(operacao["data_exclusao"]))
+        elif tipo == "clear":
+            self.historico.limpar()
+            self.indice_analise.limpar()
+            self.indice_datas = None
+            # Limpar não gera lápides e descarta as existentes: a próxima
+            # sincronização traz de volta o que os outros dispositivos ainda têm
+            self.lapides = {}
+            if self.indice_hashes is not None:
+                self.indice_hashes = IndiceHashes.construir(self.historico, self.lapides)
+        elif tipo == "regras":
+            self.recategorizar(operacao["regras"])
+
+    def adicionar_na_memoria(self, transacao):
+        """Acrescenta uma transação à loja e aos índices"""
+        existente = self.obter(transacao["id"])
+        if existente is not None:
+            # Reaplicação de um registro já presente: substitui sem contar duas vezes
+            self.indice_analise.remover(existente)
+            self._indexar_data(existente, -1)
+            self._indexar_hash(existente)
+        elif transacao["id"] in self.lapides:
+            # Restaurada pela sincronização (editada depois da exclusão)
+            self._registrar_lapide(transacao["id"], None)
+        transacao = self.historico.adicionar(transacao)
+        self.ultimo_id = max(self.ultimo_id, transacao["id"])
+        self.indice_analise.adicionar(transacao)
+        self._indexar_data(transacao)
+        self._indexar_hash(transacao)
+        if existente is not None:
+            self.indice_busca.mover(transacao.linha, self.historico.descricoes[transacao.linha])
+            self.indice_meses.mover(transacao.linha,
+                                    self.indice_analise.mes(self.historico.minutos[transacao.linha]))
+
+    # Categorização
+
+    def definir_regras(self, regras):
+        """Troca as regras de categorização; ValueError se forem inválidas.
+
+        A troca é gravada no diário como uma operação (com as regras
+        anteriores), de modo que análise e configuração continuam
+        consistentes mesmo se o app fechar no meio.
+        """
+        RegrasCategorias(regras)
+        return self.registrar_operacao({"op": "regras", "regras": [dict(r) for r in regras],
+                                        "anteriores": self.regras.regras})
+
+    @instrumentos.cronometrado("recategorizar")
+    def recategorizar(self, regras):
+        """Aplica novas regras movendo na análise só os gastos cujas descrições
+        mudaram de candidatas; retorna quantos gastos mudaram de categoria"""
+        self.carregar_tudo()  # a análise inclui os meses arquivados
+        historico, motor = self.historico, self.regras
+        motor.assumir(historico)
+        antigas = [motor.candidatas(texto) for texto in historico.textos]
+        motor.compilar(regras)
+        # Os orçamentos seguem os nomes das categorias das novas regras
+        self.orcamentos = self.normalizar_orcamentos(self.orcamentos)
+        afetadas = [None if motor.candidatas(texto) == anteriores else anteriores
+                    for texto, anteriores in zip(historico.textos, antigas)]
+
+        movidos = 0
+        alvo = [indice for indice, anteriores in enumerate(afetadas) if anteriores is not None]
+        if alvo:
+            # Só as linhas das descrições afetadas, pelo índice texto -> linhas
+            self.indice_busca.atualizar(historico)
+            descricoes, centavos, minutos = (historico.descricoes, historico.centavos,
+                                             historico.minutos)
+            categorias, indice, escolher = historico.categorias, self.indice_analise, motor.escolher
+            # Candidatas novas por texto (a categoria, se não depende do valor)
+            novas = {texto: motor.candidatas(historico.textos[texto]) for texto in alvo}
+            fixas = {texto: candidatas[0][0] for texto, candidatas in novas.items()
+                     if len(candidatas) == 1}
+            # Movimentos agregados por (mês, categoria antiga, categoria nova)
+            movimentos = {}
+            for linha in self.indice_busca.linhas_dos_textos(historico, alvo):
+                texto, valor = descricoes[linha], centavos[linha]
+                # Linhas ainda sem cache foram contadas pelas regras antigas
+                anterior = categorias[linha]
+                if anterior < 0:
+                    anterior = escolher(afetadas[texto], valor)
+                nova = fixas.get(texto)
+                if nova is None:
+                    nova = escolher(novas[texto], valor)
+                categorias[linha] = nova
+                if nova != anterior and valor < 0:
+                    chave = (indice.mes(minutos[linha]), anterior, nova)
+                    movimento = movimentos.get(chave)
+                    if movimento is None:
+                        movimento = movimentos[chave] = [0, 0]
+                    movimento[0] += 1
+                    movimento[1] += valor
+            for (mes, anterior, nova), (quantidade, total) in movimentos.items():
+                indice.somar(mes, motor.nomes[anterior], -quantidade, -total)
+                indice.somar(mes, motor.nomes[nova], quantidade, total)
+                movidos += quantidade
+
+        if self.config.get("regras_categorias", []) != motor.regras:
+            self.config["regras_categorias"] = motor.regras
+            self.salvar_config()
+        return movidos
+
+    # Orçamentos
+
+    def definir_orcamento(self, categoria, limite):
+        """Define o limite mensal (em reais) de uma categoria; None remove.
+        A categoria é normalizada como na análise ("Mercado" e "mercado" são
+        o mesmo orçamento). ValueError se o limite não for positivo"""
+        categoria = self.regras.normalizar_categoria(categoria)
+        if not categoria:
+            raise ValueError("categoria vazia")
+        orcamentos = {nome: valor for nome, valor in self.config.get("orcamentos", {}).items()
+                      if self.regras.normalizar_categoria(nome) != categoria}
+        if limite is not None:
+            orcamentos[categoria] = limite
+        self.orcamentos = self.normalizar_orcamentos(orcamentos_de_config(orcamentos))
+        self.config["orcamentos"] = orcamentos
+        self.salvar_config()
+
+    def normalizar_orcamentos(self, orcamentos):
+        """{categoria normalizada: limite}; chaves que só diferem em maiúsculas
+        (configs antigas) ficam com o último limite"""
+        return {self.regras.normalizar_categoria(categoria): limite
+                for categoria, limite in orcamentos.items()}
+
+    def situacao_orcamentos(self, mes):
+        """[(categoria, gasto, limite)] do mês, em centavos, pelos totais da análise"""
+        topicos = self.indice_analise.meses.get(mes, {})
+        return [(categoria, topicos[categoria][1] if categoria in topicos else 0, limite)
+                for categoria, limite in sorted(self.orcamentos.items())]
+
+    def alertas_orcamento(self, anteriores):
+        """Avisos (mes, categoria, fracao, total, limite) dos baldes cujo total
+        cruzou um limiar, a partir dos totais anteriores {(mes, categoria): total}"""
+        alertas = []
+        meses = self.indice_analise.meses
+        for (mes, categoria), anterior in anteriores.items():
+            limite = self.orcamentos.get(categoria)
+            if limite is None:
+                continue
+            info = meses.get(mes, {}).get(categoria)
+            total = info[1] if info is not None else 0
+            # Só o maior limiar cruzado vira aviso
+            for fracao in reversed(LIMIARES_ORCAMENTO):
+                if anterior < fracao * limite <= total:
+                    alertas.append((mes, categoria, fracao, total, limite))
+                    break
+        return alertas
+
+    # Transações recorrentes
+
+    def adicionar_recorrencia(self, descricao, centavos, frequencia="mensal", intervalo=1,
+                              inicio=None, fim=None):
+        """Cria uma regra recorrente (início padrão: agora); ValueError se inválida.
+        Nada é lançado até a próxima chamada a lancar_recorrencias"""
+        if inicio is None:
+            inicio = minutos_de_data(datetime.now().strftime("%d/%m/%Y %H:%M"))
+        recorrencia = Recorrencia(self.gerar_id(), descricao, centavos, frequencia, intervalo,
+                                  inicio, fim)
+        self.recorrencias[recorrencia.id] = recorrencia
+        self.salvar_recorrencias()
+        return recorrencia
+
+    def remover_recorrencia(self, recorrencia_id):
+        """Remove uma regra (as ocorrências já lançadas ficam); False se não existe"""
+        if self.recorrencias.pop(recorrencia_id, None) is None:
+            return False
+        self.salvar_recorrencias()
+        return True
+
+    def salvar_recorrencias(self):
+        self.config["recorrencias"] = [recorrencia.como_dict()
+                                       for recorrencia in self.recorrencias.values()]
+        self.salvar_config()
+
+    def lancar_recorrencias(self, agora=None):
+        """Lança no histórico, numa única operação "lote", as ocorrências que
+        já venceram; retorna quantas foram lançadas"""
+        if not self.recorrencias or self.erro_carga is not None:
+            return 0
+        if agora is None:
+            agora = minutos_de_data(datetime.now().strftime("%d/%m/%Y %H:%M"))
+        transacoes = []
+        avancadas = False
+        for recorrencia in self.recorrencias.values():
+            vencidas = list(recorrencia.ocorrencias(recorrencia.ate, agora))
+            if not vencidas:
+                continue
+            # Se o app fechou entre gravar o lote e a config, o lote já está no histórico
+            lancadas = self.datas_lancadas(recorrencia.descricao, recorrencia.centavos,
+                                           vencidas[0], vencidas[-1])
+            for minutos in vencidas:
+                if minutos not in lancadas:
+                    transacoes.append({"id": self.gerar_id(), "valor": recorrencia.centavos / 100,
+                                       "descricao": recorrencia.descricao,
+                                       "data": data_de_minutos(minutos)})
+            recorrencia.ate = vencidas[-1]
+            avancadas = True
+        if transacoes:
+            self.registrar_operacao({"op": "lote", "transacoes": transacoes})
+            # O lote é gravado antes de a config marcar as ocorrências como lançadas
+            self.descarregar()
+        if avancadas:
+            self.salvar_recorrencias()
+        return len(transacoes)
+
+    def datas_lancadas(self, descricao, centavos, inicio=None, fim=None):
+        """Datas (em minutos) das transações com essa descrição e valor; os
+        meses arquivados do período [inicio, fim] são lidos do disco, sem
+        trazê-los para a memória"""
+        historico = self.historico
+        datas = set()
+        texto = historico.indices_textos.get(descricao)
+        if texto is not None:
+            self.indice_busca.atualizar(historico)
+            minutos, valores = historico.minutos, historico.centavos
+            datas = {minutos[linha]
+                     for linha in self.indice_busca.linhas_dos_textos(historico, {texto})
+                     if valores[linha] == centavos}
+        ler_arquivadas = self.leitor_arquivadas()
+        if ler_arquivadas is not None:
+            datas.update(minutos_de_data(transacao["data"])
+                         for transacao in ler_arquivadas(inicio, fim)
+                         if transacao["descricao"] == descricao
+                         and centavos_de_valor(transacao["valor"]) == centavos)
+        return datas
+
+    def saldo_previsto(self, ate):
+        """Saldo somando as ocorrências ainda não lançadas até `ate` (minutos),
+        contadas sem gerar as transações"""
+        return self.saldo + sum(recorrencia.centavos * recorrencia.quantidade(recorrencia.ate, ate)
+                                for recorrencia in self.recorrencias.values())
+
+    def gastos_previstos(self, meses):
+        """{mes: {categoria: [quantidade, total]}} dos gastos recorrentes ainda
+        não lançados nos meses pedidos, no formato do IndiceAnalise"""
+        previstos = {}
+        for mes in meses:
+            inicio, fim = intervalo_do_mes(mes)
+            for recorrencia in self.recorrencias.values():
+                if recorrencia.centavos >= 0:
+                    continue
+                depois = inicio - 1
+                if recorrencia.ate is not None and recorrencia.ate > depois:
+                    depois = recorrencia.ate
+                quantidade = recorrencia.quantidade(depois, fim - 1)
+                if quantidade:
+                    categoria = self.regras.nomes[self.regras.categoria(recorrencia.descricao,
+                                                                        recorrencia.centavos)]
+                    info = previstos.setdefault(mes, {}).setdefault(categoria, [0, 0])
+                    info[0] += quantidade
+                    info[1] -= quantidade * recorrencia.centavos
+        return previstos
+
+    def analise_prevista(self, meses_adiante=3):
+        """Agregados da análise com os gastos recorrentes previstos do mês
+        atual e dos `meses_adiante` seguintes; os demais meses são os do índice"""
+        if not self.recorrencias:
+            return self.indice_analise.meses
+        hoje = datetime.now()
+        base = hoje.year * 12 + hoje.month - 1
+        meses = [f"{(base + k) // 12}-{(base + k) % 12 + 1:02d}" for k in range(meses_adiante + 1)]
+        previstos = self.gastos_previstos(meses)
+        if not previstos:
+            return self.indice_analise.meses
+        # Só os meses com previstos são copiados; o índice não muda
+        analise = dict(self.indice_analise.meses)
+        for mes, topicos in previstos.items():
+            combinados = {topico: list(info) for topico, info in analise.get(mes, {}).items()}
+            for topico, (quantidade, total) in topicos.items():
+                info = combinados.setdefault(topico, [0, 0])
+                info[0] += quantidade
+                info[1] += total
+            analise[mes] = combinados
+        return analise
+
+    # Meses arquivados (armazenamento em partições)
+
+    def meses_arquivados(self):
+        """{mes: totais} dos meses gravados que ainda não estão em memória"""
+        if isinstance(self.armazenamento, ParticoesMensais):
+            return self.armazenamento.arquivados
+        return {}
+
+    def totais_arquivados(self):
+        """(receitas, despesas, quantidade) dos meses arquivados, pelo manifesto"""
+        if isinstance(self.armazenamento, ParticoesMensais):
+            return self.armazenamento.totais_arquivados
+        return (0, 0, 0)
+
+    @property
+    def receitas(self):
+        return self.historico.receitas + self.totais_arquivados()[0]
+
+    @property
+    def despesas(self):
+        return self.historico.despesas + self.totais_arquivados()[1]
+
+    @property
+    def saldo(self):
+        """Saldo de todo o histórico, inclusive dos meses ainda não carregados"""
+        receitas, despesas, quantidade = self.totais_arquivados()
+        return self.historico.saldo + receitas + despesas
+
+    @property
+    def quantidade(self):
+        return len(self.historico) + self.totais_arquivados()[2]
+
+    def carregar_meses(self, meses):
+        """Traz para a memória os meses arquivados em `meses`; retorna quantas
+        transações foram carregadas (os demais meses são ignorados)"""
+        arquivados = self.meses_arquivados()
+        meses = sorted(mes for mes in meses if mes in arquivados)
+        if not meses:
+            return 0
+        transacoes = [transacao for mes in meses
+                      for transacao in self.armazenamento.carregar_mes(mes)]
+        # Meses arquivados são anteriores aos recentes: vão para o início do histórico
+        self.historico.antepor(transacoes)
+        for transacao in transacoes:
+            self.ultimo_id = max(self.ultimo_id, transacao["id"])
+        # A análise e os totais por dia (ver datas) já incluem os meses arquivados
+        self.cargas += 1
+        return len(transacoes)
+
+    def carregar_mes_anterior(self):
+        """Carrega o mês arquivado mais recente; retorna sua chave ou None"""
+        arquivados = self.meses_arquivados()
+        if not arquivados:
+            return None
+        mes = max(arquivados)
+        self.carregar_meses([mes])
+        return mes
+
+    def carregar_periodo(self, inicio=None, fim=None):
+        """Carrega os meses arquivados que cruzam o período (em minutos)"""
+        primeiro = mes_de_minutos(inicio) if inicio is not None else ""
+        ultimo = mes_de_minutos(fim) if fim is not None else "9999-99"
+        return self.carregar_meses([mes for mes in self.meses_arquivados()
+                                    if primeiro <= mes <= ultimo])
+
+    def carregar_tudo(self):
+        """Carrega todos os meses arquivados (exportação, recálculos, consultas por data)"""
+        return self.carregar_meses(list(self.meses_arquivados()))
+
+    def leitor_arquivadas(self):
+        """Função (inicio, fim) que lê do disco as transações arquivadas do
+        período (em minutos; None = sem limite), para a deduplicação de
+        extratos e as estatísticas numa thread; None se não há"""
+        arquivados = sorted(self.meses_arquivados())
+        if not arquivados:
+            return None
+        armazenamento = self.armazenamento
+
+        def ler(inicio, fim):
+            primeiro = mes_de_minutos(inicio) if inicio is not None else ""
+            ultimo = mes_de_minutos(fim) if fim is not None else "9999-99"
+            for mes in arquivados:
+                if primeiro <= mes <= ultimo:
+                    yield from armazenamento.ler_mes(mes)
+
+        return ler
+
+    def instantaneo(self):
+        """Cópia somente leitura dos dados, para cálculos numa thread
+        (RelatorioEstatistico)"""
+        return {
+            "loja": self.historico.copia(),
+            "nomes": self.regras.nomes[:],
+            "regras": self.regras.regras,
+            "arquivadas": self.leitor_arquivadas()
+        }
+
+    def _indexar_data(self, transacao, sinal=1):
+        """Atualiza os totais por dia, se o índice já tiver sido montado"""
+        if self.indice_datas is not None:
+            linha = transacao.linha
+            self.indice_datas.adicionar(self.historico.minutos[linha],
+                                        self.historico.centavos[linha], sinal)
+
+    def datas(self):
+        """Índice de totais por dia (montado na primeira consulta); os meses
+        arquivados entram pelos totais por dia do manifesto, sem serem lidos"""
+        if self.indice_datas is None:
+            # Manifestos de versões anteriores não têm os totais por dia: esses meses são lidos
+            self.carregar_meses([mes for mes, totais in self.meses_arquivados().items()
+                                 if "dias" not in totais])
+            self.indice_datas = IndiceDatas.construir(self.historico, chain.from_iterable(
+                totais["dias"] for totais in self.meses_arquivados().values()))
+        return self.indice_datas
+
+    def saldo_em(self, minutos):
+        """Saldo ao fim do dia de `minutos`, em centavos (O(log n))"""
+        return self.datas().saldo_em(minutos)
+
+    def totais_periodo(self, inicio=None, fim=None):
+        """Receitas, despesas, saldo e quantidade dos dias de `inicio` a `fim`
+        (em minutos; None = sem limite)"""
+        receitas, despesas, quantidade = self.datas().totais(inicio, fim)
+        return {"receitas": receitas, "despesas": despesas,
+                "saldo": receitas + despesas, "quantidade": quantidade}
+
+    def serie_saldo(self, inicio=None, fim=None, por="dia"):
+        """Saldo ao fim de cada dia (ou mês, com por="mes"); ver IndiceDatas.serie_saldo"""
+        return self.datas().serie_saldo(inicio, fim, por)
+
+    # Sincronização
+
+    def _indexar_hash(self, transacao):
+        """Inclui ou retira o hash da transação no seu mês, se o índice já existir"""
+        if self.indice_hashes is not None:
+            historico, linha = self.historico, transacao.linha
+            minutos = historico.minutos[linha]
+            self.indice_hashes.alternar(self.indice_analise.mes(minutos), hash_transacao(
+                historico.ids[linha], historico.centavos[linha], minutos,
+                historico.textos[historico.descricoes[linha]], historico.edicoes[linha]))
+
+    def _registrar_lapide(self, transacao_id, mes, exclusao=-1):
+        """Troca a lápide de uma transação (mes None só retira), com os hashes"""
+        anterior = self.lapides.pop(transacao_id, None)
+        if anterior is not None and self.indice_hashes is not None:
+            self.indice_hashes.alternar(anterior[0], hash_lapide(transacao_id, anterior[1]))
+        if mes is not None:
+            self.lapides[transacao_id] = (mes, exclusao)
+            if self.indice_hashes is not None:
+                self.indice_hashes.alternar(mes, hash_lapide(transacao_id, exclusao))
+
+    def estado_sincronizacao(self):
+        """Cópia das lápides e dos hashes por mês, para irem no snapshot"""
+        return {"lapides": dict(self.lapides),
+                "hashes": None if self.indice_hashes is None else dict(self.indice_hashes.hashes)}
+
+    def hashes_mensais(self):
+        """{mes: hash em hexadecimal} do conteúdo de cada mês (transações e
+        lápides); montado do zero só se os dados carregados não o trouxeram"""
+        if self.indice_hashes is None:
+            self.carregar_tudo()
+            self.indice_hashes = IndiceHashes.construir(self.historico, self.lapides)
+        return self.indice_hashes.exportar()
+
+    def conteudo_meses(self, meses):
+        """{mes: {"transacoes": [registros], "lapides": {id: minutos da exclusão}}}
+        dos meses pedidos, com registros [id, centavos, minutos, descrição,
+        edição] (os meses arquivados são trazidos para a memória)"""
+        conteudo = {mes: {"transacoes": [], "lapides": {}} for mes in meses}
+        if not conteudo:
+            return conteudo
+        self.carregar_meses(conteudo)
+        historico = self.historico
+        self.indice_meses.atualizar(historico, self.indice_analise.mes)
+        for mes, alvo in conteudo.items():
+            alvo["transacoes"] = [self._registro(linha)
+                                  for linha in self.indice_meses.linhas(historico, mes)]
+        for transacao_id, (mes, exclusao) in self.lapides.items():
+            if mes in conteudo:
+                conteudo[mes]["lapides"][transacao_id] = exclusao
+        return conteudo
+
+    def _registro(self, linha):
+        """Registro [id, centavos, minutos, descrição, edição] de uma linha"""
+        historico = self.historico
+        return [historico.ids[linha], historico.centavos[linha], historico.minutos[linha],
+                historico.textos[historico.descricoes[linha]], historico.edicoes[linha]]
+
+    @instrumentos.cronometrado("mesclar")
+    def mesclar(self, outro):
+        """Traz para este livro, por ID, o que outro livro ou réplica tem de
+        diferente; os dois oferecem hashes_mensais() e conteudo_meses().
+
+        Só os meses com hash diferente são lidos. Entre duas versões de uma
+        transação vale a editada por último (no empate, a maior, para que os
+        dois lados escolham a mesma); uma lápide vence as versões editadas
+        até a exclusão, e uma transação que só este livro tem nunca é
+        excluída por faltar no outro. Retorna quantos meses diferiam e
+        quantas transações foram adicionadas, editadas e excluídas.
+        """
+        resumo = {"meses": 0, "adicionadas": 0, "editadas": 0, "excluidas": 0}
+        locais, remotos = self.hashes_mensais(), outro.hashes_mensais()
+        if raiz_hashes(locais) == raiz_hashes(remotos):
+            return resumo
+        diferentes = sorted(mes for mes in locais.keys() | remotos.keys()
+                            if locais.get(mes) != remotos.get(mes))
+        resumo["meses"] = len(diferentes)
+        # Uma transação que mudou de mês está em algum mês diferente deste lado
+        self.carregar_meses(diferentes)
+
+        novas = []
+        for mes, conteudo in outro.conteudo_meses([mes for mes in diferentes
+                                                   if mes in remotos]).items():
+            for registro in conteudo["transacoes"]:
+                transacao_id, centavos, minutos, descricao, edicao = registro
+                local = self.obter(transacao_id)
+                if local is None:
+                    lapide = self.lapides.get(transacao_id)
+                    if lapide is None or lapide[1] < edicao:
+                        novas.append(dict_de_registro(registro))
+                    continue
+                # Versões comparadas por (edição, centavos, minutos, descrição)
+                historico, linha = self.historico, local.linha
+                atual = (historico.edicoes[linha], historico.centavos[linha],
+                         historico.minutos[linha], historico.textos[historico.descricoes[linha]])
+                if (edicao, centavos, minutos, descricao) > atual:
+                    campos = dict_de_registro(registro)
+                    del campos["id"]
+                    self.registrar_operacao({"op": "edit", "id": transacao_id, "campos": campos})
+                    resumo["editadas"] += 1
+            for transacao_id, exclusao in conteudo["lapides"].items():
+                local = self.obter(transacao_id)
+                if local is not None:
+                    if self.historico.edicoes[local.linha] > exclusao:
+                        continue
+                    resumo["excluidas"] += 1
+                else:
+                    lapide = self.lapides.get(transacao_id)
+                    if lapide is not None and lapide[1] >= exclusao:
+                        continue
+                # Sem a transação, só a lápide é registrada (para repassá-la adiante)
+                self.registrar_operacao({"op": "del", "id": transacao_id, "mes": mes,
+                                         "data_exclusao": data_de_minutos(exclusao)})
+
+        for posicao in range(0, len(novas), self.LOTE_SINCRONIZACAO):
+            self.registrar_operacao({"op": "lote",
+                                     "transacoes": novas[posicao:posicao + self.LOTE_SINCRONIZACAO]})
+        resumo["adicionadas"] = len(novas)
+        return resumo
+
+    def dispositivo(self):
+        """Nome deste dispositivo na pasta de sincronização (gerado e gravado
+        na configuração na primeira vez)"""
+        nome = self.config.get("dispositivo")
+        if not nome:
+            base = re.sub(r"[^\w-]", "", platform.node()) or "dispositivo"
+            nome = self.config["dispositivo"] = f"{base}-{os.urandom(3).hex()}"
+            self.salvar_config()
+        return nome
+
+    @instrumentos.cronometrado("sincronizar")
+    def sincronizar(self, pasta):
+        """Mescla as réplicas dos outros dispositivos gravadas em `pasta` (uma
+        subpasta por dispositivo) e depois atualiza a deste; retorna
+        {dispositivo: resumo da mescla}"""
+        self.verificar_gravavel()
+        dispositivo = self.dispositivo()
+        resumos = {}
+        if os.path.isdir(pasta):
+            for nome in sorted(os.listdir(pasta)):
+                replica = ReplicaPasta(os.path.join(pasta, nome))
+                if nome != dispositivo and os.path.exists(replica.arquivo_manifesto):
+                    resumos[nome] = self.mesclar(replica)
+        ReplicaPasta(os.path.join(pasta, dispositivo)).gravar(self, dispositivo)
+        return resumos
+
+    def gerar_id(self):
+        """Gera um ID único e crescente, sem colisões mesmo em inserções em lote"""
+        self.ultimo_id = max(int(time.time() * 1000000), self.ultimo_id + 1)
+        return self.ultimo_id
+
+    def nova_transacao(self, centavos, descricao, minutos=None):
+        """Monta o registro de uma transação nova (data atual se `minutos` for None)"""
+        data = (datetime.now().strftime("%d/%m/%Y %H:%M") if minutos is None
+                else data_de_minutos(minutos))
+        return {"id": self.gerar_id(), "valor": centavos / 100,
+                "descricao": descricao, "data": data}
+
+    @instrumentos.cronometrado("operacao")
+    def registrar_operacao(self, operacao):
+        """Aplica uma operação em memória e a grava (ou agenda sua gravação);
+        retorna a operação numerada"""
+        self.verificar_gravavel()
+        if operacao["op"] in ("edit", "del") and "mes" not in operacao:
+            # O mês da transação vai junto, para a carga saber que partição ler
+            operacao = dict(operacao, mes=self.mes_da_transacao(operacao["id"]))
+        if operacao["op"] == "del" and "data_exclusao" not in operacao:
+            # A data da exclusão decide, na sincronização, contra edições em outro dispositivo
+            operacao = dict(operacao, data_exclusao=datetime.now().strftime("%d/%m/%Y %H:%M"))
+        operacao = self.armazenamento.numerar(operacao)
+        if (self.orcamentos and self.ao_alertar_orcamento is not None
+                and operacao["op"] in ("add", "edit")):
+            # Os baldes que a operação tocar guardam o total de antes: o aviso
+            # compara antes/depois sem percorrer o histórico
+            indice = self.indice_analise
+            indice.anteriores = {}
+            try:
+                self.aplicar_operacao(operacao)
+            finally:
+                anteriores, indice.anteriores = indice.anteriores, None
+            for alerta in self.alertas_orcamento(anteriores):
+                self.ao_alertar_orcamento(*alerta)
+        else:
+            self.aplicar_operacao(operacao)
+        if self.escritor is not None:
+            self.escritor.enfileirar(operacao)
+        elif self.armazenamento.registrar_lote([operacao]):
+            self.salvar()
+        return operacao
+
+    def verificar_gravavel(self):
+        """ValueError se a carga falhou (o livro está somente leitura)"""
+        if self.erro_carga is not None:
+            raise ValueError(f"dados não carregados ({self.erro_carga}); "
+                             f"alterações desativadas")
+
+    def obter(self, transacao_id):
+        """Encontra uma transação pelo ID (O(1))"""
+        return self.historico.obter(transacao_id)
+
+    def mes_da_transacao(self, transacao_id):
+        """Mês ("AAAA-MM") de uma transação, ou None se ela não existe. Uma
+        transação arquivada tem seu mês carregado (as partições são lidas da
+        mais recente para a mais antiga até encontrá-la)"""
+        transacao = self.obter(transacao_id)
+        if transacao is None:
+            for mes in sorted(self.meses_arquivados(), reverse=True):
+                if any(registro["id"] == transacao_id
+                       for registro in self.armazenamento.ler_mes(mes)):
+                    self.carregar_meses([mes])
+                    transacao = self.obter(transacao_id)
+                    break
+        if transacao is None:
+            return None
+        return mes_de_minutos(self.historico.minutos[transacao.linha])
+
+    @instrumentos.cronometrado("buscar")
+    def buscar(self, consulta="", inicio=None, fim=None, minimo=None, maximo=None, limite=None):
+        """IDs (mais antigos primeiro) das transações que casam com a consulta
+        e com os filtros, todos inclusivos: datas em minutos e valor absoluto
+        em centavos (vale para gastos e receitas). Com `limite`, só as
+        `limite` mais recentes. Um filtro de datas traz para a memória os
+        meses arquivados do período.
+
+        Uma única passada, das linhas mais novas para as mais antigas, pela
+        menor fonte de candidatas (linhas dos textos da consulta, dos meses
+        do período ou a loja inteira), testando os demais filtros na mesma
+        passada e parando ao completar o limite.
+        """
+        if inicio is not None or fim is not None:
+            self.carregar_periodo(inicio, fim)
+        historico = self.historico
+        if not consulta.strip() and (inicio, fim, minimo, maximo) == (None, None, None, None):
+            ids = historico.ids_vivos()
+            return ids if limite is None or len(ids) <= limite else ids[len(ids) - limite:]
+
+        # Fontes de candidatas: (quantidade de linhas, listas crescentes; None = a loja toda)
+        fontes = [(len(historico.vivas), None)]
+        mascara = None
+        if consulta.strip():
+            indice = self.indice_busca
+            indice.atualizar(historico)
+            alvo = indice.textos_da_consulta(consulta)
+            mascara = indice.mascara(alvo)
+            listas = indice.listas(alvo)
+            fontes.append((sum(map(len, listas)), listas))
+        if inicio is not None or fim is not None:
+            self.indice_meses.atualizar(historico, self.indice_analise.mes)
+            primeiro = mes_de_minutos(inicio) if inicio is not None else ""
+            ultimo = mes_de_minutos(fim) if fim is not None else "9999-99"
+            listas = [linhas for mes, linhas in self.indice_meses.linhas_por_mes.items()
+                      if primeiro <= mes <= ultimo]
+            fontes.append((sum(map(len, listas)), listas))
+        listas = min(fontes, key=lambda fonte: fonte[0])[1]
+        if listas is None:
+            linhas = range(len(historico.vivas) - 1, -1, -1)
+        else:
+            linhas = linhas_decrescentes(listas) if listas else ()
+
+        ids, descricoes, vivas = historico.ids, historico.descricoes, historico.vivas
+        minutos, centavos = historico.minutos, historico.centavos
+        inicio = -sys.maxsize if inicio is None else inicio
+        fim = sys.maxsize if fim is None else fim
+        minimo = 0 if minimo is None else minimo
+        maximo = sys.maxsize if maximo is None else maximo
+        encontrados = array('q')
+        restantes = -1 if limite is None else limite
+        for linha in linhas:
+            if (vivas[linha] and (mascara is None or mascara[descricoes[linha]])
+                    and inicio <= minutos[linha] <= fim
+                    and minimo <= abs(centavos[linha]) <= maximo):
+                encontrados.append(ids[linha])
+                restantes -= 1
+                if not restantes:
+                    break
+        encontrados.reverse()
+        return encontrados
+
+    def validar_totais(self):
+        """Confere saldo/receitas/despesas recalculando tudo do zero"""
+        self.carregar_tudo()
+        divergencias = self.historico.validar_totais()
+        for nome, em_cache, recalculado in divergencias:
+            print(f"Totais: {nome} em cache {formatar_centavos(em_cache)} "
+                  f"!= recalculado {formatar_centavos(recalculado)} (corrigido)")
+
+        # No SQLite, confere também contra o saldo calculado pelo banco
+        if isinstance(self.armazenamento, BancoSQLite):
+            saldo_banco = self.armazenamento.saldo_centavos()
+            if saldo_banco != self.historico.saldo:
+                print(f"Totais: saldo no banco {formatar_centavos(saldo_banco)} "
+                      f"!= saldo em memória {formatar_centavos(self.historico.saldo)}")
+                divergencias.append(("saldo_banco", self.historico.saldo, saldo_banco))
+        return not divergencias
+
+    def recalcular_analise(self):
+        """Remonta o índice de análise do zero; retorna True se havia divergência"""
+        self.carregar_tudo()
+        recalculado = IndiceAnalise.construir(self.historico, self.regras)
+        divergente = recalculado.meses != self.indice_analise.meses
+        self.indice_analise = recalculado
+        return divergente
+
+    def descarregar(self):
+        """Bloqueia até que as operações pendentes estejam gravadas"""
+        if self.escritor is not None:
+            self.escritor.descarregar()
+
+    def encerrar(self):
+        """Grava o que estiver pendente e aguarda uma compactação em andamento"""
+        if self.escritor is not None:
+            self.escritor.encerrar()
+            self.escritor = None
+        if self.armazenamento is not None:
+            self.armazenamento.aguardar()
+
+    def exportacao(self, arquivo, formato=None, ao_progresso=None, ao_concluir=None):
+        """Exportação (ver Exportacao) sobre um instantâneo dos dados, para
+        rodar numa thread (iniciar) ou direto (processar)"""
+        instantaneo = dict(self.instantaneo(),
+                           analise=self.indice_analise.exportar(),
+                           receitas=self.receitas, despesas=self.despesas,
+                           quantidade_arquivadas=self.totais_arquivados()[2])
+        return Exportacao(instantaneo, arquivo, formato or Exportacao.formato_do_arquivo(arquivo),
+                          ao_progresso, ao_concluir)
+
+    def exportar(self, arquivo, formato="csv"):
+        """Grava o histórico (mais antigas primeiro) em CSV, JSON-lines, JSON
+        ou relatório HTML, na thread atual; retorna quantas transações"""
+        return self.exportacao(arquivo, formato).processar()["transacoes"]
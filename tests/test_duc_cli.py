@@ -0,0 +1,29 @@
+"""Teste de fumaça da linha de comando (sem Kivy)"""
+import json
+import sys
+
+import duc_cli
+
+
+def test_importar_e_relatorio_json(tmp_path, capsys):
+    extrato = tmp_path / "extrato.csv"
+    extrato.write_text("Data;Descrição;Valor\n"
+                       "10/03/2024;Salário;1.500,00\n"
+                       "11/03/2024;Mercado;-42,90\n"
+                       "12/04/2024;Padaria;-5,10\n", encoding="utf-8")
+    opcoes = ["--dados", str(tmp_path / "dados.json"),
+              "--config", str(tmp_path / "config.json")]
+
+    duc_cli.main(opcoes + ["importar", str(extrato)])
+    assert "3 transações importadas" in capsys.readouterr().out
+    # Importar de novo não duplica nada
+    duc_cli.main(opcoes + ["importar", str(extrato)])
+    capsys.readouterr()
+
+    duc_cli.main(opcoes + ["relatorio", "--json"])
+    relatorio = json.loads(capsys.readouterr().out)
+    assert relatorio["transacoes"] == 3
+    assert relatorio["receitas"] == 150000 and relatorio["despesas"] == -4800
+    assert relatorio["saldo"] == 145200
+    assert sorted(relatorio["gastos_por_mes"]) == ["2024-03", "2024-04"]
+    assert "kivy" not in sys.modules
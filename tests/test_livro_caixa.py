@@ -0,0 +1,1088 @@
+"""Testes do motor do livro-caixa (sem Kivy)"""
+import json
+import random
+import sqlite3
+import struct
+import threading
+import zlib
+
+import pytest
+
+from livro_caixa import (CABECALHO_SNAPSHOT, CABECALHO_SNAPSHOT_V1, BancoSQLite,
+                         DiarioTransacoes, ImportadorExtrato, IndiceAnalise, IndiceBusca,
+                         LivroCaixa, LojaTransacoes, Recorrencia, RegrasCategorias,
+                         RelatorioEstatistico, centavos_de_texto, centavos_de_valor,
+                         data_de_minutos, formatar_centavos, gravar_snapshot_binario,
+                         ler_snapshot_binario, mes_de_minutos, minutos_de_data, percentil,
+                         percentil_de_listas)
+
+
+def transacao(transacao_id, valor, descricao="Mercado", data="10/03/2024 12:00"):
+    return {"id": transacao_id, "valor": valor, "descricao": descricao, "data": data}
+
+
+def loja_exemplo():
+    loja = LojaTransacoes()
+    loja.adicionar(transacao(1, -12.5, "Mercado", "01/03/2024 10:00"))
+    loja.adicionar(transacao(2, 3000.0, "Salário", "05/03/2024 09:00"))
+    loja.adicionar(transacao(3, -7.25, "Padaria ção", "02/04/2024 08:30"))
+    return loja
+
+
+def como_tuplas(loja):
+    return [(t["id"], t["centavos"], t["data"], t["descricao"]) for t in loja]
+
+
+def abrir(pasta, nome="dados"):
+    """LivroCaixa com JSON + diário em `pasta`, gravando de forma síncrona"""
+    livro = LivroCaixa(str(pasta / f"{nome}.json"), str(pasta / f"{nome}_config.json"))
+    livro.carregar()
+    return livro
+
+
+def estado(livro):
+    return sorted(como_tuplas(livro.historico)), livro.saldo
+
+
+# Diário de operações
+
+def test_diario_reaplica_operacoes_sobre_o_snapshot(tmp_path):
+    livro = abrir(tmp_path)
+    livro.registrar_operacao({"op": "lote", "transacoes": [
+        transacao(1, -10.0), transacao(2, -20.0), transacao(3, 100.0, "Salário")]})
+    livro.salvar()
+    livro.registrar_operacao({"op": "add", "transacao": transacao(4, -4.5, "Padaria")})
+    livro.registrar_operacao({"op": "edit", "id": 1, "campos": {"valor": -11.0,
+                                                                "descricao": "Feira"}})
+    livro.registrar_operacao({"op": "del", "id": 2})
+    esperado = estado(livro)
+    livro.encerrar()
+
+    recarregado = abrir(tmp_path)
+    assert recarregado.armazenamento.registros_no_diario == 3
+    assert estado(recarregado) == esperado
+    assert recarregado.obter(1)["descricao"] == "Feira"
+    assert recarregado.obter(2) is None
+    assert recarregado.validar_totais()
+
+
+def test_diario_reaplica_limpeza(tmp_path):
+    livro = abrir(tmp_path)
+    livro.registrar_operacao({"op": "lote", "transacoes": [transacao(1, -10.0),
+                                                           transacao(2, -20.0)]})
+    livro.salvar()
+    livro.registrar_operacao({"op": "clear"})
+    livro.registrar_operacao({"op": "add", "transacao": transacao(3, -3.0)})
+    livro.encerrar()
+
+    recarregado = abrir(tmp_path)
+    assert [t["id"] for t in recarregado.historico] == [3]
+    assert recarregado.saldo == -300
+    assert recarregado.indice_analise.meses == IndiceAnalise.construir(
+        recarregado.historico, recarregado.regras).meses
+
+
+def test_diario_descarta_ultimo_registro_truncado(tmp_path, capsys):
+    livro = abrir(tmp_path)
+    livro.registrar_operacao({"op": "add", "transacao": transacao(1, -10.0)})
+    livro.registrar_operacao({"op": "add", "transacao": transacao(2, -20.0)})
+    livro.encerrar()
+    diario = livro.armazenamento.arquivo_diario
+    with open(diario, 'rb') as f:
+        integro = f.read()
+    # Escrita interrompida no meio do terceiro registro
+    with open(diario, 'ab') as f:
+        f.write(b'{"op":"add","seq":3,"transacao":{"id":3,"va')
+
+    recarregado = abrir(tmp_path)
+    assert [t["id"] for t in recarregado.historico] == [1, 2]
+    assert "bytes incompletos descartados" in capsys.readouterr().out
+    with open(diario, 'rb') as f:
+        assert f.read() == integro
+    # O diário segue utilizável depois do corte
+    recarregado.registrar_operacao({"op": "add", "transacao": transacao(4, -4.0)})
+    recarregado.encerrar()
+    assert [t["id"] for t in abrir(tmp_path).historico] == [1, 2, 4]
+
+
+# Centavos
+
+@pytest.mark.parametrize("texto, centavos", [
+    ("3,99", 399), ("-50", -5000), ("+12.5", 1250), (" 7 ", 700), ("1.234", 123),
+    ("0,005", 1), ("-0,005", -1), ("2.675", 268), ("-2.675", -268), ("0,004", 0),
+    ("1e2", 10000)])
+def test_centavos_de_texto_arredonda_meio_para_longe_do_zero(texto, centavos):
+    assert centavos_de_texto(texto) == centavos
+
+
+@pytest.mark.parametrize("texto", ["", "abc", "1,2,3", "inf", "-nan"])
+def test_centavos_de_texto_invalido(texto):
+    with pytest.raises(ValueError):
+        centavos_de_texto(texto)
+
+
+def test_centavos_sem_erro_de_ponto_flutuante(tmp_path):
+    assert centavos_de_valor(0.1 + 0.2) == 30 and centavos_de_valor(-19.99) == -1999
+    assert formatar_centavos(-5) == "-0.05" and formatar_centavos(123456, sinal=True) == "+1234.56"
+    livro = abrir(tmp_path)
+    livro.registrar_operacao({"op": "lote", "transacoes": [
+        transacao(transacao_id, 0.1) for transacao_id in range(1, 11)]})
+    livro.registrar_operacao({"op": "add", "transacao": transacao(11, -0.3)})
+    assert livro.saldo == 70 and livro.receitas == 100 and livro.despesas == -30
+
+
+# Loja em colunas
+
+def test_loja_guarda_colunas_tipadas_e_textos_internados():
+    loja = loja_exemplo()
+    loja.adicionar(transacao(4, -3.0, "Mercado", "03/04/2024 10:00"))
+    assert [coluna.typecode for coluna in (loja.ids, loja.centavos, loja.minutos)] == [
+        'q', 'q', 'i']
+    assert list(loja.centavos) == [-1250, 300000, -725, -300]
+    # Descrições iguais apontam para o mesmo texto
+    assert loja.descricoes[0] == loja.descricoes[3] and len(loja.textos) == 3
+    assert [t["id"] for t in reversed(loja)] == [4, 3, 2, 1]
+    assert list(loja.como_dicts())[2] == transacao(3, -7.25, "Padaria ção", "02/04/2024 08:30")
+
+
+def test_loja_copia_e_independente():
+    loja = loja_exemplo()
+    copia = loja.copia()
+    loja.editar(1, {"valor": -1.0, "descricao": "Feira"})
+    loja.remover(2)
+    assert como_tuplas(copia) == como_tuplas(loja_exemplo())
+    assert copia.saldo == loja_exemplo().saldo
+    assert como_tuplas(loja) == [(1, -100, "01/03/2024 10:00", "Feira"),
+                                 (3, -725, "02/04/2024 08:30", "Padaria ção")]
+
+
+def test_loja_antepoe_meses_e_valida_totais():
+    loja = loja_exemplo()
+    loja.antepor([transacao(7, -2.0, "Mercado", "10/02/2024 10:00"),
+                  transacao(8, -1.0, "Feira", "11/02/2024 10:00")])
+    assert [t["id"] for t in loja] == [7, 8, 1, 2, 3]
+    assert loja.obter(3)["descricao"] == "Padaria ção" and loja.linhas[3] == 4
+    assert loja.saldo == 300000 - 1250 - 725 - 300
+    assert loja.validar_totais() == []
+    loja.despesas += 1
+    assert loja.validar_totais() == [("despesas", -2274, -2275)]
+    assert loja.despesas == -2275
+
+
+# Índice por ID
+
+def test_ids_continuam_validos_depois_de_descartar_linhas_mortas():
+    loja = LojaTransacoes()
+    for transacao_id in range(1, 3001):
+        loja.adicionar(transacao(transacao_id, -transacao_id / 100))
+    for transacao_id in range(1, 1500):
+        assert loja.remover(transacao_id)
+    # As linhas mortas foram descartadas e as restantes renumeradas
+    assert loja.mortas < 1499 and len(loja.ids) < 3000
+    assert len(loja) == 1501
+    for transacao_id in (1500, 2222, 3000):
+        assert loja.obter(transacao_id)["centavos"] == -transacao_id
+        assert loja.ids[loja.linhas[transacao_id]] == transacao_id
+    assert loja.obter(10) is None and 10 not in loja
+    assert not loja.remover(10)
+    assert list(loja.ids_vivos()) == list(range(1500, 3001))
+
+
+def test_id_repetido_edita_a_transacao_existente():
+    loja = loja_exemplo()
+    visao = loja.adicionar(transacao(2, 2500.0, "Salário", "06/03/2024 09:00"))
+    assert len(loja) == 3 and visao.linha == loja.linhas[2]
+    assert loja.obter(2)["data"] == "06/03/2024 09:00"
+    assert loja.saldo == 250000 - 1250 - 725
+
+
+def test_livro_edita_e_exclui_pelo_id(tmp_path):
+    livro = abrir(tmp_path)
+    livro.registrar_operacao({"op": "lote", "transacoes": [
+        transacao(transacao_id, -1.0) for transacao_id in range(1, 6)]})
+    livro.registrar_operacao({"op": "del", "id": 2})
+    livro.registrar_operacao({"op": "edit", "id": 4, "campos": {"valor": -4.0}})
+    assert livro.obter(4)["centavos"] == -400 and livro.obter(2) is None
+    assert livro.mes_da_transacao(4) == "2024-03" and livro.mes_da_transacao(2) is None
+    assert [t["id"] for t in livro.historico] == [1, 3, 4, 5]
+
+
+# Índice de análise
+
+@pytest.mark.parametrize("semente", range(3))
+def test_analise_incremental_igual_a_reconstruida(tmp_path, semente):
+    livro = abrir(tmp_path)
+    operacoes_aleatorias(random.Random(semente), livro, 200)
+    livro.registrar_operacao({"op": "edit", "id": 1, "campos": {"descricao": "Padaria"}})
+    assert livro.indice_analise.meses == IndiceAnalise.construir(
+        livro.historico, livro.regras).meses
+    livro.registrar_operacao({"op": "clear"})
+    assert livro.indice_analise.meses == {}
+
+
+def test_analise_agrupa_gastos_por_mes_e_categoria(tmp_path):
+    livro = abrir(tmp_path)
+    livro.registrar_operacao({"op": "lote", "transacoes": [
+        transacao(1, -10.0), transacao(2, -2.5, "MERCADO "), transacao(3, 100.0, "Salário"),
+        transacao(4, -7.0, "Padaria", "01/04/2024 08:00")]})
+    assert livro.indice_analise.meses == {"2024-03": {"mercado": [2, 1250]},
+                                          "2024-04": {"padaria": [1, 700]}}
+    livro.registrar_operacao({"op": "edit", "id": 4, "campos": {"data": "31/03/2024 08:00"}})
+    livro.registrar_operacao({"op": "del", "id": 2})
+    assert livro.indice_analise.meses == {"2024-03": {"mercado": [1, 1000],
+                                                      "padaria": [1, 700]}}
+
+
+# Busca
+
+DESCRICOES = ["Mercado Central", "Supermercado", "Padaria ção", "Pão de queijo",
+              "Salário", "Farmácia", "Mercadinho da esquina", "Posto"]
+
+
+def test_busca_por_prefixo_sem_acentos(tmp_path):
+    livro = abrir(tmp_path)
+    livro.registrar_operacao({"op": "lote", "transacoes": [
+        transacao(posicao + 1, -1.0, descricao) for posicao, descricao in enumerate(DESCRICOES)]})
+    assert list(livro.buscar("merc")) == [1, 7]
+    assert list(livro.buscar("PAO")) == [4]
+    assert list(livro.buscar("cao pad")) == [3]
+    assert list(livro.buscar("farmacia x")) == []
+    assert list(livro.buscar("merc", limite=1)) == [7]
+
+
+def test_linhas_dos_textos_ignoram_excluidas_e_editadas():
+    loja = LojaTransacoes()
+    for transacao_id, descricao in enumerate(["Mercado", "Padaria", "Mercado", "Mercado"]):
+        loja.adicionar(transacao(transacao_id, -1.0, descricao))
+    indice = IndiceBusca()
+    assert indice.linhas(loja, "mercado") == [0, 2, 3]
+    loja.remover(2)
+    loja.editar(3, {"descricao": "Padaria"})
+    indice.mover(3, loja.descricoes[3])
+    assert indice.linhas(loja, "mercado") == [0]
+    indice.atualizar(loja)
+    assert indice.linhas_dos_textos(loja, {loja.indices_textos["Padaria"]}) == [1, 3]
+
+
+@pytest.mark.parametrize("semente", range(3))
+def test_busca_confere_com_filtro_direto(tmp_path, semente):
+    sorteio = random.Random(semente)
+    livro = abrir(tmp_path)
+    base = minutos_de_data("01/01/2024 00:00")
+    for transacao_id in range(1, 401):
+        livro.registrar_operacao({"op": "add", "transacao": transacao(
+            transacao_id, sorteio.choice([-1, 1]) * sorteio.randint(1, 20000) / 100,
+            sorteio.choice(DESCRICOES), data_de_minutos(base + sorteio.randrange(365 * 1440)))})
+        if sorteio.random() < 0.2:
+            campos = {"descricao": sorteio.choice(DESCRICOES)}
+            if sorteio.random() < 0.5:
+                campos["data"] = data_de_minutos(base + sorteio.randrange(365 * 1440))
+            livro.registrar_operacao({"op": "edit", "id": sorteio.randint(1, transacao_id),
+                                      "campos": campos})
+        if sorteio.random() < 0.1:
+            livro.registrar_operacao({"op": "del", "id": sorteio.randint(1, transacao_id)})
+
+    for _ in range(50):
+        consulta = sorteio.choice(["", "merc", "pa", "sal", "mercado c", "x"])
+        inicio = sorteio.choice([None, base + sorteio.randrange(365 * 1440)])
+        fim = sorteio.choice([None, base + sorteio.randrange(365 * 1440)])
+        minimo = sorteio.choice([None, 5000])
+        limite = sorteio.choice([None, 1, 10])
+        palavras = IndiceBusca.termos(consulta)
+        esperados = [t["id"] for t in livro.historico
+                     if all(any(termo.startswith(palavra)
+                                for termo in IndiceBusca.termos(t["descricao"]))
+                            for palavra in palavras)
+                     and (inicio is None or minutos_de_data(t["data"]) >= inicio)
+                     and (fim is None or minutos_de_data(t["data"]) <= fim)
+                     and (minimo is None or abs(t["centavos"]) >= minimo)]
+        if limite is not None:
+            esperados = esperados[-limite:] if esperados else []
+        assert list(livro.buscar(consulta, inicio, fim, minimo, limite=limite)) == esperados
+
+
+# Snapshot binário
+
+def test_snapshot_v2_ida_e_volta(tmp_path):
+    loja = loja_exemplo()
+    analise = IndiceAnalise.construir(loja).exportar()
+    lapides = {9: ("2024-02", 123)}
+    hashes = {"2024-03": (1 << 100) | 5}
+    arquivo = str(tmp_path / "dados.bin")
+    gravar_snapshot_binario(arquivo, 42, loja, analise, lapides, hashes)
+
+    seq, lida, analise_lida, lapides_lidas, hashes_lidos = ler_snapshot_binario(arquivo)
+    assert seq == 42
+    assert como_tuplas(lida) == como_tuplas(loja)
+    assert (lida.receitas, lida.despesas) == (loja.receitas, loja.despesas)
+    assert analise_lida == analise
+    assert lapides_lidas == lapides
+    assert hashes_lidos == hashes
+
+
+def test_snapshot_sem_hashes(tmp_path):
+    arquivo = str(tmp_path / "dados.bin")
+    gravar_snapshot_binario(arquivo, 1, loja_exemplo(), {})
+    assert ler_snapshot_binario(arquivo)[4] is None
+
+
+def test_snapshot_v1_continua_legivel(tmp_path):
+    """A versão 1 é a 2 sem lápides e hashes, com o cabeçalho menor"""
+    loja = loja_exemplo()
+    analise = IndiceAnalise.construir(loja).exportar()
+    arquivo = str(tmp_path / "dados.bin")
+    gravar_snapshot_binario(arquivo, 7, loja, analise)
+    with open(arquivo, 'rb') as f:
+        dados = f.read()
+    campos = CABECALHO_SNAPSHOT.unpack_from(dados)
+    corpo = CABECALHO_SNAPSHOT_V1.pack(campos[0], 1, 0, *campos[3:9])
+    corpo += dados[CABECALHO_SNAPSHOT.size:-4]
+    with open(arquivo, 'wb') as f:
+        f.write(corpo + struct.pack("<I", zlib.crc32(corpo)))
+
+    seq, lida, analise_lida, lapides, hashes = ler_snapshot_binario(arquivo)
+    assert seq == 7
+    assert como_tuplas(lida) == como_tuplas(loja)
+    assert analise_lida == analise
+    assert lapides == {} and hashes is None
+
+
+def test_snapshot_checksum_invalido(tmp_path):
+    arquivo = str(tmp_path / "dados.bin")
+    gravar_snapshot_binario(arquivo, 1, loja_exemplo(), {})
+    with open(arquivo, 'r+b') as f:
+        f.seek(CABECALHO_SNAPSHOT.size + 3)
+        byte = f.read(1)
+        f.seek(-1, 1)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    with pytest.raises(ValueError, match="checksum"):
+        ler_snapshot_binario(arquivo)
+
+
+def test_snapshot_truncado(tmp_path):
+    arquivo = str(tmp_path / "dados.bin")
+    gravar_snapshot_binario(arquivo, 1, loja_exemplo(), {})
+    with open(arquivo, 'r+b') as f:
+        f.truncate(f.seek(0, 2) - 10)
+    with pytest.raises(ValueError, match="truncado"):
+        ler_snapshot_binario(arquivo)
+
+
+def compactar(diario, loja, operacoes):
+    """Grava operações no diário e compacta, como o LivroCaixa faria"""
+    diario.registrar_lote([diario.numerar(operacao) for operacao in operacoes])
+    diario.compactar(loja, {}, em_segundo_plano=False)
+
+
+def test_snapshot_corrompido_usa_copia_anterior_e_diario(tmp_path, capsys):
+    arquivo = str(tmp_path / "dados.json")
+    diario = DiarioTransacoes(arquivo)
+    loja = LojaTransacoes()
+    diario.carregar()
+    for lote in range(3):
+        operacoes = [{"op": "add", "transacao": transacao(lote * 10 + k, -1.0)}
+                     for k in range(1, 4)]
+        for operacao in operacoes:
+            loja.adicionar(operacao["transacao"])
+        compactar(diario, loja, operacoes)
+    with open(diario.arquivo_snapshot, 'r+b') as f:
+        f.truncate(f.seek(0, 2) - 1)
+
+    recuperado = DiarioTransacoes(arquivo)
+    snapshot, operacoes = recuperado.carregar()
+    # Cópia anterior (6 transações) + as 3 operações da última compactação
+    assert snapshot["seq"] == 6 and len(snapshot["loja"]) == 6
+    assert [operacao["seq"] for operacao in operacoes] == [7, 8, 9]
+    assert (tmp_path / "dados.bin.corrompido").exists()
+    assert "truncado" in capsys.readouterr().out
+
+
+def test_snapshot_corrompido_sem_copia_informa_recuperacao(tmp_path):
+    arquivo = str(tmp_path / "dados.json")
+    diario = DiarioTransacoes(arquivo)
+    diario.carregar()
+    loja = LojaTransacoes()
+    loja.adicionar(transacao(1, -1.0))
+    compactar(diario, loja, [{"op": "add", "transacao": transacao(1, -1.0)}])
+    with open(diario.arquivo_snapshot, 'r+b') as f:
+        f.write(b"XXXX")
+    with pytest.raises(ValueError, match="corrompido"):
+        DiarioTransacoes(arquivo).carregar()
+
+
+def test_poda_mantem_operacoes_desde_a_copia(tmp_path):
+    diario = DiarioTransacoes(str(tmp_path / "dados.json"))
+    diario.carregar()
+    loja = LojaTransacoes()
+    compactar(diario, loja, [{"op": "clear"}] * 3)
+    compactar(diario, loja, [{"op": "clear"}] * 2)
+    with open(diario.arquivo_diario, 'rb') as f:
+        assert len(f.readlines()) == 2
+    # Só as posteriores ao snapshot contam para a próxima compactação
+    assert diario.registros_no_diario == 0
+    assert DiarioTransacoes(diario.arquivo_dados).carregar()[0]["seq"] == 5
+
+
+def conteudo(pasta):
+    return {caminho.name: caminho.read_bytes() for caminho in pasta.iterdir()}
+
+
+def test_carga_falha_abre_somente_leitura(tmp_path, capsys):
+    livro = abrir(tmp_path)
+    for lote in range(2):
+        livro.registrar_operacao({"op": "lote", "transacoes": [
+            transacao(lote * 10 + k, -1.0) for k in range(1, 4)]})
+        livro.salvar()
+    livro.registrar_operacao({"op": "add", "transacao": transacao(99, -5.0)})
+    livro.encerrar()
+    for nome in ("dados.bin", "dados.anterior.bin"):
+        with open(tmp_path / nome, 'r+b') as f:
+            f.write(b"XXXX")
+    for caminho in tmp_path.glob("dados.json*"):
+        caminho.unlink()
+    antes = conteudo(tmp_path)
+
+    agendadas = []
+    for agendar in (None, agendadas.append):
+        livro = LivroCaixa(str(tmp_path / "dados.json"), str(tmp_path / "dados_config.json"),
+                           agendar=agendar)
+        livro.carregar()
+        assert livro.erro_carga is not None and livro.escritor is None
+        with pytest.raises(ValueError, match="somente leitura|alterações desativadas"):
+            livro.registrar_operacao({"op": "add", "transacao": transacao(100, -1.0)})
+        with pytest.raises(ValueError):
+            livro.sincronizar(str(tmp_path / "sync"))
+        livro.salvar()
+        livro.compactar()
+        livro.encerrar()
+    assert not agendadas
+    assert "somente leitura" in capsys.readouterr().out
+
+    # Os snapshots ilegíveis só mudam de nome; diário e demais arquivos ficam intactos
+    depois = conteudo(tmp_path)
+    for nome, dados in antes.items():
+        assert depois.get(nome, depois.get(nome + ".corrompido")) == dados
+    assert len(depois) == len(antes)
+
+
+# SQLite
+
+def abrir_sqlite(pasta):
+    """LivroCaixa com "armazenamento": "sqlite" (migra o JSON na primeira vez)"""
+    config = pasta / "dados_config.json"
+    if not config.exists():
+        config.write_text(json.dumps({"armazenamento": "sqlite"}), encoding="utf-8")
+    livro = LivroCaixa(str(pasta / "dados.json"), str(config))
+    livro.carregar()
+    return livro
+
+
+def test_sqlite_migra_o_json_e_reabre(tmp_path):
+    livro = abrir(tmp_path)
+    livro.registrar_operacao({"op": "lote", "transacoes": [
+        transacao(1, -10.0), transacao(2, 50.0, "Salário", "05/02/2024 09:00"),
+        transacao(3, -7.5, "Padaria")]})
+    livro.registrar_operacao({"op": "edit", "id": 3, "campos": {"descricao": "Feira"}})
+    livro.registrar_operacao({"op": "del", "id": 1})
+    esperado, lapides = estado(livro), dict(livro.lapides)
+    assert list(lapides) == [1]
+    livro.encerrar()
+
+    migrado = abrir_sqlite(tmp_path)
+    assert isinstance(migrado.armazenamento, BancoSQLite)
+    assert estado(migrado) == esperado and migrado.lapides == lapides
+    migrado.registrar_operacao({"op": "add", "transacao": transacao(4, -1.0)})
+    esperado = estado(migrado)
+    migrado.encerrar()
+
+    # Reaberto, o banco não é migrado de novo e guarda o que veio depois
+    reaberto = abrir_sqlite(tmp_path)
+    assert estado(reaberto) == esperado and reaberto.lapides == lapides
+    assert reaberto.armazenamento.contar() == 3
+    assert reaberto.validar_totais()
+
+    reaberto.registrar_operacao({"op": "clear"})
+    reaberto.encerrar()
+    limpo = abrir_sqlite(tmp_path)
+    assert limpo.armazenamento.contar() == 0 and limpo.lapides == {}
+
+
+def test_sqlite_banco_antigo_perde_mes_e_topico(tmp_path):
+    arquivo = str(tmp_path / "dados.db")
+    conexao = sqlite3.connect(arquivo)
+    with conexao:
+        conexao.executescript("""
+            CREATE TABLE transacoes (id INTEGER PRIMARY KEY, ordem INTEGER NOT NULL,
+                centavos INTEGER NOT NULL, minutos INTEGER NOT NULL, mes TEXT NOT NULL,
+                descricao TEXT NOT NULL, topico TEXT NOT NULL, minutos_edicao INTEGER);
+            CREATE INDEX idx_transacoes_mes_topico ON transacoes(mes, topico);
+            INSERT INTO transacoes VALUES (7, 1, -1250, 0, '2024-03', 'Mercado', 'mercado', NULL);
+        """)
+    conexao.close()
+
+    banco = BancoSQLite(arquivo)
+    colunas = [linha[1] for linha in banco.conexao.execute("PRAGMA table_info(transacoes)")]
+    assert "mes" not in colunas and "topico" not in colunas
+    indices = [linha[0] for linha in banco.conexao.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'transacoes'")]
+    assert indices == ["idx_transacoes_ordem"]
+    snapshot, _ = banco.carregar()
+    assert [(t["id"], t["valor"], t["descricao"]) for t in snapshot["transacoes"]] == [
+        (7, -12.5, "Mercado")]
+    assert banco.proxima_ordem == 2
+
+
+# Partições mensais
+
+def abrir_particoes(pasta, meses_carregados=1):
+    """LivroCaixa com "armazenamento": "particoes" (migra o JSON na primeira vez)"""
+    config = pasta / "dados_config.json"
+    config.write_text(json.dumps({"armazenamento": "particoes",
+                                  "meses_carregados": meses_carregados}), encoding="utf-8")
+    livro = LivroCaixa(str(pasta / "dados.json"), str(config))
+    livro.carregar()
+    return livro
+
+
+def transacoes_por_mes():
+    """Duas transações em cada mês de janeiro a abril de 2024 (IDs 10*mês + 1 e + 2)"""
+    return [transacao(10 * mes + k, valor, descricao, f"{dia:02d}/{mes:02d}/2024 10:00")
+            for mes in range(1, 5)
+            for k, valor, descricao, dia in ((1, 100.0 * mes, "Salário", 5),
+                                              (2, -12.5 * mes, "Mercado", 20))]
+
+
+def test_particoes_manifesto_confere_com_os_meses(tmp_path):
+    livro = abrir_particoes(tmp_path)
+    livro.registrar_operacao({"op": "lote", "transacoes": transacoes_por_mes()})
+    livro.salvar()
+    livro.encerrar()
+
+    pasta = tmp_path / "dados.particoes"
+    manifesto = json.loads((pasta / "manifesto.json").read_text(encoding="utf-8"))
+    assert sorted(manifesto["meses"]) == ["2024-01", "2024-02", "2024-03", "2024-04"]
+    for mes, totais in manifesto["meses"].items():
+        gravadas = json.loads((pasta / f"{mes}.json").read_text(encoding="utf-8"))
+        centavos = [round(t["valor"] * 100) for t in gravadas]
+        assert totais["quantidade"] == len(gravadas)
+        assert totais["receitas"] == sum(c for c in centavos if c > 0)
+        assert totais["despesas"] == sum(c for c in centavos if c <= 0)
+        # Os totais por dia somam os do mês
+        assert [sum(dia[i] for dia in totais["dias"]) for i in (1, 2, 3)] == [
+            totais["receitas"], totais["despesas"], totais["quantidade"]]
+
+
+def test_particoes_carregam_meses_arquivados_sob_demanda(tmp_path):
+    livro = abrir_particoes(tmp_path)
+    livro.registrar_operacao({"op": "lote", "transacoes": transacoes_por_mes()})
+    livro.salvar()
+    esperado = estado(livro)
+    livro.encerrar()
+
+    reaberto = abrir_particoes(tmp_path)
+    # Só abril em memória; os demais meses entram no saldo pelo manifesto
+    assert sorted(reaberto.meses_arquivados()) == ["2024-01", "2024-02", "2024-03"]
+    assert sorted(t["id"] for t in reaberto.historico) == [41, 42]
+    assert reaberto.quantidade == 8 and reaberto.saldo == esperado[1]
+
+    assert reaberto.mes_da_transacao(21) == "2024-02"
+    assert sorted(reaberto.meses_arquivados()) == ["2024-01", "2024-03"]
+    assert reaberto.obter(21) is not None and reaberto.cargas == 1
+    assert reaberto.quantidade == 8 and reaberto.saldo == esperado[1]
+
+    reaberto.carregar_tudo()
+    assert estado(reaberto) == esperado
+
+
+def test_particoes_alteracao_de_mes_arquivado_vai_com_o_mes(tmp_path):
+    livro = abrir_particoes(tmp_path)
+    livro.registrar_operacao({"op": "lote", "transacoes": transacoes_por_mes()})
+    livro.salvar()
+    livro.encerrar()
+
+    livro = abrir_particoes(tmp_path)
+    livro.registrar_operacao({"op": "edit", "id": 12, "campos": {"valor": -99.0}})
+    livro.registrar_operacao({"op": "del", "id": 31})
+    livro.carregar_tudo()
+    esperado = estado(livro)
+    livro.encerrar()
+
+    diario = tmp_path / "dados.particoes" / "manifesto.diario.jsonl"
+    operacoes = [json.loads(linha) for linha in diario.read_text(encoding="utf-8").splitlines()]
+    assert [(o["op"], o["mes"]) for o in operacoes if o["op"] != "lote"] == [
+        ("edit", "2024-01"), ("del", "2024-03")]
+
+    # Sem compactar: a carga traz os meses que o diário altera e reaplica
+    reaberto = abrir_particoes(tmp_path)
+    assert sorted(reaberto.meses_arquivados()) == ["2024-02"]
+    assert reaberto.obter(12)["centavos"] == -9900 and reaberto.obter(31) is None
+    assert reaberto.saldo == esperado[1]
+    reaberto.carregar_tudo()
+    assert estado(reaberto) == esperado
+
+
+def test_particoes_migram_o_snapshot(tmp_path):
+    livro = abrir(tmp_path)
+    livro.registrar_operacao({"op": "lote", "transacoes": transacoes_por_mes()})
+    livro.salvar()
+    livro.registrar_operacao({"op": "del", "id": 22})
+    esperado, lapides = estado(livro), dict(livro.lapides)
+    livro.encerrar()
+
+    migrado = abrir_particoes(tmp_path, meses_carregados=2)
+    assert (tmp_path / "dados.particoes" / "manifesto.json").exists()
+    assert sorted(migrado.meses_arquivados()) == ["2024-01", "2024-02"]
+    assert migrado.saldo == esperado[1] and migrado.lapides == lapides
+    migrado.carregar_tudo()
+    assert estado(migrado) == esperado
+
+
+# Totais por data
+
+def operacoes_aleatorias(sorteio, livro, quantidade):
+    """Inclusões, edições (de valor e de data) e exclusões espalhadas por
+    uns três anos, para os índices por data serem mantidos por operação"""
+    base = minutos_de_data("01/01/2023 00:00")
+    ids = []
+    for transacao_id in range(1, quantidade + 1):
+        data = data_de_minutos(base + sorteio.randrange(3 * 365 * 1440))
+        valor = sorteio.choice([-1, 1]) * sorteio.randint(1, 50000) / 100
+        livro.registrar_operacao({"op": "add", "transacao": transacao(transacao_id, valor,
+                                                                      data=data)})
+        ids.append(transacao_id)
+        if sorteio.random() < 0.2:
+            campos = {"valor": sorteio.randint(-50000, 50000) / 100 or 1.0}
+            if sorteio.random() < 0.5:
+                campos["data"] = data_de_minutos(base + sorteio.randrange(3 * 365 * 1440))
+            livro.registrar_operacao({"op": "edit", "id": sorteio.choice(ids), "campos": campos})
+        if sorteio.random() < 0.1:
+            livro.registrar_operacao({"op": "del", "id": ids.pop(sorteio.randrange(len(ids)))})
+
+
+def saldo_bruto(lancamentos, minutos):
+    return sum(centavos for momento, centavos in lancamentos if momento // 1440 <= minutos // 1440)
+
+
+@pytest.mark.parametrize("semente", range(5))
+def test_totais_por_data_conferem_com_a_soma_direta(tmp_path, semente):
+    sorteio = random.Random(semente)
+    livro = abrir(tmp_path)
+    livro.registrar_operacao({"op": "add", "transacao": transacao(0, -1.0)})
+    livro.saldo_em(0)  # o índice já existe e passa a ser mantido por operação
+    operacoes_aleatorias(sorteio, livro, 150)
+    lancamentos = [(minutos_de_data(t["data"]), t["centavos"]) for t in livro.historico]
+    dias = sorted({minutos // 1440 for minutos, _ in lancamentos})
+    base = minutos_de_data("01/01/2023 00:00")
+
+    def instante():
+        return base + sorteio.randrange(-60 * 1440, 3 * 365 * 1440 + 60 * 1440)
+
+    for _ in range(100):
+        minutos = instante()
+        assert livro.saldo_em(minutos) == saldo_bruto(lancamentos, minutos)
+
+        inicio = None if sorteio.random() < 0.2 else instante()
+        fim = None if sorteio.random() < 0.2 else instante()
+        no_periodo = [centavos for minutos, centavos in lancamentos
+                      if (inicio is None or minutos // 1440 >= inicio // 1440)
+                      and (fim is None or minutos // 1440 <= fim // 1440)]
+        assert livro.totais_periodo(inicio, fim) == {
+            "receitas": sum(c for c in no_periodo if c > 0),
+            "despesas": sum(c for c in no_periodo if c <= 0),
+            "saldo": sum(no_periodo), "quantidade": len(no_periodo)}
+
+    for _ in range(10):
+        inicio = None if sorteio.random() < 0.3 else instante()
+        fim = None if sorteio.random() < 0.3 else instante()
+        primeiro = dias[0] if inicio is None else inicio // 1440
+        ultimo = dias[-1] if fim is None else fim // 1440
+        serie = list(livro.serie_saldo(inicio, fim))
+        assert [dia for dia, _ in serie] == [dia * 1440 for dia in range(primeiro, ultimo + 1)]
+        assert all(saldo == saldo_bruto(lancamentos, dia) for dia, saldo in serie)
+
+        # Por mês: o saldo do último dia de cada mês dentro do período
+        por_mes = {}
+        for dia, saldo in serie:
+            por_mes[mes_de_minutos(dia)] = saldo
+        assert list(livro.serie_saldo(inicio, fim, por="mes")) == list(por_mes.items())
+
+
+# Regras de categorização
+
+REGRAS = [
+    {"categoria": "Mercado grande", "palavras": ["mercado"], "minimo": 100},
+    {"categoria": "Alimentação", "prefixos": ["merc", "pada"]},
+    {"categoria": "Transporte", "palavras": ["posto shell"], "regex": r"^uber\b"},
+    {"categoria": "Alimentação", "palavras": ["padaria"]},
+]
+
+
+def nome_da_categoria(regras, descricao, valor):
+    return regras.nomes[regras.categoria(descricao, centavos_de_valor(valor))]
+
+
+@pytest.mark.parametrize("descricao, valor, categoria", [
+    ("Mercado Central", -150.0, "Mercado grande"),
+    ("Mercado Central", -20.0, "Alimentação"),      # fora da faixa: a regra seguinte
+    ("Supermercado", -20.0, "supermercado"),        # prefixo só no início da palavra
+    ("Mercadinho", -500.0, "Alimentação"),
+    ("Padaria Pão", -5.0, "Alimentação"),
+    ("Posto Shell BR", -80.0, "Transporte"),
+    ("Posto Ipiranga", -80.0, "posto ipiranga"),    # frase incompleta não casa
+    ("UBER *trip", -12.0, "Transporte"),
+    ("Pedágio Uber", -12.0, "pedágio uber"),        # a regex exige o início
+])
+def test_regras_valem_na_ordem_e_a_primeira_que_casa(descricao, valor, categoria):
+    assert nome_da_categoria(RegrasCategorias(REGRAS), descricao, valor) == categoria
+
+
+def test_regras_internam_categorias_e_guardam_candidatas():
+    regras = RegrasCategorias(REGRAS)
+    assert regras.nomes.count("Alimentação") == 1
+    candidatas = regras.candidatas("Mercado Central")
+    assert regras.candidatas("Mercado Central") is candidatas
+    # A regra sem faixa encerra a lista: a categoria padrão nunca é alcançada
+    assert [regras.nomes[c] for c, _, _ in candidatas] == ["Mercado grande", "Alimentação"]
+    regras.compilar(REGRAS[1:])
+    assert regras.candidatas("Mercado Central") is not candidatas
+    assert regras.nomes.index("Alimentação") == 1  # números já internados se mantêm
+
+
+@pytest.mark.parametrize("regra", [
+    {"categoria": "", "palavras": ["x"]}, {"categoria": "X"},
+    {"categoria": "X", "regex": "("}, {"categoria": "X", "palavras": ["x"], "minimo": "10"}])
+def test_regras_invalidas(regra):
+    with pytest.raises(ValueError):
+        RegrasCategorias([regra])
+
+
+def test_troca_de_regras_recategoriza_como_reconstrucao(tmp_path):
+    livro = abrir(tmp_path)
+    operacoes_aleatorias(random.Random(7), livro, 100)
+    livro.registrar_operacao({"op": "lote", "transacoes": [
+        transacao(1000 + posicao, -valor, descricao, "10/03/2030 12:00")
+        for posicao, (descricao, valor) in
+        enumerate([("Mercado Central", 150.0), ("Padaria", 5.0), ("Uber trip", 20.0)])]})
+    livro.definir_regras(REGRAS)
+    assert livro.indice_analise.meses == IndiceAnalise.construir(
+        livro.historico, livro.regras).meses
+    assert livro.indice_analise.meses["2030-03"] == {
+        "Mercado grande": [1, 15000], "Alimentação": [1, 500], "Transporte": [1, 2000]}
+    livro.definir_regras([])
+    assert livro.indice_analise.meses == IndiceAnalise.construir(
+        livro.historico, RegrasCategorias()).meses
+
+
+# Estatísticas
+
+def test_percentil_de_listas_igual_ao_da_uniao():
+    sorteio = random.Random(3)
+    for _ in range(50):
+        listas = [sorted(sorteio.randint(1, 1000) for _ in range(sorteio.randint(0, 30)))
+                  for _ in range(sorteio.randint(1, 5))]
+        uniao = sorted(valor for lista in listas for valor in lista)
+        for fracao in (0, 0.1, 0.5, 0.9, 0.99, 1):
+            assert percentil_de_listas(listas, fracao) == percentil(uniao, fracao)
+
+
+def test_estatisticas_incluem_meses_arquivados(tmp_path):
+    livro = abrir_particoes(tmp_path)
+    livro.registrar_operacao({"op": "lote", "transacoes": transacoes_por_mes()})
+    livro.salvar()
+    livro.encerrar()
+    livro = abrir_particoes(tmp_path)
+    assert livro.meses_arquivados()
+
+    resultado = RelatorioEstatistico(livro.instantaneo()).processar()
+    assert resultado["transacoes"] == 8
+    assert resultado["anos"][0]["receitas"] == 100000 and resultado["anos"][0]["saldo"] == 87500
+    assert [mes["gastos"] for mes in resultado["meses"]] == [1250, 2500, 3750, 5000]
+    assert [mes["variacao"] for mes in resultado["meses"]] == [None, 1250, 1250, 1250]
+    mercado, = resultado["categorias"]
+    assert (mercado["categoria"], mercado["total"], mercado["mediana"]) == ("mercado", 12500, 3125)
+    # Nada foi trazido para a memória
+    assert len(livro.historico) == 2
+
+
+def test_estatisticas_na_thread_e_cancelamento(tmp_path):
+    livro = abrir(tmp_path)
+    operacoes_aleatorias(random.Random(5), livro, 3000)
+    esperado = RelatorioEstatistico(livro.instantaneo()).processar()
+
+    resultados, concluido = [], threading.Event()
+
+    def ao_concluir(resultado):
+        resultados.append(resultado)
+        concluido.set()
+
+    RelatorioEstatistico(livro.instantaneo(), ao_concluir).iniciar()
+    assert concluido.wait(10) and resultados == [esperado]
+
+    cancelado = RelatorioEstatistico(livro.instantaneo(), ao_concluir)
+    cancelado.cancelar()
+    cancelado._executar()
+    assert len(resultados) == 1
+
+    RelatorioEstatistico({"loja": None}, ao_concluir)._executar()
+    assert "erro" in resultados[-1]
+
+
+# Orçamentos
+
+def test_orcamento_normaliza_a_categoria(tmp_path):
+    livro = abrir(tmp_path)
+    livro.definir_regras([{"categoria": "Alimentação", "palavras": ["padaria"]}])
+    livro.definir_orcamento("Mercado", 100)
+    livro.definir_orcamento(" mercado", 200)
+    livro.definir_orcamento("alimentação", 50)
+    assert livro.orcamentos == {"mercado": 20000, "Alimentação": 5000}
+    assert livro.config["orcamentos"] == {"mercado": 200, "Alimentação": 50}
+    livro.definir_orcamento("MERCADO", None)
+    assert livro.orcamentos == {"Alimentação": 5000}
+    with pytest.raises(ValueError):
+        livro.definir_orcamento("  ", 10)
+
+
+def test_alerta_de_orcamento_so_no_maior_limiar_cruzado(tmp_path):
+    livro = abrir(tmp_path)
+    alertas = []
+    livro.ao_alertar_orcamento = lambda *alerta: alertas.append(alerta[:3])
+    livro.definir_orcamento("Mercado", 100)
+
+    livro.registrar_operacao({"op": "add", "transacao": transacao(1, -50.0)})
+    assert alertas == []
+    livro.registrar_operacao({"op": "add", "transacao": transacao(2, -35.0)})
+    assert alertas == [("2024-03", "mercado", 0.8)]
+    livro.registrar_operacao({"op": "add", "transacao": transacao(3, -10.0)})
+    # Uma edição que baixa o total não avisa de novo
+    livro.registrar_operacao({"op": "edit", "id": 3, "campos": {"valor": -1.0}})
+    assert len(alertas) == 1
+    livro.registrar_operacao({"op": "edit", "id": 3, "campos": {"valor": -20.0}})
+    assert alertas[1:] == [("2024-03", "mercado", 1.0)]
+    # De 0 a 120% de uma vez: só o aviso de estouro
+    livro.registrar_operacao({"op": "add", "transacao": transacao(
+        4, -120.0, data="10/04/2024 12:00")})
+    assert alertas[2:] == [("2024-04", "mercado", 1.0)]
+
+
+# Transações recorrentes
+
+def datas(minutos):
+    return [data_de_minutos(m) for m in minutos]
+
+
+def test_recorrencia_mensal_usa_o_ultimo_dia_do_mes():
+    aluguel = Recorrencia(1, "Aluguel", -150000, inicio=minutos_de_data("31/01/2024 08:00"))
+    assert datas(aluguel.ocorrencias(None, minutos_de_data("30/04/2024 08:00"))) == [
+        "31/01/2024 08:00", "29/02/2024 08:00", "31/03/2024 08:00", "30/04/2024 08:00"]
+    # Depois de fevereiro a série volta ao dia 31, não fica no 29
+    assert datas([aluguel.ocorrencia(12)]) == ["31/01/2025 08:00"]
+    assert aluguel.ultima_ate(minutos_de_data("30/04/2024 07:59")) == 2
+    bimestral = Recorrencia(2, "Água", -8000, intervalo=2,
+                            inicio=minutos_de_data("31/12/2023 08:00"))
+    assert datas(bimestral.ocorrencias(None, minutos_de_data("30/06/2024 08:00"))) == [
+        "31/12/2023 08:00", "29/02/2024 08:00", "30/04/2024 08:00", "30/06/2024 08:00"]
+
+
+def test_recorrencia_semanal_dias_e_fim():
+    inicio = minutos_de_data("01/03/2024 09:00")
+    semanal = Recorrencia(1, "Feira", -5000, "semanal", 2, inicio,
+                          fim=minutos_de_data("29/03/2024 09:00"))
+    assert datas(semanal.ocorrencias(None, minutos_de_data("31/12/2024 00:00"))) == [
+        "01/03/2024 09:00", "15/03/2024 09:00", "29/03/2024 09:00"]
+    assert semanal.proxima(minutos_de_data("29/03/2024 09:00")) is None
+    a_cada_3_dias = Recorrencia(2, "Remédio", -1000, "dias", 3, inicio)
+    assert datas(a_cada_3_dias.ocorrencias(inicio, minutos_de_data("10/03/2024 09:00"))) == [
+        "04/03/2024 09:00", "07/03/2024 09:00", "10/03/2024 09:00"]
+    assert a_cada_3_dias.quantidade(None, minutos_de_data("10/03/2024 08:59")) == 3
+    with pytest.raises(ValueError):
+        Recorrencia(3, "Feira", -5000, "semanal", 1, inicio, fim=inicio - 1)
+
+
+def test_saldo_previsto_conta_as_ocorrencias_nao_lancadas(tmp_path):
+    livro = abrir(tmp_path)
+    livro.registrar_operacao({"op": "add", "transacao": transacao(1, 1000.0, "Salário")})
+    livro.adicionar_recorrencia("Aluguel", -30000, inicio=minutos_de_data("31/01/2024 08:00"))
+    livro.adicionar_recorrencia("Academia", -2500, "semanal",
+                                inicio=minutos_de_data("01/03/2024 07:00"))
+    assert livro.lancar_recorrencias(agora=minutos_de_data("15/03/2024 12:00")) == 5
+    assert livro.saldo == 100000 - 2 * 30000 - 3 * 2500
+    # Até o fim de abril: aluguel em 31/03 e 30/04, academia de 22/03 a 26/04
+    assert livro.saldo_previsto(minutos_de_data("30/04/2024 23:59")) == (
+        livro.saldo - 2 * 30000 - 6 * 2500)
+
+
+def test_recorrencias_nao_relancam_ocorrencias_arquivadas(tmp_path):
+    livro = abrir_particoes(tmp_path)
+    livro.registrar_operacao({"op": "lote", "transacoes": transacoes_por_mes()})
+    livro.salvar()
+    livro.encerrar()
+
+    livro = abrir_particoes(tmp_path)
+    assert "2024-02" in livro.meses_arquivados()
+    # A ocorrência de janeiro já está no mês arquivado (o lote foi gravado,
+    # mas a config não chegou a marcá-la como lançada); a de fevereiro não
+    recorrencia = livro.adicionar_recorrencia("Salário", 10000,
+                                              inicio=minutos_de_data("05/01/2024 10:00"))
+    assert livro.lancar_recorrencias(agora=minutos_de_data("10/02/2024 00:00")) == 1
+    assert recorrencia.ate == minutos_de_data("05/02/2024 10:00")
+    assert livro.quantidade == 9
+    assert "2024-01" in livro.meses_arquivados()
+    lancadas = livro.datas_lancadas("Salário", 10000)
+    assert datas(sorted(lancadas)) == ["05/01/2024 10:00", "05/02/2024 10:00"]
+
+
+# Importação de extratos
+
+EXTRATO_COM_REPETIDAS = (
+    "Data;Descrição;Valor\n"
+    "10/03/2024;Padaria;-5,00\n"
+    "10/03/2024;Padaria;-5,00\n"
+    "11/03/2024;Mercado;-42,90\n"
+)
+
+
+def importar(livro, arquivo):
+    novas, resumo = ImportadorExtrato(str(arquivo), livro.historico).processar()
+    if novas:
+        livro.registrar_operacao({"op": "lote", "transacoes": [
+            livro.nova_transacao(centavos, descricao, minutos)
+            for centavos, minutos, descricao in novas]})
+    return novas, resumo
+
+
+def test_extrato_mantem_compras_iguais_no_mesmo_dia(tmp_path):
+    arquivo = tmp_path / "extrato.csv"
+    arquivo.write_text(EXTRATO_COM_REPETIDAS, encoding="utf-8")
+    livro = abrir(tmp_path)
+
+    novas, resumo = importar(livro, arquivo)
+    assert [(centavos, data_de_minutos(minutos), descricao)
+            for centavos, minutos, descricao in novas] == [
+        (-500, "10/03/2024 00:00", "Padaria"),
+        (-500, "10/03/2024 00:00", "Padaria"),
+        (-4290, "11/03/2024 00:00", "Mercado"),
+    ]
+    assert resumo == {"lidas": 3, "duplicadas": 0, "invalidas": 0}
+
+    # O mesmo extrato de novo: as duas compras já estão no histórico
+    novas, resumo = importar(livro, arquivo)
+    assert novas == [] and resumo["duplicadas"] == 3
+    assert len(livro.historico) == 3
+
+
+def test_extrato_completa_o_que_falta(tmp_path):
+    arquivo = tmp_path / "extrato.csv"
+    arquivo.write_text(EXTRATO_COM_REPETIDAS, encoding="utf-8")
+    livro = abrir(tmp_path)
+    # Uma das duas compras iguais já foi lançada à mão (descrição com outra grafia)
+    livro.registrar_operacao({"op": "add", "transacao": transacao(1, -5.0, "PADARIA ",
+                                                                  "10/03/2024 00:00")})
+
+    novas, resumo = importar(livro, arquivo)
+    assert sorted(descricao for centavos, minutos, descricao in novas) == ["Mercado", "Padaria"]
+    assert resumo["duplicadas"] == 1
+
+
+# Exportação
+
+def sem_ids(livro):
+    return sorted((t["centavos"], t["data"], t["descricao"]) for t in livro.historico)
+
+
+def test_exportacao_csv_reimportada_da_o_mesmo_historico(tmp_path):
+    livro = abrir_particoes(tmp_path)
+    livro.registrar_operacao({"op": "lote", "transacoes": transacoes_por_mes() + [
+        transacao(90, -3.33, 'Loja "A"; filial 2', "29/02/2024 23:59"),
+        transacao(91, 1234.56, "Reembolso, parcial", "01/04/2024 00:00")]})
+    livro.salvar()
+    livro.encerrar()
+    livro = abrir_particoes(tmp_path)
+    assert livro.meses_arquivados()
+
+    saida = tmp_path / "saida" / "historico.csv"
+    saida.parent.mkdir()
+    assert livro.exportar(str(saida)) == 10
+    analise = (tmp_path / "saida" / "historico.analise.csv").read_text(encoding="utf-8")
+    assert analise.splitlines()[:2] == ["mes;categoria;quantidade;total", "2024-01;mercado;1;12.50"]
+
+    copia = abrir(tmp_path / "saida", "copia")
+    novas, resumo = importar(copia, saida)
+    assert resumo["invalidas"] == 0 and len(novas) == 10
+    livro.carregar_tudo()
+    assert sem_ids(copia) == sem_ids(livro) and copia.saldo == livro.saldo
+
+
+def test_extrato_csv_com_aspas_dobradas(tmp_path):
+    arquivo = tmp_path / "extrato.csv"
+    arquivo.write_text('data;descricao;valor\n'
+                       '01/02/2024 10:00;"A; b ""x""";-1.50\n'
+                       '02/02/2024 10:00;Sal;3.00\n', encoding="utf-8")
+    novas, resumo = ImportadorExtrato(str(arquivo), LojaTransacoes()).processar()
+    assert [(centavos, data_de_minutos(minutos), descricao)
+            for centavos, minutos, descricao in novas] == [
+        (-150, "01/02/2024 10:00", 'A; b "x"'), (300, "02/02/2024 10:00", "Sal")]
+
+
+@pytest.mark.parametrize("formato", ["json", "jsonl"])
+def test_exportacao_json_traz_os_registros_do_historico(tmp_path, formato):
+    livro = abrir(tmp_path)
+    livro.registrar_operacao({"op": "lote", "transacoes": transacoes_por_mes()})
+    livro.registrar_operacao({"op": "edit", "id": 11, "campos": {
+        "valor": 99.99, "data_edicao": "01/05/2024 10:00"}})
+    saida = tmp_path / f"historico.{formato}"
+    livro.exportar(str(saida), formato)
+    texto = saida.read_text(encoding="utf-8")
+    registros = (json.loads(texto) if formato == "json"
+                 else [json.loads(linha) for linha in texto.splitlines()])
+    assert registros == list(livro.historico.como_dicts())
+    assert registros[0]["data_edicao"] == "01/05/2024 10:00"
+
+
+def test_exportacao_cancelada_nao_deixa_arquivos(tmp_path):
+    livro = abrir(tmp_path)
+    livro.registrar_operacao({"op": "lote", "transacoes": transacoes_por_mes()})
+    saida = tmp_path / "saida" / "historico.csv"
+    saida.parent.mkdir()
+    exportacao = livro.exportacao(str(saida))
+    exportacao.cancelar()
+    exportacao._executar()
+    assert list(saida.parent.iterdir()) == []
+
+
+# Sincronização
+
+def test_mescla_converge_e_repetir_nao_muda_nada(tmp_path):
+    iniciais = [transacao(k, -float(k), f"Loja {k}", f"{k:02d}/0{k % 3 + 1}/2024 10:00")
+                for k in range(1, 10)]
+    a, b = abrir(tmp_path, "a"), abrir(tmp_path, "b")
+    for livro in (a, b):
+        livro.registrar_operacao({"op": "lote", "transacoes": [dict(t) for t in iniciais]})
+    assert a.hashes_mensais() == b.hashes_mensais()
+
+    a.registrar_operacao({"op": "edit", "id": 2, "campos": {
+        "valor": -99.0, "descricao": "Editada em A", "data_edicao": "01/05/2024 10:00"}})
+    a.registrar_operacao({"op": "add", "transacao": transacao(50, 10.0, "Nova A")})
+    b.registrar_operacao({"op": "del", "id": 5})
+    assert a.hashes_mensais() != b.hashes_mensais()
+
+    for _ in range(3):
+        a.mesclar(b)
+        b.mesclar(a)
+        if a.hashes_mensais() == b.hashes_mensais():
+            break
+    assert a.hashes_mensais() == b.hashes_mensais()
+    assert estado(a) == estado(b)
+    assert a.obter(2)["descricao"] == "Editada em A" and b.obter(2)["valor"] == -99.0
+    assert a.obter(5) is None and b.obter(5) is None and b.obter(50) is not None
+
+    # Mesclar de novo, nos dois sentidos, não altera nada
+    vazio = {"meses": 0, "adicionadas": 0, "editadas": 0, "excluidas": 0}
+    assert a.mesclar(b) == vazio and b.mesclar(a) == vazio
+
+    # A convergência sobrevive à recarga (lápides e hashes vão para o disco)
+    hashes = a.hashes_mensais()
+    a.encerrar()
+    b.encerrar()
+    assert abrir(tmp_path, "a").hashes_mensais() == hashes
+    assert abrir(tmp_path, "b").mesclar(abrir(tmp_path, "a")) == vazio